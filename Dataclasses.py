@@ -1,3 +1,7 @@
+from array import array
+from itertools import compress
+from operator import mul
+
 class CraftingClass(object):
   def __init__(self, name, abr, class_id, icon):
     self.name = name
@@ -41,7 +45,27 @@ class Recipe(object):
             "ingredient_names": self.ingredient_names, 
                      "amounts": self.amounts}
 
+class MarketSnapshot(object):
+  def __init__(self, name, item_id, price, server, listings, velocity):
+    self.name = name
+    self.item_id = item_id
+    self.price = price       # outlier-filtered average of the cheapest listings
+    self.server = server     # world with the cheapest listing
+    self.listings = listings # number of listings on the market board
+    self.velocity = velocity # regular sales per day
+    return
+
+  def __repr__(self):
+    return f"<MarketSnapshot({self.name}: {self.price:,} gil, {self.velocity}/day)>"
+
 class SaleStats(object):
+  # Sale history kept as parallel arrays (price, quantity, hq, timestamp)
+  # rather than a list of Universalis dicts, so merging and filtering
+  # thousands of sales stays cheap.
+  __slots__ = ("name", "item_id", "server", "n_days",
+               "nq_sales_gil", "hq_sales_gil", "nq_sales_quantity", "hq_sales_quantity",
+               "prices", "quantities", "hqs", "timestamps")
+
   def __init__(self, name, item_id, server, n_days):
     self.name = name
     self.item_id = item_id
@@ -51,8 +75,17 @@ class SaleStats(object):
     self.hq_sales_gil = 0
     self.nq_sales_quantity = 0
     self.hq_sales_quantity = 0
-    self.entries = []
+    self.prices = array("q")
+    self.quantities = array("q")
+    self.hqs = array("b")
+    self.timestamps = array("q")
     return
+
+  @classmethod
+  def from_entries(cls, name, item_id, server, n_days, entries):
+    stats = cls(name, item_id, server, n_days)
+    stats.extend(entries)
+    return stats
   
   def __str__(self):
     return f"""Sale Stats for <{self.name}> over the last {self.n_days} days on {self.server}:
@@ -68,22 +101,53 @@ class SaleStats(object):
   def __repr__(self):
     return f"<SaleStats({self.name})>"
 
+  def __len__(self):
+    return len(self.prices)
+
+  def copy(self):
+    answer = SaleStats(self.name, self.item_id, self.server, self.n_days)
+    return answer.merge(self)
+
+  def merge(self, other):
+    # In place; sum() over many stats is quadratic, use SaleStats.combine
+    self.nq_sales_gil += other.nq_sales_gil
+    self.hq_sales_gil += other.hq_sales_gil
+    self.nq_sales_quantity += other.nq_sales_quantity
+    self.hq_sales_quantity += other.hq_sales_quantity
+    self.prices.extend(other.prices)
+    self.quantities.extend(other.quantities)
+    self.hqs.extend(other.hqs)
+    self.timestamps.extend(other.timestamps)
+    return self
+
+  @classmethod
+  def combine(cls, stats_list):
+    stats_list = list(stats_list)
+    first = stats_list[0]
+    answer = cls(first.name, first.item_id, first.server, first.n_days)
+    for stats in stats_list:
+      answer.merge(stats)
+    return answer
+
   def __add__(self, other):
     if other == 0:
       return self
-    answer = SaleStats(self.name, self.item_id, self.server, self.n_days)
-    answer.nq_sales_gil = self.nq_sales_gil + other.nq_sales_gil
-    answer.hq_sales_gil = self.hq_sales_gil + other.hq_sales_gil
-    answer.nq_sales_quantity = self.nq_sales_quantity + other.nq_sales_quantity
-    answer.hq_sales_quantity = self.hq_sales_quantity + other.hq_sales_quantity
-    answer.entries = [*self.entries, *other.entries]
-    return answer
+    return self.copy().merge(other)
 
   def __radd__(self, other):
     if other == 0:
       return self
     return self.__add__(other)
 
+  def __iadd__(self, other):
+    if other == 0:
+      return self
+    return self.merge(other)
+
+  @property
+  def entries(self):
+    return [{"pricePerUnit": p, "quantity": q, "hq": bool(h), "timestamp": t}
+            for p, q, h, t in zip(self.prices, self.quantities, self.hqs, self.timestamps)]
 
   @property
   def nq_average(self):
@@ -98,38 +162,48 @@ class SaleStats(object):
     return round(self.hq_sales_gil / self.hq_sales_quantity)
 
   def update(self, entry):
-    if entry["hq"]:
-      self.hq_sales_quantity += entry["quantity"]
-      self.hq_sales_gil += entry["quantity"]*entry["pricePerUnit"]
-    elif not entry["hq"]:
-      self.nq_sales_quantity += entry["quantity"]
-      self.nq_sales_gil += entry["quantity"]*entry["pricePerUnit"]
-    self.entries.append(entry)
+    self.extend((entry,))
+    return
+
+  def extend(self, entries):
+    start = len(self.prices)
+    for entry in entries:
+      self.prices.append(entry["pricePerUnit"])
+      self.quantities.append(entry["quantity"])
+      self.hqs.append(1 if entry["hq"] else 0)
+      self.timestamps.append(entry.get("timestamp", 0))
+    self._add_totals(start, len(self.prices))
+    return
+
+  def _add_totals(self, start, stop):
+    prices, quantities, hqs = self.prices[start:stop], self.quantities[start:stop], self.hqs[start:stop]
+    gil = list(map(mul, prices, quantities))
+    hq_gil = sum(compress(gil, hqs))
+    hq_quantity = sum(compress(quantities, hqs))
+    self.hq_sales_gil += hq_gil
+    self.hq_sales_quantity += hq_quantity
+    self.nq_sales_gil += sum(gil) - hq_gil
+    self.nq_sales_quantity += sum(quantities) - hq_quantity
     return
 
   def remove_outliers(self, threshold=3):
-    ixs_to_remove = []
-    for n, entry in enumerate(self.entries):
-      # Get average if this entry was removed
-      average_entry_price = entry["pricePerUnit"]
-      if entry["hq"]:
-        temp_sales_quantity = self.hq_sales_quantity - entry["quantity"]
-        temp_sales_gil = self.hq_sales_gil - entry["quantity"]*entry["pricePerUnit"]
-        new_average = round(temp_sales_gil / temp_sales_quantity) # without the entry
-        if average_entry_price > threshold*new_average:
-          ixs_to_remove.append(n)
-          self.hq_sales_quantity = temp_sales_quantity
-          self.hq_sales_gil = temp_sales_gil
-      if not entry["hq"]:
-        temp_sales_quantity = self.nq_sales_quantity - entry["quantity"]
-        temp_sales_gil = self.nq_sales_gil - entry["quantity"]*entry["pricePerUnit"]
-        new_average = round(temp_sales_gil / temp_sales_quantity) # without the entry
-        if average_entry_price > threshold*new_average:
-          ixs_to_remove.append(n)
-          self.nq_sales_quantity = temp_sales_quantity
-          self.nq_sales_gil = temp_sales_gil
-    for ix in ixs_to_remove[::-1]:
-      # print("Removing", self.entries[ix])
-      self.entries.pop(ix)
-    
-    
\ No newline at end of file
+    # One pass: a sale is dropped when its price is more than threshold times
+    # the average of the (remaining) sales of the same quality without it.
+    gil = [self.nq_sales_gil, self.hq_sales_gil]
+    quantity = [self.nq_sales_quantity, self.hq_sales_quantity]
+    keep = bytearray(len(self.prices))
+    for n, (price, amount, hq) in enumerate(zip(self.prices, self.quantities, self.hqs)):
+      temp_sales_quantity = quantity[hq] - amount
+      temp_sales_gil = gil[hq] - amount*price
+      if temp_sales_quantity > 0 and price > threshold*round(temp_sales_gil / temp_sales_quantity):
+        quantity[hq] = temp_sales_quantity
+        gil[hq] = temp_sales_gil
+      else:
+        keep[n] = 1
+    self.nq_sales_gil, self.hq_sales_gil = gil
+    self.nq_sales_quantity, self.hq_sales_quantity = quantity
+    self.prices = array("q", compress(self.prices, keep))
+    self.quantities = array("q", compress(self.quantities, keep))
+    self.hqs = array("b", compress(self.hqs, keep))
+    self.timestamps = array("q", compress(self.timestamps, keep))
+    return
@@ -0,0 +1,239 @@
+import asyncio
+from itertools import chain
+import time
+
+from global_paths import *
+import xiv_cache as xivc
+import xiv_equipment as xive
+import xiv_http as xivh
+import xiv_tools as xivt
+import xiv_web_tools as xivwt
+
+# Async mirror of xiv_web_tools for use inside the discord event loop. URL
+# building, response parsing and table formatting are shared with the sync
+# module; only the network waits differ.
+
+async def close():
+  await xivh.close()
+
+async def text_from_url(url):
+  entry = xivc.disk_entry(url)
+  if entry is not None and entry.fresh:
+    return entry.body
+  response = await xivh.async_get(url, headers=entry.conditional_headers() if entry else None)
+  return xivwt._text_from_response(url, response, entry)
+
+async def _fetch_and_cache(url):
+  text = await text_from_url(url)
+  if text:
+    xivc.RESPONSES.set(url, text, xivc.ttl_for_url(url), len(text))
+  return text
+
+async def data_from_url(url):
+  text = xivc.RESPONSES.get(url)
+  if text is None:
+    text = await xivc.ASYNC_FETCHES.do(url, _fetch_and_cache, url)
+  if text:
+    return xivwt.data_from_text(text)
+  return {}
+
+async def data_from_urls(urls, concurrency=xivwt.CHUNK_CONCURRENCY):
+  # Fetches every URL (at most `concurrency` at a time), results in order
+  semaphore = asyncio.Semaphore(max(1, concurrency))
+  async def limited(url):
+    async with semaphore:
+      return await data_from_url(url)
+  datas = await asyncio.gather(*[limited(url) for url in urls])
+  for url, data in zip(urls, datas):
+    if not data:
+      raise ValueError(f"Invalid response from url: {xivc.normalize_url(url)}")
+  return datas
+
+@xivc.ttl_cache(xivc.STATIC_TTL, max_entries=1)
+async def worlds():
+  data = await data_from_url(xivwt.WORLDS_URL)
+  if data:
+    return data
+  raise ValueError(f"Invalid response from {xivwt.WORLDS_URL}")
+
+@xivc.ttl_cache(xivc.STATIC_TTL, max_entries=1)
+async def dcs():
+  data = await data_from_url(xivwt.DCS_URL)
+  if data:
+    return data
+  raise ValueError(f"Invalid response from {xivwt.DCS_URL}")
+
+def regions():
+  return xivwt.regions()
+
+async def get_scope(server):
+  return xivwt._scope_from_lists(server, await worlds(), await dcs())
+
+async def average_price(name_or_names, server, hq="null", listings=10, item_ids=None):
+  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
+  urls, item_ids = xivwt._average_price_urls(names, server, hq, listings, item_ids)
+  output = [[], []] # list of prices, list of cheapest server names
+  for data, item_id_subset in zip(await data_from_urls(urls), item_ids):
+    prices, servers = xivwt._average_price_from_data(data, item_id_subset, server)
+    output[0] += prices
+    output[1] += servers
+  return output
+
+async def lowest_price(name_or_names, server, hq="null", item_ids=None):
+  return await average_price(name_or_names, server, hq, listings=1, item_ids=item_ids)
+
+async def velocity(name_or_names, server):
+  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
+  urls, item_ids = xivwt._velocity_urls(names, server)
+  velocities = []
+  for data, item_id_subset in zip(await data_from_urls(urls), item_ids):
+    velocities += xivwt._velocity_from_data(data, item_id_subset)
+  return velocities
+
+async def market_snapshot(name_or_names, server, hq="null", listings=1, item_ids=None):
+  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
+  urls, item_ids = xivwt._average_price_urls(names, server, hq, listings, item_ids)
+  names = xivt.split_every(names, 99)
+  output = []
+  for data, names_subset, item_id_subset in zip(await data_from_urls(urls), names, item_ids):
+    output += xivwt._market_snapshots_from_data(data, names_subset, item_id_subset, server)
+  return output
+
+async def price_to_craft_collectible(name_or_names, server, listings=10):
+  recipes, ingredient_names = xivwt._collectible_ingredient_names(name_or_names)
+  ingredient_prices, _ = await average_price(ingredient_names, server, listings=listings)
+  return xivwt._recipe_costs(recipes, ingredient_names, ingredient_prices)
+
+async def best_collectible_to_craft(currency, server, n_results="all", verbose=True):
+  batch_start = time.time()
+  names, levels, rewards = xivwt._collectible_tiers(currency)
+  gil_to_craft = await price_to_craft_collectible(names, server)
+  return xivwt._collectible_table(currency, server, names, levels, rewards, gil_to_craft, batch_start, n_results, verbose)
+
+async def best_combat_ventures(server, n_results="all", v_cutoff=25, verbose=True):
+  batch_start = time.time()
+  names, durations, amounts, levels = xivwt._combat_ventures()
+  num_items = len(names)
+  snapshots = await market_snapshot(names, server, hq=0)
+  names, durations, amounts, levels, velocities, prices \
+    = xivwt._filter_by_velocity(snapshots, v_cutoff, [names, durations, amounts, levels])
+  return xivwt._ventures_table(server, names, durations, amounts, levels, velocities, prices, num_items, batch_start, n_results, verbose)
+
+async def best_scrip_reward(server, currency, n_results="all", v_cutoff=10, verbose=True):
+  batch_start = time.time()
+  names, quantities, costs, currencies = xivwt._scrip_rewards(currency)
+  num_items = len(names)
+  snapshots = await market_snapshot(names, server)
+  names, quantities, costs, currencies, velocities, prices \
+    = xivwt._filter_by_velocity(snapshots, v_cutoff, [names, quantities, costs, currencies])
+  return xivwt._scrip_table(server, currency, names, quantities, costs, velocities, prices, num_items, batch_start, n_results, verbose)
+
+async def best_equip_for_slot(slot, ilvl, job, ornate=False):
+  catalogue = xive.catalogue()
+  if catalogue is not None:
+    data = catalogue.search(slot, ilvl, job, limit=xivwt._equip_limit(slot))
+  else:
+    data = await data_from_url(xivwt._equip_search_url(slot, ilvl, job))
+  return xivwt._equip_from_data(data, slot, ornate)
+
+async def best_server_gearset_items(ilvl, job, server, hq="true", verbose=True):
+  batch_start = time.time()
+  slot_names = list(xivwt.GEARSET_SLOT_NAMES)
+  equip_names = await asyncio.gather(*[best_equip_for_slot(slot, ilvl, job) for slot in slot_names],
+                                     best_equip_for_slot("Body", ilvl, job, ornate=True))
+  ornate_body = equip_names.pop()
+  if ornate_body:
+    equip_names.append(ornate_body)
+  best_prices, best_servers = await lowest_price(equip_names, server, hq=hq)
+  return xivwt._gearset_table(ilvl, job, server, slot_names, equip_names, ornate_body, best_prices, best_servers, batch_start, verbose)
+
+async def iter_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, hq="true"):
+  # Yields (position, rows) as each job's gear gets priced. Joining the groups
+  # in position order gives the rows of best_server_full_crafter_gatherer_set.
+  job_list, generic_jobs = xivwt._crafter_gatherer_jobs(crafter_or_gatherer)
+  async def hands_group(position, job):
+    names = await asyncio.gather(best_equip_for_slot("MainHand", ilvl, job), best_equip_for_slot("OffHand", ilvl, job))
+    prices, servers = await lowest_price(names, server, hq)
+    return position, [[f"{job} {slot}", name, price, best_server] for slot, name, price, best_server
+                      in zip(["MainHand", "OffHand"], names, prices, servers)]
+  async def generic_group(position, job):
+    gear, _ = await best_server_gearset_items(ilvl, job, server, hq, verbose=False)
+    if position == len(job_list): # The first job's tools are already in its hands group
+      gear = gear[2:]
+    return position, gear
+  groups = [hands_group(ix, job) for ix, job in enumerate(job_list)] \
+         + [generic_group(len(job_list)+ix, job) for ix, job in enumerate(generic_jobs)]
+  for next_group in asyncio.as_completed(groups):
+    yield await next_group
+
+async def best_server_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, hq="true", sort_by_server=False, verbose=True):
+  job_list, _ = xivwt._crafter_gatherer_jobs(crafter_or_gatherer)
+  if not job_list:
+    return {}
+  batch_start = time.time()
+  groups = dict([group async for group in iter_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, hq)])
+  hands = [groups[ix] for ix in range(len(job_list))]
+  generic_gear = list(chain.from_iterable(groups[ix] for ix in range(len(job_list), len(groups))))
+  mainhands = [main[1] for main, _ in hands]
+  offhands = [off[1] for _, off in hands]
+  allhands_prices = xivt.weave_lists([main[2] for main, _ in hands], [off[2] for _, off in hands])
+  allhands_servers = xivt.weave_lists([main[3] for main, _ in hands], [off[3] for _, off in hands])
+  return xivwt._crafter_gatherer_table(ilvl, server, crafter_or_gatherer, job_list, mainhands, offhands, generic_gear, allhands_prices, allhands_servers, sort_by_server, batch_start, verbose)
+
+async def _bri_ilvl_search(min_ilvl):
+  data = await data_from_url(xivwt._bri_ilvl_search_url(min_ilvl))
+  results = data["Results"]
+  return xivt.dict_slicer(results, ["Name", "ID"])
+
+async def _iter_bri(names, item_ids, home_world, dc_or_region):
+  # Yields (position, rows) per Universalis-sized chunk of items, so callers
+  # can show the best deals found so far
+  async def chunk(position, names, item_ids):
+    (home_price, _), (foreign_price, best_server) = await asyncio.gather(
+      lowest_price(names, home_world, item_ids=item_ids),
+      lowest_price(names, dc_or_region, item_ids=item_ids))
+    return position, xivwt._bri_collection(names, home_price, foreign_price, best_server, "all")
+  chunks = zip(xivt.split_every(names, 99), xivt.split_every(item_ids, 99))
+  for next_chunk in asyncio.as_completed([chunk(ix, n, i) for ix, (n, i) in enumerate(chunks)]):
+    yield await next_chunk
+
+async def iter_bri_ilvl(home_world, dc_or_region, min_ilvl=560):
+  item_names_ilvl, item_ids_ilvl = await _bri_ilvl_search(min_ilvl)
+  async for group in _iter_bri(item_names_ilvl, item_ids_ilvl, home_world, dc_or_region):
+    yield group
+
+async def iter_bri_materia(home_world, dc_or_region):
+  item_names_materia, item_ids_materia = xivwt._bri_materia_search()
+  async for group in _iter_bri(item_names_materia, item_ids_materia, home_world, dc_or_region):
+    yield group
+
+def bri_merge(groups, n_results="all"):
+  # Best deals across every (position, rows) group received so far
+  collection = list(chain.from_iterable(groups[ix] for ix in sorted(groups)))
+  return xivwt._bri_top(collection, n_results)
+
+async def _bri_helper(names, item_ids, home_world, dc_or_region, n_results="all"):
+  groups = dict([group async for group in _iter_bri(names, item_ids, home_world, dc_or_region)])
+  return bri_merge(groups, n_results)
+
+async def _bri_ilvl(home_world, dc_or_region, min_ilvl=560, n_results="all", verbose=True):
+  batch_start = time.time()
+  groups = dict([group async for group in iter_bri_ilvl(home_world, dc_or_region, min_ilvl)])
+  collection_ilvl = bri_merge(groups, n_results)
+  dt = time.time() - batch_start
+  return xivwt._bri_finisher(collection_ilvl, dt, home_world, verbose)
+
+async def _bri_materia(home_world, dc_or_region, n_results="all", verbose=True):
+  batch_start = time.time()
+  groups = dict([group async for group in iter_bri_materia(home_world, dc_or_region)])
+  collection_materia = bri_merge(groups, n_results)
+  dt = time.time() - batch_start
+  return xivwt._bri_finisher(collection_materia, dt, home_world, verbose)
+
+async def best_reselling_items(home_world, dc_or_region, min_ilvl=560, n_results="all", verbose=True):
+  results = await asyncio.gather(_bri_ilvl(home_world, dc_or_region, min_ilvl, n_results, False),
+                                 _bri_materia(home_world, dc_or_region, n_results, False))
+  if verbose:
+    for _, table_str in results:
+      print(table_str)
+  return list(results)
@@ -0,0 +1,512 @@
+import argparse
+import asyncio
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import os.path as op
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qsl, urlsplit
+
+import termtables as tt
+
+from global_paths import *
+import xiv_cache as xivc
+import xiv_equipment as xive
+import xiv_http as xivh
+import xiv_item_names as xivin
+import xiv_metrics as xivm
+import xiv_tape as xivtp
+import xiv_tools as xivt
+import xiv_web_tools as xivwt
+
+# Offline benchmarks for the xiv_web_tools entry points. Two local HTTP
+# stand-ins (one for Universalis, one for XIVAPI) serve either fixtures
+# recorded from the live APIs (--record, saved to BENCHMARK_FIXTURES_PATH) or
+# deterministic synthetic responses, with optional injected latency, 5xx
+# errors and 429s. Each scenario runs in a fresh worker process pointed at the
+# stand-ins through XIV_UNIVERSALIS_URL/XIV_XIVAPI_URL, so the stand-ins' own
+# CPU time never shows up in the numbers and the real rate limits still apply.
+#
+#   python benchmark.py                         # synthetic data, no faults
+#   python benchmark.py --latency 0.08 --throttle-rate 0.02 --repeat 5
+#   python benchmark.py --record                # needs network + item_ids_to_names.txt
+#   python benchmark.py --tape OfflineData/http_tape.sqlite3
+#   python benchmark.py --tape OfflineData/http_tape.sqlite3 --arrivals --repeat 1
+#   python benchmark.py --json before.json      # raw per-run numbers for comparing
+
+SCENARIOS = ["ventures", "collectibles", "scrips", "gearset", "bri_ilvl"]
+
+def run_scenario(name, args):
+  if name == "ventures":
+    return xivwt.best_combat_ventures(args.world, n_results="all", verbose=False)
+  if name == "collectibles":
+    return xivwt.best_collectible_to_craft("White Crafters' Scrips", args.world, n_results="all", verbose=False)
+  if name == "scrips":
+    return xivwt.best_scrip_reward(args.world, "White Crafters' Scrip", n_results="all", verbose=False)
+  if name == "gearset":
+    return xivwt.best_server_gearset_items(args.ilvl, args.job, args.dc, verbose=False)
+  if name == "bri_ilvl":
+    return xivwt._bri_ilvl(args.world, args.dc, min_ilvl=args.ilvl, verbose=False)
+  raise ValueError(f"Unknown scenario {name}")
+
+def fixture_key(path):
+  # Same normalisation as the response cache, minus the stand-in's host
+  return xivc.normalize_url("http://stand-in" + path)[len("http://stand-in"):]
+
+
+# --- synthetic upstream ---------------------------------------------------
+DATA_CENTERS = {"Aether":  ["Adamantoise", "Cactuar", "Faerie", "Gilgamesh", "Jenova", "Midgardsormr", "Sargatanas", "Siren"],
+                "Crystal": ["Balmung", "Brynhildr", "Coeurl", "Diabolos", "Goblin", "Malboro", "Mateus", "Zalera"],
+                "Primal":  ["Behemoth", "Excalibur", "Exodus", "Famfrit", "Hyperion", "Lamia", "Leviathan", "Ultros"]}
+REGION = "North-America"
+
+class SyntheticData(object):
+  # A made-up but self-consistent world: every item name the scenarios look up
+  # has an id, and every id gets stable listings derived from its number.
+  def __init__(self):
+    self.names = {}
+    names = set()
+    for file_name in [PROCESSED_VENTURE_PATH, PROCESSED_CRAFTER_SCRIP_PATH, PROCESSED_RECIPE_PATH]:
+      for row in xivt.load_table(file_name):
+        names.add(row["name"])
+        names.update(row.get("ingredient_names") or [])
+    for ix, name in enumerate(sorted(names)):
+      self.names[1000+ix] = name
+    # Equipment for every slot/job every 10 ilvls, plus an ornate body piece
+    self.equipment = {} # (slot, job) -> [(ilvl, id, name)] sorted by ilvl
+    item_id = 100000
+    for slot in xive.EQUIP_SLOTS:
+      for job in xive.EQUIP_JOBS:
+        pieces = []
+        for ilvl in range(10, 670, 10):
+          variants = [f"{job} {slot} i{ilvl}"] + ([f"Ornate {job} {slot} i{ilvl}"] if slot == "Body" else [])
+          for name in variants:
+            self.names[item_id] = name
+            pieces.append((ilvl, item_id, name))
+            item_id += 1
+        self.equipment[(slot, job)] = pieces
+    self.by_ilvl = sorted((piece for pieces in self.equipment.values() for piece in pieces), reverse=True)
+    self.worlds = [{"id": 30+ix, "name": world} for ix, world in
+                   enumerate(world for worlds in DATA_CENTERS.values() for world in worlds)]
+    world_ids = {world["name"]: world["id"] for world in self.worlds}
+    self.dcs = [{"name": dc, "region": REGION, "worlds": [world_ids[w] for w in worlds]}
+                for dc, worlds in DATA_CENTERS.items()]
+    return
+
+  def __repr__(self):
+    return f"<SyntheticData({len(self.names)} items)>"
+
+  def item_names_table(self):
+    return {str(item_id): {"en": name} for item_id, name in self.names.items()}
+
+  def _scope(self, server):
+    if server in DATA_CENTERS:
+      return DATA_CENTERS[server]
+    if server == REGION:
+      return [world for worlds in DATA_CENTERS.values() for world in worlds]
+    return [server]
+
+  def _listings(self, item_id, server, count):
+    worlds = self._scope(server)
+    base = random.Random(item_id).randint(50, 50000)
+    rng = random.Random(f"{item_id}:{server}")
+    if rng.random() < 0.05: # some items just aren't on the market
+      return []
+    listings = []
+    for _ in range(rng.randint(1, count)):
+      quantity = rng.randint(1, 99)
+      price = int(base*rng.uniform(0.6, 2.5))
+      listings.append({"pricePerUnit": price, "quantity": quantity, "total": price*quantity,
+                       "hq": rng.random() < 0.4, "worldName": rng.choice(worlds),
+                       "lastReviewTime": 1650000000+rng.randint(0, 10**6)})
+    listings.sort(key=lambda listing: listing["pricePerUnit"])
+    return listings
+
+  def _market_item(self, item_id, server, count, history):
+    rng = random.Random(f"{item_id}:{server}:velocity")
+    velocity = round(rng.expovariate(1/15), 2)
+    data = {"itemID": item_id, "lastUploadTime": 1650000000000,
+            "regularSaleVelocity": velocity, "nqSaleVelocity": velocity*0.6, "hqSaleVelocity": velocity*0.4}
+    listings = self._listings(item_id, server, count)
+    if history:
+      data["entries"] = [{"pricePerUnit": l["pricePerUnit"], "quantity": l["quantity"], "hq": l["hq"],
+                          "worldName": l["worldName"], "timestamp": l["lastReviewTime"]} for l in listings]
+    else:
+      data["listings"] = listings
+      data["listingsCount"] = len(listings)
+    return data
+
+  def universalis(self, path, query):
+    parts = path.strip("/").split("/")
+    if parts == ["worlds"]:
+      return self.worlds
+    if parts == ["data-centers"]:
+      return self.dcs
+    history = parts[0] == "history"
+    server, ids = parts[-2], [int(item_id) for item_id in parts[-1].split(",") if item_id]
+    count = max(1, int(query.get("listings", query.get("entries", 20))))
+    if len(ids) == 1:
+      return self._market_item(ids[0], server, count, history)
+    return {"itemIDs": ids, "items": {str(item_id): self._market_item(item_id, server, count, history) for item_id in ids},
+            "unresolvedItems": []}
+
+  def _result(self, item_id):
+    return {"ID": item_id, "Name": self.names.get(item_id, f"Item {item_id}"), "Icon": f"/i/{item_id}.png",
+            "Url": f"/Item/{item_id}", "UrlType": "Item", "_": "item", "_Score": 1}
+
+  def xivapi(self, path, query):
+    parts = path.strip("/").split("/")
+    if parts[0].lower() == "item":
+      if len(parts) > 1:
+        return {"ID": int(parts[1]), "Name": self.names.get(int(parts[1]), "")}
+      return {"Results": [self._result(int(item_id)) for item_id in query.get("ids", "").split(",") if item_id]}
+    if parts[0] != "search":
+      return None
+    filters = dict(f.replace("<=", "=<").replace(">=", "=>").split("=", 1) for f in query.get("filters", "").split(",") if "=" in f)
+    limit = int(query.get("limit", 100))
+    if "string" in query: # name search
+      needle = query["string"].lower()
+      hits = [item_id for item_id, name in self.names.items() if needle in name.lower()][:limit]
+      return {"Results": [self._result(item_id) for item_id in hits]}
+    slot = next((k.split(".")[1] for k in filters if k.startswith("EquipSlotCategory.")), None)
+    job = next((k.split(".")[1] for k in filters if k.startswith("ClassJobCategory.")), None)
+    at_most = int(filters.get("LevelItem", "=<9999")[2:]) if filters.get("LevelItem", "").startswith("=<") else 9999
+    at_least = int(filters.get("LevelItem", "=>0")[2:]) if filters.get("LevelItem", "").startswith("=>") else 0
+    pieces = self.equipment.get((slot, job), []) if slot and job else self.by_ilvl
+    hits = sorted((piece for piece in pieces if at_least <= piece[0] <= at_most), reverse=True)[:limit]
+    return {"Pagination": {"Page": 1, "PageTotal": 1, "Results": len(hits)},
+            "Results": [self._result(item_id) for _, item_id, _ in hits]}
+
+
+# --- stand-in server ------------------------------------------------------
+class StandIn(object):
+  def __init__(self, name, responder, latency=0, jitter=0, error_rate=0, throttle_rate=0, retry_after=1, seed=0):
+    self.name = name
+    self.responder = responder # path -> (status, body) or None
+    self.latency = latency
+    self.jitter = jitter
+    self.error_rate = error_rate
+    self.throttle_rate = throttle_rate
+    self.retry_after = retry_after
+    self._rng = random.Random(seed)
+    self._lock = threading.Lock()
+    self.reset_stats()
+    handler = type(f"{name}Handler", (_StandInHandler,), {"stand_in": self})
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    self.server.daemon_threads = True
+    threading.Thread(target=self.server.serve_forever, name=f"stand-in-{name}", daemon=True).start()
+    return
+
+  def __repr__(self):
+    return f"<StandIn({self.name}, {self.url})>"
+
+  @property
+  def url(self):
+    return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+  def reset_stats(self):
+    with self._lock:
+      self.stats = {"requests": 0, "throttled": 0, "errors": 0, "unrecorded": 0, "bytes": 0}
+    return
+
+  def _count(self, **counts):
+    with self._lock:
+      for k, v in counts.items():
+        self.stats[k] += v
+    return
+
+  def handle(self, path):
+    with self._lock:
+      roll = self._rng.random()
+      delay = self.latency + self._rng.uniform(0, self.jitter)
+    self._count(requests=1)
+    time.sleep(delay)
+    if roll < self.throttle_rate:
+      self._count(throttled=1)
+      return 429, {"Retry-After": f"{self.retry_after:g}"}, b"Too Many Requests"
+    if roll < self.throttle_rate + self.error_rate:
+      self._count(errors=1)
+      return 503, {}, b"Service Unavailable"
+    response = self.responder(path)
+    if response is None:
+      self._count(unrecorded=1)
+      return 404, {}, json.dumps({"Error": f"No fixture for {fixture_key(path)}"}).encode("utf-8")
+    status, body = response
+    body = body.encode("utf-8")
+    self._count(bytes=len(body))
+    return status, {"Content-Type": "application/json"}, body
+
+class _StandInHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+  stand_in = None
+
+  def do_GET(self):
+    status, headers, body = self.stand_in.handle(self.path)
+    self.send_response(status)
+    for k, v in headers.items():
+      self.send_header(k, v)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+    return
+
+  def log_message(self, *args):
+    return
+
+def synthetic_responder(generate):
+  def respond(path):
+    parts = urlsplit(path)
+    data = generate(parts.path, dict(parse_qsl(parts.query)))
+    return None if data is None else (200, json.dumps(data))
+  return respond
+
+def replay_responder(fixtures):
+  def respond(path):
+    fixture = fixtures.get(fixture_key(path))
+    return None if fixture is None else (fixture["status"], fixture["body"])
+  return respond
+
+def record_responder(upstream, fixtures):
+  # Forwards to the live API (private_key and all) and keeps the answer
+  def respond(path):
+    request = urllib.request.Request(upstream + path, headers={"User-Agent": "FFXIVProfitDiscordBot benchmark recorder"})
+    try:
+      with urllib.request.urlopen(request, timeout=30) as response:
+        status, body = response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as err:
+      status, body = err.code, err.read().decode("utf-8", "replace")
+    if status != 429:
+      fixtures[fixture_key(path)] = {"status": status, "body": body}
+    return status, body
+  return respond
+
+def tape_responder(tape, upstream):
+  # Serves a tape recorded by the bot (XIV_HTTP_MODE=record) at its original latency
+  def respond(path):
+    entry = tape.get(upstream + path)
+    if entry is None:
+      return None
+    time.sleep(entry.elapsed*xivtp.REPLAY_TIMING)
+    return entry.status, entry.text
+  return respond
+
+def _recorded_item_ids(fixtures):
+  # Every id the scenarios resolved ends up in a Universalis URL
+  item_ids = set()
+  for key in fixtures["universalis"]:
+    last = urlsplit(key).path.rstrip("/").rsplit("/", 1)[-1]
+    item_ids.update(item_id for item_id in last.split(",") if item_id.isdigit())
+  return item_ids
+
+def save_fixtures(fixtures, file_name):
+  with open(ITEM_NAMES_AND_IDS, "r", encoding="utf-8") as f:
+    all_names = json.load(f)
+  fixtures["item_names"] = {item_id: all_names[item_id] for item_id in _recorded_item_ids(fixtures) if item_id in all_names}
+  with gzip.open(file_name, "wt", encoding="utf-8") as f:
+    json.dump(fixtures, f)
+  return
+
+def load_fixtures(file_name):
+  with gzip.open(file_name, "rt", encoding="utf-8") as f:
+    return json.load(f)
+
+
+# --- worker ---------------------------------------------------------------
+def worker(args):
+  # Runs in its own process with XIV_*_URL pointing at the stand-ins
+  if args.item_names:
+    xivt.ITEM_NAMES_AND_IDS = args.item_names
+  xive.PROCESSED_EQUIPMENT_PATH = "" # gearset always measures the XIVAPI search path
+  runs = []
+  for _ in range(args.repeat):
+    if args.worker == "arrivals":
+      runs.append(replay_arrivals(args))
+      continue
+    for cache in xivc.CACHES.values():
+      cache.clear()
+    before = xivh.STATS.as_dict()
+    trace = xivm.start_trace(args.worker)
+    wall, cpu = time.perf_counter(), time.process_time()
+    run_scenario(args.worker, args)
+    wall, cpu = time.perf_counter()-wall, time.process_time()-cpu
+    xivm.finish_trace(trace)
+    after = xivh.STATS.as_dict()
+    runs.append(dict({k: after[k]-before[k] for k in after}, wall=wall, cpu=cpu, spans=trace.summary()))
+  print(json.dumps(runs))
+  return
+
+async def _replay_arrivals(arrivals, upstreams):
+  # Issues every request at its recorded offset (scaled like the latency), so
+  # the bursts and overlaps of the original traffic go through the rate
+  # limits and connection pools again. Latency counts from the recorded
+  # arrival, i.e. it includes any queueing on our side.
+  start = time.perf_counter()
+  intervals = []
+  async def issue(offset, url):
+    for upstream, stand_in in upstreams.items():
+      if url.startswith(upstream):
+        url = stand_in + url[len(upstream):]
+    await asyncio.sleep(max(0, start + offset*xivtp.REPLAY_TIMING - time.perf_counter()))
+    arrived = time.perf_counter()
+    await xivh.async_get(url)
+    intervals.append((arrived-start, time.perf_counter()-arrived))
+    return
+  await asyncio.gather(*[issue(offset, url) for offset, url in arrivals])
+  await xivh.close()
+  return intervals
+
+def replay_arrivals(args):
+  arrivals = xivtp.Tape(args.tape).arrivals()
+  upstreams = json.loads(args.upstreams)
+  before = xivh.STATS.as_dict()
+  trace = xivm.start_trace("arrivals")
+  wall, cpu = time.perf_counter(), time.process_time()
+  intervals = asyncio.run(_replay_arrivals(arrivals, upstreams))
+  wall, cpu = time.perf_counter()-wall, time.process_time()-cpu
+  xivm.finish_trace(trace)
+  after = xivh.STATS.as_dict()
+  latencies = sorted(duration for _, duration in intervals)
+  return dict({k: after[k]-before[k] for k in after}, wall=wall, cpu=cpu, spans=trace.summary(),
+              peak_in_flight=xivtp.peak_concurrency(intervals),
+              latency_p50=latencies[len(latencies)//2] if latencies else 0,
+              latency_p95=latencies[min(len(latencies)-1, int(len(latencies)*0.95))] if latencies else 0)
+
+def spawn_worker(scenario, args, stand_ins, item_names):
+  env = dict(os.environ, XIV_UNIVERSALIS_URL=stand_ins["universalis"].url,
+             XIV_XIVAPI_URL=stand_ins["xivapi"].url, XIV_DISK_CACHE="0", XIV_HTTP_MODE="live")
+  command = [sys.executable, op.abspath(__file__), "--worker", scenario, "--repeat", str(args.repeat),
+             "--world", args.world, "--dc", args.dc, "--ilvl", str(args.ilvl), "--job", args.job]
+  if item_names:
+    command += ["--item-names", item_names]
+  if scenario == "arrivals":
+    # The tape holds the real upstream URLs; the worker swaps in the stand-ins
+    command += ["--tape", args.tape, "--upstreams", json.dumps({UNIVERSALIS_URL: stand_ins["universalis"].url,
+                                                                 XIVAPI_URL: stand_ins["xivapi"].url})]
+  result = subprocess.run(command, env=env, cwd=op.dirname(op.abspath(__file__)), capture_output=True, text=True)
+  if result.returncode != 0:
+    raise RuntimeError(f"Scenario {scenario} failed:\n{result.stderr}")
+  return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# --- harness --------------------------------------------------------------
+def _stand_ins(args, tmp_dir):
+  # Returns the stand-ins, the item name table the workers should use and
+  # the dict being recorded into (if recording)
+  faults = dict(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+  item_names = op.join(tmp_dir, "item_ids_to_names.txt")
+  if args.record:
+    if not op.exists(ITEM_NAMES_AND_IDS):
+      raise SystemExit(f"Recording needs {ITEM_NAMES_AND_IDS}; run process_offline_data.py first")
+    recorded = {"universalis": {}, "xivapi": {}}
+    return ({"universalis": StandIn("universalis", record_responder(UNIVERSALIS_URL, recorded["universalis"])),
+             "xivapi": StandIn("xivapi", record_responder(XIVAPI_URL, recorded["xivapi"]))},
+            ITEM_NAMES_AND_IDS, recorded)
+  if args.tape:
+    tape = xivtp.Tape(args.tape)
+    return ({"universalis": StandIn("universalis", tape_responder(tape, UNIVERSALIS_URL), **faults),
+             "xivapi": StandIn("xivapi", tape_responder(tape, XIVAPI_URL), **faults)},
+            ITEM_NAMES_AND_IDS, None)
+  if not args.synthetic and op.exists(args.fixtures):
+    fixtures = load_fixtures(args.fixtures)
+    names = fixtures["item_names"]
+    stand_ins = {"universalis": StandIn("universalis", replay_responder(fixtures["universalis"]), **faults),
+                 "xivapi": StandIn("xivapi", replay_responder(fixtures["xivapi"]), **faults)}
+  else:
+    synthetic = SyntheticData()
+    names = synthetic.item_names_table()
+    stand_ins = {"universalis": StandIn("universalis", synthetic_responder(synthetic.universalis), **faults),
+                 "xivapi": StandIn("xivapi", synthetic_responder(synthetic.xivapi), **faults)}
+  with open(item_names, "w", encoding="utf-8") as f:
+    json.dump(names, f)
+  xivin.build(item_names) # so the first scenario doesn't pay for it
+  return stand_ins, item_names, None
+
+def _median(values):
+  return statistics.median(values) if values else 0
+
+def report(results):
+  headers = ["Scenario", "Runs", "Wall (med)", "Wall (min)", "CPU (med)", "Requests/run",
+             "Retries/run", "429s", "5xx", "Unrecorded", "KB/run"]
+  table = []
+  for scenario, (runs, served) in results.items():
+    n = len(runs)
+    table.append([scenario, n,
+                  f"{_median([r['wall'] for r in runs]):.3f}s", f"{min(r['wall'] for r in runs):.3f}s",
+                  f"{_median([r['cpu'] for r in runs]):.3f}s",
+                  f"{sum(r['requests'] for r in runs)/n:.1f}", f"{sum(r['retries'] for r in runs)/n:.1f}",
+                  served["throttled"], served["errors"], served["unrecorded"], f"{served['bytes']/n/1024:,.0f}"])
+  return tt.to_string(table, header=headers, style=tt.styles.ascii_thin_double, alignment="lrrrrrrrrrr")
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmarks xiv_web_tools against a local Universalis/XIVAPI stand-in.")
+  parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+  parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, caches cleared in between")
+  parser.add_argument("--world", default="Excalibur")
+  parser.add_argument("--dc", default="Primal")
+  parser.add_argument("--ilvl", type=int, default=560)
+  parser.add_argument("--job", default="PLD")
+  parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+  parser.add_argument("--jitter", type=float, default=0, help="extra random latency, up to this many seconds")
+  parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with a 503")
+  parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with a 429")
+  parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with each 429")
+  parser.add_argument("--seed", type=int, default=0, help="seed for the injected faults")
+  parser.add_argument("--fixtures", default=BENCHMARK_FIXTURES_PATH, help="recorded fixtures to replay/record into")
+  parser.add_argument("--synthetic", action="store_true", help="ignore recorded fixtures even if they exist")
+  parser.add_argument("--record", action="store_true", help="record fixtures from the live APIs")
+  parser.add_argument("--tape", help="replay a tape the bot recorded with XIV_HTTP_MODE=record instead")
+  parser.add_argument("--arrivals", action="store_true",
+                      help="with --tape, re-issue its request log at the recorded offsets instead of running scenarios")
+  parser.add_argument("--json", help="also write the raw per-run results here")
+  parser.add_argument("--worker", choices=SCENARIOS + ["arrivals"], help=argparse.SUPPRESS)
+  parser.add_argument("--item-names", help=argparse.SUPPRESS)
+  parser.add_argument("--upstreams", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.worker:
+    return worker(args)
+
+  if args.arrivals and not args.tape:
+    parser.error("--arrivals needs --tape")
+  scenarios = ["arrivals"] if args.arrivals else args.scenarios or SCENARIOS
+  for scenario in scenarios:
+    if scenario not in SCENARIOS + ["arrivals"]:
+      parser.error(f"unknown scenario {scenario}")
+  results = {}
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    stand_ins, item_names, recorded = _stand_ins(args, tmp_dir)
+    for scenario in scenarios:
+      for stand_in in stand_ins.values():
+        stand_in.reset_stats()
+      runs = spawn_worker(scenario, args, stand_ins, item_names)
+      served = {k: sum(s.stats[k] for s in stand_ins.values()) for k in stand_ins["universalis"].stats}
+      results[scenario] = (runs, served)
+      print(f"{scenario}: {runs[-1]['spans']}")
+  if args.arrivals:
+    profile = xivtp.Tape(args.tape).profile()
+    replayed = results["arrivals"][0][-1]
+    print(f"arrivals: peak in flight {replayed['peak_in_flight']} (recorded {profile.get('peak_in_flight', 0)}), "
+          f"latency p50/p95 {replayed['latency_p50']:.3f}s/{replayed['latency_p95']:.3f}s "
+          f"(recorded {profile.get('latency_p50', 0):.3f}s/{profile.get('latency_p95', 0):.3f}s)")
+  print(report(results))
+  if recorded is not None:
+    save_fixtures(recorded, args.fixtures)
+    print(f"Recorded {len(recorded['universalis'])+len(recorded['xivapi'])} responses to {args.fixtures}")
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("worker", "item_names")},
+                 "results": {scenario: {"runs": runs, "served": served} for scenario, (runs, served) in results.items()}},
+                f, indent=2)
+  return
+
+if __name__ == "__main__":
+  main()
@@ -1,12 +1,22 @@
+import asyncio
 import itertools
 import logging
 import os
 import random
+import time
 
 import discord
 from dotenv import load_dotenv
-from discord.ext import commands
+from discord.ext import commands, tasks
 
+import async_xiv_web_tools as axivwt
+import xiv_admission as xiva
+import xiv_cache as xivc
+import xiv_http as xivh
+import xiv_metrics as xivm
+import xiv_rankings as xivr
+import xiv_scheduler as xivs
+import xiv_tape as xivtp
 import xiv_web_tools as xivwt
 import xiv_tools as xivt
 
@@ -20,6 +30,7 @@ logging.Logger.COMMAND = COMMAND
 logging.basicConfig(level=25)
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+EDIT_INTERVAL = float(os.getenv("XIV_EDIT_INTERVAL", 1.5)) # Discord allows ~5 edits per 5s per channel
 bot = commands.Bot(command_prefix="$")
 
 BLANK = "<:01Transparent:997441264666562572>"
@@ -95,9 +106,25 @@ def slot_emote(slot):
   
   return d.get(slot, ":question:")
 
+@tasks.loop(seconds=xivr.REFRESH_INTERVAL)
+async def refresh_rankings():
+  await xivr.refresh_all()
+
+METRICS_SERVER = [None] # on_ready can fire again after a reconnect
+
+@tasks.loop(seconds=xivm.METRICS_LOG_INTERVAL or 60)
+async def dump_metrics():
+  xivm.dump()
+
 @bot.event
 async def on_ready():
   logging.log(COMMAND_LEVEL, " >>> READY <<< ")
+  if not refresh_rankings.is_running():
+    refresh_rankings.start()
+  if xivm.METRICS_LOG_INTERVAL and not dump_metrics.is_running():
+    dump_metrics.start()
+  if xivm.METRICS_PORT and METRICS_SERVER[0] is None:
+    METRICS_SERVER[0] = xivm.serve(xivm.METRICS_PORT)
   return
 
 @bot.event
@@ -105,13 +132,21 @@ async def on_command(ctx):
   logging.log(COMMAND_LEVEL, f"{ctx.author} used ${ctx.command} {' '.join(ctx.args[1:])} in {'DM' if not ctx.guild else ctx.guild.name}")
   return
 
+def set_data_age(embed, table):
+  embed.set_footer(text=f"Data age: {xivr.format_age(table.age)}")
+  return embed
+
 @bot.event
 async def on_command_error(ctx, err):
   logging.error(f"{ctx.author} used {ctx.command} and got the error: {str(err)}")
+  if getattr(ctx, "trace", None) is not None:
+    xivm.finish_trace(ctx.trace, "refused" if isinstance(err, AdmissionRefused) else "error")
   if isinstance(err, commands.CommandNotFound):
     await ctx.reply(":warning: **Invalid command. Try using** `$help` **to see a list of available commands.**")
   elif isinstance(err, commands.MissingRequiredArgument):
     await ctx.reply(f":warning: **Please pass in all arguments.** {str(err)}")
+  elif isinstance(err, AdmissionRefused):
+    await ctx.reply(f":warning: {str(err)}")
   elif isinstance(err, commands.MissingPermissions):
     await ctx.reply(":warning: **You do not have the requirements or permissions for this command.**")
   else:
@@ -123,15 +158,126 @@ async def check_server(ctx, server_region_dc, mode):
   acceptable_categories = []
   if mode & 0b001: # Can be a  'server' (not region or dc)
     acceptable_categories.append("Server")
-    acceptable_names += xivt.dict_slicer(xivwt.worlds(), ["name"])[0]
+    acceptable_names += xivt.dict_slicer(await axivwt.worlds(), ["name"])[0]
   if mode & 0b010: # Can be a 'dc' (not server or region)
     acceptable_categories.append("DC")
-    acceptable_names += xivt.dict_slicer(xivwt.dcs(), ["name"])[0]
+    acceptable_names += xivt.dict_slicer(await axivwt.dcs(), ["name"])[0]
   if mode & 0b100: # Can be a 'region' (not server or dc)
     acceptable_categories.append("Region")
-    acceptable_names += xivt.dict_slicer(xivwt.regions(), ["name"])[0]
+    acceptable_names += xivt.dict_slicer(axivwt.regions(), ["name"])[0]
   return server_region_dc.lower() in [s.lower() for s in acceptable_names]
 
+async def discord_edit(msg, **kwargs):
+  with xivm.span("discord_edit"):
+    return await msg.edit(**kwargs)
+
+class EmbedUpdater(object):
+  # Edits a reply as partial results come in. Edits closer together than
+  # `interval` are collapsed into one delayed edit that sends whatever the
+  # embed looks like by then.
+  def __init__(self, msg, embed, interval=EDIT_INTERVAL):
+    self.msg = msg
+    self.embed = embed
+    self.interval = interval
+    self.edits = 0
+    self._last_edit = 0
+    self._pending = None
+    return
+
+  def __repr__(self):
+    return f"<EmbedUpdater({self.edits} edits)>"
+
+  async def _edit(self, **kwargs):
+    self._last_edit = time.monotonic()
+    self.edits += 1
+    return await discord_edit(self.msg, embed=self.embed, **kwargs)
+
+  async def _edit_later(self, delay):
+    await asyncio.sleep(delay)
+    self._pending = None
+    await self._edit()
+    return
+
+  async def update(self):
+    if self._pending is not None:
+      return
+    wait = self._last_edit + self.interval - time.monotonic()
+    if wait <= 0:
+      await self._edit()
+    else:
+      self._pending = asyncio.ensure_future(self._edit_later(wait))
+    return
+
+  async def finish(self, **kwargs):
+    if self._pending is not None:
+      self._pending.cancel()
+      self._pending = None
+    return await self._edit(**kwargs)
+
+class AdmissionRefused(commands.CommandError):
+  pass
+
+ADMISSION = {"heavy": xiva.AdmissionController("heavy", int(os.getenv("XIV_HEAVY_CONCURRENCY", 2)),
+                                          int(os.getenv("XIV_HEAVY_PER_USER", 1)),
+                                          int(os.getenv("XIV_HEAVY_PER_GUILD", 3))),
+             "rankings": xiva.AdmissionController("rankings", int(os.getenv("XIV_RANKINGS_CONCURRENCY", 4)),
+                                             int(os.getenv("XIV_RANKINGS_PER_USER", 2)),
+                                             int(os.getenv("XIV_RANKINGS_PER_GUILD", 6)))}
+COMMAND_CLASSES = {"gearset": "heavy", "resell": "heavy", "crafter_set": "heavy",
+                   "gatherer_set": "heavy", "crafter_gatherer_set": "heavy",
+                   "ventures": "rankings", "scrips": "rankings", "collectibles": "rankings"}
+
+@bot.before_invoke
+async def start_command_trace(ctx):
+  ctx.trace = xivm.start_trace(ctx.command.name)
+  return
+
+def reserve_admission(ctx):
+  # Called by the command once its arguments have been checked, so invalid
+  # requests never take a queue slot or count against anyone's quota
+  command_class = COMMAND_CLASSES.get(ctx.command.name)
+  if command_class is None:
+    return None
+  key = (ctx.command.name,) + tuple(str(arg).lower() for arg in [*ctx.args[1:], *ctx.kwargs.values()])
+  try:
+    ctx.admission = ADMISSION[command_class].reserve(key, ctx.author.id, ctx.guild.id if ctx.guild else None)
+  except xiva.AdmissionRefused as err:
+    raise AdmissionRefused(str(err)) from err
+  return ctx.admission
+
+@bot.after_invoke
+async def release_admission(ctx):
+  ticket = getattr(ctx, "admission", None)
+  if ticket is not None:
+    ticket.release()
+  elapsed = xivm.finish_trace(ctx.trace, "error" if ctx.command_failed else "ok")
+  if elapsed is not None and ctx.trace.spans:
+    logging.log(COMMAND_LEVEL, f"${ctx.command} took {elapsed:.2f}s: {ctx.trace.summary()}")
+  return
+
+async def wait_for_turn(ctx, msg, embed):
+  # Reserves the command's place, then shows the queue position in the
+  # placeholder embed until it's the command's turn
+  try:
+    ticket = reserve_admission(ctx)
+  except AdmissionRefused:
+    await msg.delete() # on_command_error replies with the reason
+    raise
+  if ticket is None:
+    return
+  description = embed.description
+  shown = None
+  with xivm.span("admission_wait"):
+    async for position in ticket.wait(EDIT_INTERVAL):
+      if position != shown:
+        embed.description = f"Queued, {position} request(s) ahead of you...\n{description}"
+        await discord_edit(msg, embed=embed)
+        shown = position
+  if shown is not None:
+    embed.description = description
+    await discord_edit(msg, embed=embed)
+  return
+
 def embed_skeleton(ctx, title, description, thumbnail):
   embed = discord.Embed(title=title,
                         description=description,
@@ -141,6 +287,14 @@ def embed_skeleton(ctx, title, description, thumbnail):
   embed.set_thumbnail(url=thumbnail)
   return embed
 
+@xivm.timed("embed_formatting")
+async def _ventures_display(ctx, table, embed):
+  embed.description = ""
+  set_data_age(embed, table)
+  for ix, (name, lvl, gph, velocity) in enumerate(table.collection, start=1):
+    embed.add_field(name=f"{ix:2d}. {name} ({LVL} {lvl})", value=f"{BLANK}➥Gil/Hour: {gph:,}\n{BLANK}{BLANK}➥Sales/Day: {velocity:,}", inline=False)
+  return embed
+
 @bot.command(help="Finds the most profitable combat ventures in a world.", brief="Usage: $ventures World")
 async def ventures(ctx, server):
   if not await check_server(ctx, server, mode=0b001):
@@ -150,11 +304,22 @@ async def ventures(ctx, server):
                          description=f"Finding best combat ventures in {server}...",
                          thumbnail="https://xivapi.com/img-misc/payment_currency_coin.png")
   msg = await ctx.reply(embed=embed)
-  best_ventures_table, _ = xivwt.best_combat_ventures(server, n_results=10, v_cutoff=40, verbose=False)
+  await wait_for_turn(ctx, msg, embed)
+  table = await xiva.shared_call(ctx.admission, lambda: xivr.get("ventures", server))
+  xivr.record_request("ventures", server)
+  embed = await _ventures_display(ctx, table, embed)
+  return await discord_edit(msg, embed=embed, content=f"Best combat ventures in {server}:")
+
+@xivm.timed("embed_formatting")
+async def _collectibles_display(ctx, table, embed):
   embed.description = ""
-  for ix, (name, lvl, gph, velocity) in enumerate(best_ventures_table, start=1):
-    embed.add_field(name=f"{ix:2d}. {name} ({LVL} {lvl})", value=f"{BLANK}➥Gil/Hour: {gph:,}\n{BLANK}{BLANK}➥Sales/Day: {velocity:,}", inline=False)
-  return await msg.edit(embed=embed, content=f"Best combat ventures in {server}:")
+  set_data_age(embed, table)
+  for ix, (name, lvl, reward, g2c, gpc) in enumerate(table.collection, start=1):
+    recipe = xivwt.get_item_recipe_from_local(name)[0]
+    crafter = recipe["crafting_class"]
+    recipe_lines = f"\n> **__Recipe__** (Cost: {g2c:,} -- Gil/Scrip: {gpc:,})\n>   " + "\n>   ".join([f"{number_to_emote(q)} x {i}" for q,i in zip(recipe["amounts"], recipe["ingredient_names"])])
+    embed.add_field(name=f"{ix:2d}. {name} ({crafter} Lvl {lvl})", value=recipe_lines, inline=False)
+  return embed
 
 @bot.command(help="Finds the most profitable collectible to craft in a "\
                 + "world, DC, or region given a currency. Currency can be "\
@@ -163,10 +328,8 @@ async def ventures(ctx, server):
 async def collectibles(ctx, currency, server):
   if currency.lower() == "white":
     thumbnail = "https://ffxiv.gamerescape.com/w/images/1/19/White_Crafters%27_Scrip_Icon.png"
-    cur = "White Crafters' Scrips"
   elif currency.lower() == "purple":
     thumbnail = "https://ffxiv.gamerescape.com/w/images/e/ee/Purple_Crafters%27_Scrip_Icon.png"
-    cur = "Purple Crafters' Scrips"
   else:
     return await ctx.reply(f":warning: 'Currency' must be either 'White' or 'Purple'. Got: {currency}")
   if not await check_server(ctx, server, mode=0b111):
@@ -176,15 +339,13 @@ async def collectibles(ctx, currency, server):
                          description=f"Finding best collectibles to craft in {server}...",
                          thumbnail=thumbnail)
   msg = await ctx.reply(embed=embed)
-  best_collectible_table, _ = xivwt.best_collectible_to_craft(cur, server, n_results=10, verbose=False)
-  embed.description = ""
-  for ix, (name, lvl, reward, g2c, gpc) in enumerate(best_collectible_table, start=1):
-    recipe = xivwt.get_item_recipe_from_local(name)[0]
-    crafter = recipe["crafting_class"]
-    recipe_lines = f"\n> **__Recipe__** (Cost: {g2c:,} -- Gil/Scrip: {gpc:,})\n>   " + "\n>   ".join([f"{number_to_emote(q)} x {i}" for q,i in zip(recipe["amounts"], recipe["ingredient_names"])])
-    embed.add_field(name=f"{ix:2d}. {name} ({crafter} Lvl {lvl})", value=recipe_lines, inline=False)
-  return await msg.edit(embed=embed, content=f"Best collectibles to craft in {server}")
+  await wait_for_turn(ctx, msg, embed)
+  table = await xiva.shared_call(ctx.admission, lambda: xivr.get("collectibles", server, currency))
+  xivr.record_request("collectibles", server, currency)
+  embed = await _collectibles_display(ctx, table, embed)
+  return await discord_edit(msg, embed=embed, content=f"Best collectibles to craft in {server}")
 
+@xivm.timed("embed_formatting")
 async def _gearset_display(ctx, collection, embed):
   embed.description = ""
   total_cost = 0
@@ -214,9 +375,18 @@ async def gearset(ctx, job, ilvl, server):
                          description=f"Finding cheapest item prices in {server}...",
                          thumbnail=job_icon(job))
   msg = await ctx.reply(embed=embed)
-  best_gearset, _ = xivwt.best_server_gearset_items(ilvl, job, server, verbose=False)
+  await wait_for_turn(ctx, msg, embed)
+  best_gearset, _ = await xiva.shared_call(ctx.admission, lambda: axivwt.best_server_gearset_items(ilvl, job, server, verbose=False))
   embed = await _gearset_display(ctx, best_gearset, embed)
-  return await msg.edit(embed=embed, content="Cheapest item prices")
+  return await discord_edit(msg, embed=embed, content="Cheapest item prices")
+
+@xivm.timed("embed_formatting")
+async def _scrips_display(ctx, table, embed, emoji):
+  set_data_age(embed, table)
+  for ix, (name, cost, price, gpc, velocity) in enumerate(table.collection, start=1):
+    embed.add_field(name=f"{ix}. {name} ({cost} {emoji})", value=f"{BLANK}➥Price: {round(price):,} (Gil/Scrip: {gpc:,})\n{BLANK}{BLANK}➥Saless/Day: {velocity:,}", inline=False)
+  embed.description = ""
+  return embed
 
 @bot.command(help="Finds the best scrip rewards on a server for a given scrip"\
                   "color. Ex: $scrips White Excalibur",
@@ -239,12 +409,11 @@ async def scrips(ctx, currency, server):
                          description=f"Finding best scrip rewards in {server}...",
                          thumbnail=thumbnail)
   msg = await ctx.reply(embed=embed)
-  best_rewards, _ = xivwt.best_scrip_reward(server, cur, n_results=10, verbose=False)
-  
-  for ix, (name, cost, price, gpc, velocity) in enumerate(best_rewards, start=1):
-    embed.add_field(name=f"{ix}. {name} ({cost} {emoji})", value=f"{BLANK}➥Price: {round(price):,} (Gil/Scrip: {gpc:,})\n{BLANK}{BLANK}➥Saless/Day: {velocity:,}", inline=False)
-  embed.description=""
-  await msg.edit(embed=embed)
+  await wait_for_turn(ctx, msg, embed)
+  table = await xiva.shared_call(ctx.admission, lambda: xivr.get("scrips", server, currency))
+  xivr.record_request("scrips", server, currency)
+  embed = await _scrips_display(ctx, table, embed, emoji)
+  await discord_edit(msg, embed=embed)
   return
 
 @bot.command(help="Finds the best items to buy on other servers and resell on"\
@@ -254,10 +423,10 @@ async def scrips(ctx, currency, server):
 async def resell(ctx, home, dc_or_region, mode, n_results="all"):
   mode = mode.strip().lower()
   if mode.lower() == "equips":
-    func = xivwt._bri_ilvl
+    stream = lambda: axivwt.iter_bri_ilvl(home, dc_or_region)
     emoji = "<:02Sword:997445338602418176>"
   elif mode.lower() == "materia":
-    func = xivwt._bri_materia
+    stream = lambda: axivwt.iter_bri_materia(home, dc_or_region)
     emoji = "<:17MateriaX:1000685607305093151>"
   else:
     return await ctx.reply(f":warning: Supplied mode must be either 'equips' or 'materia'. Got {mode}")
@@ -271,13 +440,25 @@ async def resell(ctx, home, dc_or_region, mode, n_results="all"):
                          description=f"Finding best resellable {emoji} {mode} {emoji} from {dc_or_region}...",
                          thumbnail="https://ffxiv.gamerescape.com/w/images/2/22/Gil_Icon.png")
   msg = await ctx.reply(embed=embed)
-  collection, _ = func(home, dc_or_region, n_results=10, verbose=False)
-  for ix, (name, home_price, foreign_price, diff, best_server) in enumerate(collection, start=1):
-    embed.add_field(name=f"{ix}. {name} (Profit: {diff:,} {GIL})", value=f"{BLANK}➥Buy from {best_server} for: {foreign_price:,}\n{BLANK}➥Sell for: {home_price:,}", inline=False)
+  await wait_for_turn(ctx, msg, embed)
+  updater = EmbedUpdater(msg, embed)
+  groups = {}
+  async for position, rows in xiva.shared_stream(ctx.admission, stream):
+    groups[position] = rows
+    _resell_fields(embed, axivwt.bri_merge(groups, n_results=10))
+    await updater.update()
+  _resell_fields(embed, axivwt.bri_merge(groups, n_results=10))
   embed.description = ""
-  await msg.edit(embed=embed)
+  await updater.finish()
   return
 
+@xivm.timed("embed_formatting")
+def _resell_fields(embed, collection):
+  embed.clear_fields()
+  for ix, (name, home_price, foreign_price, diff, best_server) in enumerate(collection, start=1):
+    embed.add_field(name=f"{ix}. {name} (Profit: {diff:,} {GIL})", value=f"{BLANK}➥Buy from {best_server} for: {foreign_price:,}\n{BLANK}➥Sell for: {home_price:,}", inline=False)
+  return embed
+
 async def _crafter_gatherer_set(ctx, ilvl, server, crafter_or_gatherer):
   if not await check_server(ctx, server, 0b111):
     return await ctx.reply(f":warning: Supplied server must be a valid world, DC, or region name. Got: {server}")
@@ -290,7 +471,28 @@ async def _crafter_gatherer_set(ctx, ilvl, server, crafter_or_gatherer):
                          description=f"Finding cheapest {title_substring} prices in {server}...",
                          thumbnail="https://ffxiv.consolegameswiki.com/mediawiki/images/2/25/Trained_Finesse.png")
   msg = await ctx.reply(embed=embed)
-  best_gearset, _ = xivwt.best_server_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, sort_by_server=True, verbose=False)
+  await wait_for_turn(ctx, msg, embed)
+  updater = EmbedUpdater(msg, embed)
+  title = embed.title
+  job_list, generic_jobs = xivwt._crafter_gatherer_jobs(crafter_or_gatherer)
+  num_groups = len(job_list) + len(generic_jobs)
+  groups = {}
+  stream = lambda: axivwt.iter_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer)
+  async for position, rows in xiva.shared_stream(ctx.admission, stream):
+    groups[position] = rows
+    embed.description = f"Priced {len(groups)}/{num_groups} jobs in {server}..."
+    _crafter_gatherer_fields(embed, title, groups)
+    await updater.update()
+  _crafter_gatherer_fields(embed, title, groups)
+  embed.description = ""
+  return await updater.finish(content="Cheapest item prices")
+
+@xivm.timed("embed_formatting")
+def _crafter_gatherer_fields(embed, title, groups):
+  # Same ordering as best_server_full_crafter_gatherer_set(sort_by_server=True)
+  best_gearset = list(itertools.chain.from_iterable(groups[ix] for ix in sorted(groups)))
+  best_gearset.sort(key=lambda x: x[3])
+  embed.clear_fields()
   x = itertools.groupby(best_gearset, key=lambda x: x[3])
   total_cost = 0
   for best_server, group in x:
@@ -313,9 +515,8 @@ async def _crafter_gatherer_set(ctx, ilvl, server, crafter_or_gatherer):
     for ix, val in enumerate(values, start=1):
       embed.add_field(name=f"{best_server} ({ix}/{len(values)})", value=val, inline=False)
   cost_str = f"{total_cost:,}"
-  embed.title += f"\nTotal Cost: {number_to_emote(cost_str)} {GIL}"
-  embed.description = ""
-  return await msg.edit(embed=embed, content="Cheapest item prices")
+  embed.title = f"{title}\nTotal Cost: {number_to_emote(cost_str)} {GIL}"
+  return embed
 
 @bot.command(help="Finds the best worlds to buy an entire crafter set and "\
                   "includes primary/secondary tools for all crafter jobs at "\
@@ -341,6 +542,49 @@ async def gatherer_set(ctx, ilvl, server):
 async def crafter_gatherer_set(ctx, ilvl, server):
   return await _crafter_gatherer_set(ctx, ilvl, server, "all")
 
+@bot.command(help="Searches item names, tolerating typos and partial names. "\
+                  "Ex: $search dragn fang",
+             brief="Usage: $search Item Name")
+async def search(ctx, *, query):
+  matches = xivt.search_item_names(query, n_results=10)
+  if not matches:
+    return await ctx.reply(f":warning: No items found matching: {query}")
+  if matches[0].lower() == query.strip().lower():
+    return await ctx.reply(f"Found **{matches[0]}** (Item ID: {xivt.item_id_from_name(matches[0])})")
+  suggestions = "\n".join([f"{BLANK}➥{name}" for name in matches])
+  return await ctx.reply(f"Did you mean:\n{suggestions}")
+
+@bot.command(help="Shows cache and upstream connection statistics.", brief="Usage: $stats")
+async def stats(ctx):
+  embed = embed_skeleton(ctx=ctx,
+                         title="Bot Statistics",
+                         description="",
+                         thumbnail="https://xivapi.com/img-misc/payment_currency_coin.png")
+  http_stats = xivh.STATS.as_dict()
+  embed.add_field(name="Upstream HTTP", value="\n".join([f"{BLANK}➥{k}: {v:,}" for k, v in http_stats.items()]), inline=False)
+  for name, cache_stats in xivc.stats().items():
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    hit_rate = 0 if not lookups else 100*cache_stats["hits"]/lookups
+    lines = [f"{BLANK}➥Entries: {cache_stats['entries']:,} ({cache_stats['bytes']:,} bytes)",
+             f"{BLANK}➥Hits/Misses: {cache_stats['hits']:,}/{cache_stats['misses']:,} ({hit_rate:.0f}%)"]
+    # Whatever else this kind of cache counts (evictions, expirations, revalidations, ...)
+    lines += [f"{BLANK}➥{k.capitalize()}: {v:,}" for k, v in cache_stats.items()
+              if k not in ("entries", "bytes", "hits", "misses")]
+    value = "\n".join(lines)
+    embed.add_field(name=f"Cache: {name}", value=value, inline=False)
+  for name, scheduler_stats in xivs.stats().items():
+    value = "\n".join([f"{BLANK}➥{k}: {v:,}" for k, v in scheduler_stats.items()])
+    embed.add_field(name=f"Scheduler: {name}", value=value, inline=False)
+  for name, controller in ADMISSION.items():
+    value = "\n".join([f"{BLANK}➥{k}: {v:,}" for k, v in controller.stats().items()])
+    embed.add_field(name=f"Admission: {name}", value=value, inline=False)
+  for name, flight_stats in xivc.flight_stats().items():
+    value = f"{BLANK}➥Fetches: {flight_stats['calls']:,} (Coalesced: {flight_stats['coalesced']:,})"
+    embed.add_field(name=f"Single-flight: {name}", value=value, inline=False)
+  if xivtp.TAPE is not None:
+    value = "\n".join([f"{BLANK}➥{k}: {v:,}" for k, v in xivtp.TAPE.stats().items()])
+    embed.add_field(name=f"Tape ({xivtp.MODE})", value=value, inline=False)
+  return await ctx.reply(embed=embed)
 
 @bot.command(help="NAX")
 async def pee(ctx):
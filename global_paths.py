@@ -1,7 +1,12 @@
+import os
 import os.path as op
 
-XIVAPI_URL = "https://www.xivapi.com"
-UNIVERSALIS_URL = "https://www.universalis.app/api/v2"
+from dotenv import load_dotenv
+
+# The API base URLs can be pointed elsewhere, e.g. at benchmark.py's stand-in
+load_dotenv()
+XIVAPI_URL = os.getenv("XIV_XIVAPI_URL", "https://www.xivapi.com")
+UNIVERSALIS_URL = os.getenv("XIV_UNIVERSALIS_URL", "https://www.universalis.app/api/v2")
 
 OFFLINE_DATA_PATH = ODP = "OfflineData"
 RAW_VENTURE_PATH             = op.join(ODP, "raw_combat_venture.txt")
@@ -11,4 +16,9 @@ PROCESSED_COLLECTIBLE_PATH   = op.join(ODP, "processed_collectible_names.txt")
 PROCESSED_RECIPE_PATH        = op.join(ODP, "processed_collectible_recipes.txt")
 RAW_CRAFTER_SCRIP_PATH       = op.join(ODP, "raw_crafter_scrip_rewards.txt")
 PROCESSED_CRAFTER_SCRIP_PATH = op.join(ODP, "processed_crafter_scrip_rewards.txt")
-ITEM_NAMES_AND_IDS           = op.join(ODP, "item_ids_to_names.txt")
\ No newline at end of file
+ITEM_NAMES_AND_IDS           = op.join(ODP, "item_ids_to_names.txt")
+PROCESSED_EQUIPMENT_PATH     = op.join(ODP, "processed_equipment.txt")
+HTTP_CACHE_PATH              = op.join(ODP, "http_cache.sqlite3")
+HTTP_TAPE_PATH               = op.join(ODP, "http_tape.sqlite3")
+CHECKPOINT_PATH              = op.join(ODP, "checkpoints")
+BENCHMARK_FIXTURES_PATH      = op.join(ODP, "benchmark_fixtures.json.gz")
\ No newline at end of file
@@ -1,9 +1,16 @@
+import argparse
+import hashlib
 import json
+import os
 import re
 import os.path as op
-from multiprocessing.pool import ThreadPool
+import threading
+from functools import partial
 
 from global_paths import *
+import xiv_columnar as xivcol
+import xiv_item_names as xivin
+import xiv_scheduler as xivs
 import xiv_tools as xivt
 import xiv_web_tools as xivwt
 
@@ -77,22 +84,89 @@ def process_collectible_html(input_file_name, output_file_name=""):
     print(f"  Written to {output_file_name}")
   return output
 
-def process_collectible_recipes(input_file_name, output_file_name=""):
+class Checkpoint(object):
+  # Append-only JSON-lines record of per-item results, so an interrupted
+  # rebuild can pick up where it stopped instead of starting over. Results
+  # are keyed by item, not by input file, so they stay valid when the input
+  # changes; the checkpoint is cleared once the stage has written its output.
+  def __init__(self, name):
+    self.path = op.join(CHECKPOINT_PATH, f"{name}.jsonl")
+    self._lock = threading.Lock()
+    self.done = {}
+    if op.exists(self.path):
+      with open(self.path, "r", encoding="utf-8") as f:
+        for line in f:
+          try:
+            entry = json.loads(line)
+          except ValueError: # Partial line from a crash mid-write
+            continue
+          self.done[entry["key"]] = entry["value"]
+    return
+
+  def __repr__(self):
+    return f"<Checkpoint({self.path}, {len(self.done)} done)>"
+
+  def __contains__(self, key):
+    return key in self.done
+
+  def get(self, key):
+    return self.done[key]
+
+  def record(self, key, value):
+    with self._lock:
+      os.makedirs(CHECKPOINT_PATH, exist_ok=True)
+      with open(self.path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"key": key, "value": value}) + "\n")
+      self.done[key] = value
+    return
+
+  def clear(self):
+    with self._lock:
+      if op.exists(self.path):
+        os.remove(self.path)
+      self.done = {}
+    return
+
+def _recipe_worker(name, checkpoint=None, previous=None):
+  if previous is not None and name in previous:
+    return previous[name], None
+  if checkpoint is not None and name in checkpoint:
+    return checkpoint.get(name), None
+  try:
+    recipe = xivwt.get_item_recipe_from_web(name)._as_dict()
+  except Exception as err:
+    return None, f"{name}: {err}"
+  if checkpoint is not None:
+    checkpoint.record(name, recipe)
+  return recipe, None
+
+def previous_recipes(file_name):
+  # name -> recipe from an earlier run's output, so only new items get fetched
+  if not op.exists(file_name):
+    return {}
+  return {recipe["name"]: recipe for recipe in xivt.load_json_from_local(file_name)}
+
+def process_collectible_recipes(input_file_name, output_file_name="", checkpoint=None, previous=None):
   print(f"Processing collectible recipe table from {input_file_name}...")
   data = xivt.read_all(input_file_name)
   data_dict = json.loads(data)
+  if previous:
+    names = [name for tier in data_dict for name in tier["items"]]
+    print(f"  Reusing {sum(name in previous for name in names)}/{len(names)} recipes from the last run")
   output = []
+  errors = []
   num_tiers = len(data_dict)
   for ix, tier in enumerate(data_dict, start=1):
     print(f"  Processing recipes for tier {ix}/{num_tiers}...")
-    temp = []
-    num_items = len(tier["items"])
-    p = ThreadPool(8)
-    output += p.map(xivwt.get_item_recipe_from_web, tier["items"])
-    p.close()
-    p.join()
-  for ix in range(len(output)):
-    output[ix] = output[ix]._as_dict()
+    results = xivs.map(partial(_recipe_worker, checkpoint=checkpoint, previous=previous), tier["items"])
+    for recipe, error in results:
+      if error:
+        errors.append(error)
+      else:
+        output.append(recipe)
+  if errors:
+    # Finished items are kept in the checkpoint; re-running only retries these
+    raise ValueError(f"{len(errors)} recipe(s) failed:\n  " + "\n  ".join(errors))
   print("  Done!")
   if output_file_name:
     xivt.write_json_to_file(output, output_file_name)
@@ -115,9 +189,87 @@ def process_crafter_scrip_rewards(input_file_name, output_file_name=""):
     print(f"  Written to {output_file_name}")
   return output
 
-if __name__ == "__main__":
-  process_venture_html(RAW_VENTURE_PATH, PROCESSED_VENTURE_PATH)
-  full_process_collectible_recipes(RAW_COLLECTIBLE_PATH, PROCESSED_COLLECTIBLE_PATH, PROCESSED_RECIPE_PATH)
-  process_crafter_scrip_rewards(RAW_CRAFTER_SCRIP_PATH, PROCESSED_CRAFTER_SCRIP_PATH)
+EQUIP_ILVL_BAND = 50
+EQUIP_MAX_ILVL = 1000
 
+def process_equipment_catalogue(output_file_name=""):
+  # Searched in item level bands so no single query pages too deep
+  print("Building equipment catalogue from XIVAPI...")
+  urls = []
+  for min_ilvl in range(0, EQUIP_MAX_ILVL, EQUIP_ILVL_BAND):
+    url = xivwt._equip_catalogue_url(min_ilvl, min_ilvl+EQUIP_ILVL_BAND)
+    first_page = xivwt.data_from_url(url)
+    urls.append(url)
+    page_total = (first_page.get("Pagination") or {}).get("PageTotal") or 1
+    urls += [xivwt._equip_catalogue_url(min_ilvl, min_ilvl+EQUIP_ILVL_BAND, page) for page in range(2, page_total+1)]
+  output = []
+  for data in xivwt.data_from_urls(urls):
+    output += xivwt._equip_catalogue_from_data(data)
+  output.sort(key=lambda item: item["id"])
+  print(f"  Done! {len(output)} items")
+  if output_file_name:
+    xivt.write_json_to_file(output, output_file_name)
+    print(f"  Written to {output_file_name}")
+  return output
 
+def file_hash(file_name):
+  with open(file_name, "rb") as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+def rebuild(full=False):
+  # Each stage is skipped when its input hasn't changed since the last
+  # successful run and its output is still there. --full ignores all of that.
+  manifest_path = op.join(CHECKPOINT_PATH, "manifest.json")
+  manifest = {}
+  if not full and op.exists(manifest_path):
+    manifest = xivt.load_json_from_local(manifest_path)
+  stages = [("ventures", process_venture_html, RAW_VENTURE_PATH, PROCESSED_VENTURE_PATH),
+            ("collectibles", process_collectible_html, RAW_COLLECTIBLE_PATH, PROCESSED_COLLECTIBLE_PATH),
+            ("recipes", process_collectible_recipes, PROCESSED_COLLECTIBLE_PATH, PROCESSED_RECIPE_PATH),
+            ("scrips", process_crafter_scrip_rewards, RAW_CRAFTER_SCRIP_PATH, PROCESSED_CRAFTER_SCRIP_PATH)]
+  checkpointed = {"recipes": "collectible_recipes"} # stage -> checkpoint name
+  for stage, func, input_file_name, output_file_name in stages:
+    # The whole-file hash only decides whether a stage runs at all; the
+    # recipe stage then reuses every recipe it already has by item name
+    digest = file_hash(input_file_name)
+    if manifest.get(stage) == digest and op.exists(output_file_name):
+      print(f"Skipping {stage}: {input_file_name} is unchanged")
+      continue
+    checkpoint = None
+    if stage in checkpointed:
+      checkpoint = Checkpoint(checkpointed[stage])
+      if full:
+        checkpoint.clear()
+      previous = {} if full else previous_recipes(output_file_name)
+      func = partial(func, checkpoint=checkpoint, previous=previous)
+    func(input_file_name, output_file_name)
+    if checkpoint is not None: # Its results are in the output file now
+      checkpoint.clear()
+    manifest[stage] = digest
+    os.makedirs(CHECKPOINT_PATH, exist_ok=True)
+    xivt.write_json_to_file(manifest, manifest_path)
+  # The equipment catalogue comes straight from XIVAPI, so there's no input
+  # file to hash; rebuild it with --full after a game patch.
+  if full or not op.exists(PROCESSED_EQUIPMENT_PATH):
+    process_equipment_catalogue(PROCESSED_EQUIPMENT_PATH)
+  else:
+    print(f"Skipping equipment: {PROCESSED_EQUIPMENT_PATH} already exists")
+  write_columnar_tables([output for _, _, _, output in stages] + [PROCESSED_EQUIPMENT_PATH])
+  if op.exists(ITEM_NAMES_AND_IDS) and (full or not xivin.is_current(ITEM_NAMES_AND_IDS)):
+    print(f"Writing item name store for {ITEM_NAMES_AND_IDS}...")
+    xivin.build(ITEM_NAMES_AND_IDS)
+  return
+
+def write_columnar_tables(file_names):
+  # The bot reads these instead of the JSON when they're at least as new
+  for file_name in file_names:
+    if op.exists(file_name) and not xivcol.is_current(file_name):
+      print(f"Writing columnar copy of {file_name}...")
+      xivcol.convert(file_name)
+  return
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Rebuilds the processed files in OfflineData.")
+  parser.add_argument("--full", action="store_true", help="ignore checkpoints and rebuild everything")
+  with xivs.priority(xivs.BACKGROUND):
+    rebuild(full=parser.parse_args().full)
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_admission as xiva
+
+def test_identical_requests_share_one_backend_call():
+  calls = []
+  async def backend():
+    calls.append(1)
+    await asyncio.sleep(0.01)
+    return ["result"]
+  async def command(controller, user):
+    ticket = controller.reserve(("gearset", "smn", "580", "primal"), user, 1)
+    try:
+      async for _ in ticket.wait(0.01):
+        pass
+      return await xiva.shared_call(ticket, backend)
+    finally:
+      ticket.release()
+  async def main():
+    controller = xiva.AdmissionController("heavy", 2, 1, 3)
+    return await asyncio.gather(command(controller, 1), command(controller, 2)), controller
+  results, controller = asyncio.run(main())
+  assert results == [["result"], ["result"]]
+  assert len(calls) == 1
+  assert controller.stats()["deduplicated"] == 1
+  assert controller.stats()["running"] == 0
+
+def test_followers_replay_a_stream_including_late_joiners():
+  calls = []
+  async def backend():
+    calls.append(1)
+    for ix in range(3):
+      await asyncio.sleep(0.01)
+      yield ix
+  async def command(controller, user, delay):
+    await asyncio.sleep(delay)
+    ticket = controller.reserve(("resell", "excalibur", "primal", "equips"), user, None)
+    try:
+      return [item async for item in xiva.shared_stream(ticket, backend)]
+    finally:
+      await asyncio.sleep(0.05) # leader still holds its ticket while the late follower joins
+      ticket.release()
+  async def main():
+    controller = xiva.AdmissionController("heavy", 2, 1, 3)
+    return await asyncio.gather(command(controller, 1, 0), command(controller, 2, 0.005), command(controller, 3, 0.04))
+  assert asyncio.run(main()) == [[0, 1, 2]]*3
+  assert len(calls) == 1
+
+def test_followers_see_the_leaders_failure():
+  async def backend():
+    raise ValueError("upstream down")
+  async def main():
+    controller = xiva.AdmissionController("heavy", 2, 1, 3)
+    leader = controller.reserve(("gearset",), 1, None)
+    follower = controller.reserve(("gearset",), 2, None)
+    results = await asyncio.gather(xiva.shared_call(leader, backend), xiva.shared_call(follower, backend),
+                                   return_exceptions=True)
+    leader.release()
+    follower.release()
+    return results
+  leader_result, follower_result = asyncio.run(main())
+  assert isinstance(leader_result, ValueError)
+  assert isinstance(follower_result, RuntimeError)
+
+def test_caps_refuse_duplicates_from_the_same_user():
+  async def main():
+    controller = xiva.AdmissionController("heavy", 1, 1, 3)
+    controller.reserve(("gearset",), 1, None)
+    try:
+      controller.reserve(("gearset",), 1, None)
+    except xiva.AdmissionRefused:
+      return controller.stats()["refused"]
+  assert asyncio.run(main()) == 1
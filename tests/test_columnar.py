@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_columnar as xivcol
+
+RECORDS = [{"name": "Rarefied Integral Fishing Rod", "level": 90, "reward": 144.5, "amounts": [2, 1, 8], "note": None},
+           {"name": "Chondrite Ingot", "level": 86, "reward": 12, "amounts": [], "note": {"hq": True}},
+           {"name": "Œil de Chocobo ☆", "level": -1, "reward": 0.25, "amounts": [1], "note": "x"}]
+
+def test_round_trip_keeps_values_and_kinds(tmp_path):
+  path = str(tmp_path / "table.bin")
+  xivcol.write_table(RECORDS, path)
+  table = xivcol.ColumnarTable(path)
+  assert len(table) == 3
+  assert table.column_names == ["name", "level", "reward", "amounts", "note"]
+  assert [table.column(name).kind for name in table.column_names] == ["str", "int", "float", "json", "json"]
+  assert list(table) == RECORDS
+  assert table[1] == RECORDS[1]
+  assert table[-1:] == RECORDS[-1:]
+  assert table.column("level").tolist() == [90, 86, -1]
+  assert table.column("name")[-1] == "Œil de Chocobo ☆"
+
+def test_missing_keys_come_back_as_none(tmp_path):
+  path = str(tmp_path / "table.bin")
+  xivcol.write_table([{"a": 1, "b": "x"}, {"a": 2}], path)
+  table = xivcol.ColumnarTable(path)
+  assert table.column("b").kind == "json"
+  assert list(table) == [{"a": 1, "b": "x"}, {"a": 2, "b": None}]
+
+def test_convert_dict_of_dicts_and_is_current(tmp_path):
+  json_path = str(tmp_path / "names.txt")
+  with open(json_path, "w", encoding="utf-8") as f:
+    json.dump({"5": {"en": "Fire Shard"}, "2": {"en": "Ice Shard"}}, f)
+  assert xivcol.open_table(json_path) is None
+  xivcol.convert(json_path)
+  table = xivcol.open_table(json_path)
+  assert table.key == "key"
+  assert list(table) == [{"key": "5", "en": "Fire Shard"}, {"key": "2", "en": "Ice Shard"}]
+  later = time.time() + 10
+  os.utime(json_path, (later, later)) # JSON edited after the conversion
+  assert not xivcol.is_current(json_path)
+  assert xivcol.open_table(json_path) is None
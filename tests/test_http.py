@@ -0,0 +1,60 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_http as xivh
+import xiv_scheduler as xivs
+
+class _Throttled(BaseHTTPRequestHandler):
+  retry_after = 120
+  requests = 0
+
+  def do_GET(self):
+    type(self).requests += 1
+    self.send_response(429)
+    self.send_header("Retry-After", str(self.retry_after))
+    self.send_header("Content-Length", "0")
+    self.end_headers()
+    return
+
+  def log_message(self, *args):
+    return
+
+def _server(retry_after):
+  handler = type("Throttled", (_Throttled,), {"retry_after": retry_after})
+  server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+def test_retry_after_is_not_capped_by_backoff_cap():
+  assert xivh.retry_delay(0, {"Retry-After": "120"}) == 120
+  assert xivh.retry_delay(0, {"Retry-After": "100000"}) == xivh.RETRY_AFTER_MAX
+
+def test_interactive_request_fails_fast_past_the_deadline():
+  server = _server(120)
+  try:
+    started = time.monotonic()
+    response = xivh.get(f"http://127.0.0.1:{server.server_address[1]}/item?private_key=secret")
+    assert response.status == 429
+    assert time.monotonic()-started < 5
+    assert server.RequestHandlerClass.requests == 1
+  finally:
+    server.shutdown()
+
+def test_background_request_honours_retry_after(monkeypatch):
+  monkeypatch.setattr(xivh, "MAX_RETRIES", 1)
+  monkeypatch.setattr(xivh, "DEADLINE", 0.5)
+  server = _server(1)
+  try:
+    started = time.monotonic()
+    with xivs.priority(xivs.BACKGROUND):
+      response = xivh.get(f"http://127.0.0.1:{server.server_address[1]}/item")
+    assert response.status == 429
+    assert time.monotonic()-started >= 1
+    assert server.RequestHandlerClass.requests == 2
+  finally:
+    server.shutdown()
@@ -0,0 +1,58 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_item_names as xivin
+
+NAMES = {"5057": {"en": "Cobalt Ingot", "de": "Kobaltbarren", "ja": "コバルトインゴット"},
+         "2": {"en": "Fire Shard", "de": "Feuerscherbe", "ja": "ファイアシャード"},
+         "44": {"en": "Ægis Shield", "de": "Ägis-Schild", "ja": ""},
+         "7": {"en": "fire shard", "de": "Feuerscherbe", "ja": ""}} # same English name as item 2, in a different case
+
+def _store(tmp_path, data, langs=("en", "de", "ja")):
+  path = str(tmp_path / "item_ids_to_names.txt")
+  with open(path, "w", encoding="utf-8") as f:
+    json.dump(data, f, ensure_ascii=False)
+  xivin.build(path)
+  assert xivin.is_current(path)
+  return xivin.ItemNameStore(path, langs=list(langs))
+
+def test_names_by_id(tmp_path):
+  store = _store(tmp_path, NAMES)
+  assert len(store) == 4
+  assert store.name(5057) == "Cobalt Ingot"
+  assert store.name("5057", "ja") == "コバルトインゴット"
+  with pytest.raises(KeyError):
+    store.name(44, "ja") # no name in that language
+  with pytest.raises(KeyError):
+    store.name(3)
+
+def test_ids_by_name(tmp_path):
+  store = _store(tmp_path, NAMES)
+  assert store.item_id("cobalt ingot") == "5057"
+  assert store.item_id("  KOBALTBARREN ") == "5057"
+  assert store.item_id("ægis shield") == "44"
+  assert store.item_id("コバルトインゴット") == "5057"
+  assert store.item_id("Fire Shard") == "2" # the first item with a name keeps it
+  assert store.item_id("Feuerscherbe") == "2"
+  assert store.item_id("Cobalt") == 0
+
+def test_binary_search_agrees_with_a_dict(tmp_path):
+  rng = random.Random(18)
+  alphabet = "abcdefgh äöüéあい"
+  data = {}
+  for item_id in rng.sample(range(1, 100000), 2000):
+    data[str(item_id)] = {"en": "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))).strip() or "x"}
+  store = _store(tmp_path, data, langs=("en",))
+  expected = {}
+  for item_id, names in data.items():
+    expected.setdefault(names["en"].lower(), item_id)
+  for name, item_id in expected.items():
+    assert store.item_id(name) == item_id
+    assert store.name(item_id) == data[item_id]["en"]
+  assert store.item_id("zzz") == 0
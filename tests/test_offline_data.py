@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import process_offline_data as pod
+
+class FakeRecipe(object):
+  def __init__(self, name):
+    self.name = name
+    return
+
+  def _as_dict(self):
+    return {"name": self.name, "level": 90, "crafting_class": "Carpenter",
+            "ingredient_names": ["Integral Lumber"], "amounts": [1]}
+
+def _fetcher(calls, fail=()):
+  def fetch(name):
+    calls.append(name)
+    if name in fail:
+      raise ValueError("upstream down")
+    return FakeRecipe(name)
+  return fetch
+
+def _write_collectibles(path, names):
+  with open(path, "w", encoding="utf-8") as f:
+    json.dump([{"level": 90, "reward": 144, "currency": "Purple Crafters' Scrips", "items": names}], f)
+  return
+
+def test_checkpoint_resumes_and_clears(tmp_path, monkeypatch):
+  monkeypatch.setattr(pod, "CHECKPOINT_PATH", str(tmp_path))
+  checkpoint = pod.Checkpoint("recipes")
+  checkpoint.record("a", {"name": "a"})
+  checkpoint.record("b", {"name": "b"})
+  with open(checkpoint.path, "a", encoding="utf-8") as f:
+    f.write('{"key": "c", "val') # crash mid-write
+  resumed = pod.Checkpoint("recipes")
+  assert resumed.done == {"a": {"name": "a"}, "b": {"name": "b"}}
+  resumed.clear()
+  assert not os.path.exists(resumed.path)
+  assert pod.Checkpoint("recipes").done == {}
+
+def test_failed_recipes_are_retried_from_the_checkpoint(tmp_path, monkeypatch):
+  monkeypatch.setattr(pod, "CHECKPOINT_PATH", str(tmp_path))
+  names_path = str(tmp_path / "names.txt")
+  _write_collectibles(names_path, ["a", "b", "c"])
+  calls = []
+  monkeypatch.setattr(pod.xivwt, "get_item_recipe_from_web", _fetcher(calls, fail=("b",)))
+  try:
+    pod.process_collectible_recipes(names_path, checkpoint=pod.Checkpoint("recipes"))
+    assert False, "expected the failed recipe to be reported"
+  except ValueError:
+    pass
+  calls.clear()
+  monkeypatch.setattr(pod.xivwt, "get_item_recipe_from_web", _fetcher(calls))
+  output = pod.process_collectible_recipes(names_path, checkpoint=pod.Checkpoint("recipes"))
+  assert calls == ["b"]
+  assert [recipe["name"] for recipe in output] == ["a", "b", "c"]
+
+def test_changed_input_only_fetches_new_recipes(tmp_path, monkeypatch):
+  monkeypatch.setattr(pod, "CHECKPOINT_PATH", str(tmp_path))
+  names_path, recipes_path = str(tmp_path / "names.txt"), str(tmp_path / "recipes.txt")
+  calls = []
+  monkeypatch.setattr(pod.xivwt, "get_item_recipe_from_web", _fetcher(calls))
+  _write_collectibles(names_path, ["a", "b"])
+  pod.process_collectible_recipes(names_path, recipes_path)
+  _write_collectibles(names_path, ["a", "b", "new"])
+  calls.clear()
+  output = pod.process_collectible_recipes(names_path, recipes_path, previous=pod.previous_recipes(recipes_path))
+  assert calls == ["new"]
+  assert [recipe["name"] for recipe in output] == ["a", "b", "new"]
@@ -0,0 +1,30 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_rankings as xivr
+import xiv_scheduler as xivs
+
+def test_malformed_warm_targets_are_dropped():
+  targets = xivr.parse_targets("ventures, ventures:Excalibur,scrips:Excalibur,scrips:Excalibur:White,"
+                               "collectibles:Excalibur:gold,bogus:Excalibur,ventures:Excalibur:white")
+  assert targets == [("ventures", "Excalibur"), ("scrips", "Excalibur", "White")]
+
+def test_cold_gets_coalesce_within_a_priority_class(monkeypatch):
+  calls = []
+  async def ventures(server):
+    calls.append(xivs.current_priority())
+    await asyncio.sleep(0.05)
+    return [], "table"
+  monkeypatch.setitem(xivr.RANKINGS, "ventures", ventures)
+  monkeypatch.setattr(xivr, "TABLES", type(xivr.TABLES)())
+  async def background_refresh():
+    with xivs.priority(xivs.BACKGROUND):
+      return await xivr.refresh(xivr.ranking_key("ventures", "Coalesced"))
+  async def main():
+    return await asyncio.gather(background_refresh(), xivr.get("ventures", "Coalesced"), xivr.get("ventures", "coalesced"))
+  _, first, second = asyncio.run(main())
+  assert first is second
+  assert sorted(calls) == [xivs.INTERACTIVE, xivs.BACKGROUND]
@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Dataclasses import SaleStats
+
+def _entries(rng, n):
+  return [{"pricePerUnit": rng.randint(100, 1000) if rng.random() > 0.15 else rng.randint(5000, 50000),
+           "quantity": rng.randint(1, 20), "hq": rng.random() < 0.4, "timestamp": rng.randint(0, 10**9)}
+          for _ in range(n)]
+
+def _totals(entries):
+  totals = [0, 0, 0, 0] # nq gil, hq gil, nq quantity, hq quantity
+  for entry in entries:
+    totals[entry["hq"]] += entry["pricePerUnit"]*entry["quantity"]
+    totals[2+entry["hq"]] += entry["quantity"]
+  return totals
+
+def _old_remove_outliers(entries, threshold=3):
+  # The list-of-dicts implementation SaleStats had before the arrays
+  nq_gil, hq_gil, nq_quantity, hq_quantity = _totals(entries)
+  kept = []
+  for entry in entries:
+    price, amount = entry["pricePerUnit"], entry["quantity"]
+    if entry["hq"]:
+      new_quantity, new_gil = hq_quantity-amount, hq_gil-amount*price
+      if price > threshold*round(new_gil/new_quantity):
+        hq_quantity, hq_gil = new_quantity, new_gil
+        continue
+    else:
+      new_quantity, new_gil = nq_quantity-amount, nq_gil-amount*price
+      if price > threshold*round(new_gil/new_quantity):
+        nq_quantity, nq_gil = new_quantity, new_gil
+        continue
+    kept.append(entry)
+  return kept, [nq_gil, hq_gil, nq_quantity, hq_quantity]
+
+def _state(stats):
+  return [stats.nq_sales_gil, stats.hq_sales_gil, stats.nq_sales_quantity, stats.hq_sales_quantity]
+
+def test_merge_combine_and_add_keep_totals_and_entries():
+  rng = random.Random(19)
+  parts = [_entries(rng, rng.randint(0, 30)) for _ in range(6)]
+  stats = [SaleStats.from_entries("Item", 1, "Excalibur", 7, part) for part in parts]
+  everything = [entry for part in parts for entry in part]
+  combined = SaleStats.combine(stats)
+  summed = sum(stats)
+  merged = stats[0].copy()
+  for other in stats[1:]:
+    merged += other
+  for result in (combined, summed, merged):
+    assert _state(result) == _totals(everything)
+    assert result.entries == everything
+  assert _state(stats[0]) == _totals(parts[0]) # copy() left the original alone
+
+def test_remove_outliers_matches_the_old_sequential_filter():
+  rng = random.Random(190)
+  for _ in range(200):
+    entries = _entries(rng, rng.randint(2, 40))
+    try:
+      kept, totals = _old_remove_outliers(entries)
+    except ZeroDivisionError: # the old code's last-of-a-quality case
+      continue
+    stats = SaleStats.from_entries("Item", 1, "Excalibur", 7, entries)
+    stats.remove_outliers()
+    assert stats.entries == kept
+    assert _state(stats) == totals
+
+def test_remove_outliers_keeps_the_last_sale_of_a_quality():
+  stats = SaleStats.from_entries("Item", 1, "Excalibur", 7, [{"pricePerUnit": 500, "quantity": 1, "hq": True}])
+  stats.remove_outliers()
+  assert len(stats) == 1
+  assert stats.hq_average == 500
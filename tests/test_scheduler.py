@@ -0,0 +1,35 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_scheduler as xivs
+
+def _occupy(scheduler):
+  # Blocks the scheduler's only worker until the returned event is set
+  started, release = threading.Event(), threading.Event()
+  scheduler.submit(lambda: started.set() or release.wait())
+  started.wait()
+  return release
+
+def test_interactive_waiter_does_not_run_background_work():
+  scheduler = xivs.Scheduler(workers=1)
+  release = _occupy(scheduler)
+  ran = []
+  with xivs.priority(xivs.BACKGROUND):
+    background = scheduler.submit(ran.append, "background")
+  assert scheduler.map(lambda x: ran.append(x) or x*2, [1, 2]) == [2, 4]
+  assert ran == [1, 2]
+  release.set()
+  scheduler.wait(background)
+  assert ran == [1, 2, "background"]
+
+def test_background_waiter_runs_more_urgent_work():
+  scheduler = xivs.Scheduler(workers=1)
+  release = _occupy(scheduler)
+  interactive = scheduler.submit(lambda: "interactive")
+  with xivs.priority(xivs.BACKGROUND):
+    assert scheduler.map(lambda x: x, [1]) == [1]
+  assert interactive.done.is_set()
+  release.set()
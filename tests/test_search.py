@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_search as xivse
+
+NAMES = ["Rarefied Integral Fishing Rod", "Integral Lumber", "Integral Fishing Rod", "Chondrite Ingot",
+         "Chondrite Lapidary Hammer", "Rarefied Chondrite Lapidary Hammer", "Star Quartz", "Ophiotauros Leather"]
+
+def test_edit_distance_cutoff():
+  assert xivse.edit_distance("kitten", "sitting") == 3
+  assert xivse.edit_distance("kitten", "sitting", cutoff=3) == 3
+  assert xivse.edit_distance("kitten", "sitting", cutoff=2) == 3 # anything over the cutoff is cutoff+1
+  assert xivse.edit_distance("", "abc", cutoff=1) == 2
+
+def test_prefix_matches_rank_exact_then_name_then_word_prefix():
+  index = xivse.ItemSearchIndex(NAMES)
+  assert index.search("integral", n_results=3) == ["Integral Lumber", "Integral Fishing Rod",
+                                                   "Rarefied Integral Fishing Rod"]
+  assert index.search("chondrite ingot")[0] == "Chondrite Ingot"
+
+def test_typos_are_ranked_by_edit_distance():
+  index = xivse.ItemSearchIndex(NAMES)
+  assert index.search("Chondrit Ingto", n_results=2) == ["Chondrite Ingot", "Chondrite Lapidary Hammer"]
+  assert index.search("ophiotauros lether", n_results=1) == ["Ophiotauros Leather"]
+  assert index.search("intergal fishing rod", n_results=2) == ["Integral Fishing Rod", "Rarefied Integral Fishing Rod"]
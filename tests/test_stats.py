@@ -0,0 +1,56 @@
+import os
+import random
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_stats as xivst
+import xiv_tools as xivt
+
+def _reference(prices, quantities, f, filter_above, filter_below):
+  # What average_price computed per item before the batched version
+  if not prices:
+    return 0, 0, 0
+  good = xivt.filter_outliers(prices, f, filter_above, filter_below)
+  gil = sum(prices[ix]*quantities[ix] for ix in good)
+  quantity = sum(quantities[ix] for ix in good)
+  return (round(gil/quantity) if quantity else 0), statistics.median(prices), min(prices)
+
+def _random_items(rng, n_items):
+  items = []
+  for _ in range(n_items):
+    n = rng.choice([0, 1, 2, 3, 4, 5, 10, 25])
+    base = rng.randint(1, 100000)
+    # Mostly clustered prices with the odd wild listing
+    prices = [base + rng.randint(-base//4, base//4) if rng.random() > 0.1 else base*rng.randint(2, 50) for _ in range(n)]
+    quantities = [rng.randint(1, 99) for _ in range(n)]
+    items.append((prices, quantities))
+  return items
+
+def _buffer(items):
+  buffer = xivst.ListingBuffer()
+  for prices, quantities in items:
+    buffer.add([{"pricePerUnit": p, "quantity": q} for p, q in zip(prices, quantities)])
+  return buffer
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+@pytest.mark.parametrize("f, filter_above, filter_below", [(1.5, True, True), (1.2, True, False), (1.5, False, True)])
+def test_price_stats_match_filter_outliers(monkeypatch, use_numpy, f, filter_above, filter_below):
+  if use_numpy and xivst.np is None:
+    pytest.skip("numpy is not installed")
+  monkeypatch.setattr(xivst, "USE_NUMPY", use_numpy)
+  rng = random.Random(f"{use_numpy}{f}{filter_above}{filter_below}")
+  for _ in range(20):
+    items = _random_items(rng, 50)
+    stats = xivst.price_stats(_buffer(items), f, filter_above, filter_below)
+    expected = [_reference(prices, quantities, f, filter_above, filter_below) for prices, quantities in items]
+    assert stats.averages == [e[0] for e in expected]
+    assert stats.medians == [e[1] for e in expected]
+    assert stats.minimums == [e[2] for e in expected]
+
+def test_empty_buffer():
+  stats = xivst.price_stats(_buffer([([], [])]))
+  assert (stats.averages, stats.medians, stats.minimums) == ([0], [0], [0])
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xiv_tape as xivtp
+
+def test_records_are_written_in_the_background(tmp_path):
+  tape = xivtp.Tape(str(tmp_path / "tape.sqlite3"))
+  for ix in range(50):
+    tape.record(f"https://universalis.app/api/v2/Excalibur/{ix}?private_key=secret", 200, f'{{"id": {ix}}}',
+                {"Content-Type": "application/json", "Set-Cookie": "x"}, 0.1)
+  tape.record("https://universalis.app/api/v2/Excalibur/0", 200, '{"id": "again"}', {}, 0.2)
+  tape.flush()
+  assert tape.stats()["entries"] == 50
+  assert tape.stats()["pending"] == 0
+  entry = tape.get("https://universalis.app/api/v2/Excalibur/7?private_key=other")
+  assert (entry.status, entry.text, entry.headers) == (200, '{"id": 7}', {"Content-Type": "application/json"})
+  assert tape.get("https://universalis.app/api/v2/Excalibur/0").text == '{"id": "again"}'
+  assert len(tape.arrivals()) == 51
+  assert tape.profile()["requests"] == 51
+
+def test_peak_concurrency():
+  assert xivtp.peak_concurrency([]) == 0
+  assert xivtp.peak_concurrency([(0, 1), (0.5, 1), (2, 1)]) == 2
+  assert xivtp.peak_concurrency([(0, 1), (1, 1)]) == 1 # back to back, not overlapping
@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+
+# Admission control for expensive bot commands: bounded concurrency per
+# command class, per-user and per-guild caps on running+queued work, and
+# fair ordering of the queue. Identical commands (same name and arguments)
+# from other users follow the first one's ticket instead of taking a slot;
+# the leader publishes what it computes to a SharedResult and the followers
+# replay it, so N identical requests cost one upstream fan-out.
+
+class AdmissionRefused(Exception):
+  pass
+
+class SharedResult(object):
+  # Items produced by a leader's command, replayable by any number of
+  # followers, including ones that join after the leader has finished.
+  def __init__(self):
+    self.items = []
+    self.done = False
+    self.error = None
+    self._changed = asyncio.Event()
+    return
+
+  def __repr__(self):
+    return f"<SharedResult({len(self.items)} items, {'done' if self.done else 'running'})>"
+
+  def _notify(self):
+    changed, self._changed = self._changed, asyncio.Event()
+    changed.set()
+    return
+
+  def push(self, item):
+    self.items.append(item)
+    self._notify()
+    return
+
+  def finish(self, error=None):
+    if not self.done:
+      self.done = True
+      self.error = error
+      self._notify()
+    return
+
+  async def replay(self):
+    ix = 0
+    while True:
+      while ix < len(self.items):
+        yield self.items[ix]
+        ix += 1
+      if self.done:
+        break
+      await self._changed.wait()
+    if self.error is not None:
+      raise RuntimeError("The identical request this one was following failed") from self.error
+    return
+
+class Ticket(object):
+  # A reserved place for one command invocation
+  def __init__(self, controller, key, user, guild, leader=None):
+    self.controller = controller
+    self.key = key
+    self.users = [user]
+    self.guilds = [guild]
+    self.leader = leader
+    self.seq = next(controller._seq)
+    self.admitted = asyncio.Event() if leader is None else leader.admitted
+    self.shared = SharedResult() if leader is None else leader.shared
+    return
+
+  def __repr__(self):
+    return f"<Ticket({':'.join(self.key)}, {'admitted' if self.admitted.is_set() else 'queued'})>"
+
+  async def wait(self, interval):
+    # Yields how many requests are ahead while this one is still queued
+    while not self.admitted.is_set():
+      yield self.controller.position(self.leader or self)
+      try:
+        await asyncio.wait_for(self.admitted.wait(), interval)
+      except asyncio.TimeoutError:
+        pass
+    return
+
+  async def stream(self, factory):
+    # The leader runs factory() (an async iterable) and publishes every item;
+    # followers only replay what the leader published.
+    if self.leader is not None:
+      async for item in self.shared.replay():
+        yield item
+      return
+    try:
+      async for item in factory():
+        self.shared.push(item)
+        yield item
+    except BaseException as err:
+      self.shared.finish(err)
+      raise
+    self.shared.finish()
+    return
+
+  def release(self):
+    self.controller.release(self)
+    return
+
+class AdmissionController(object):
+  # Queued commands go in order of how little their user/guild already has
+  # running, then arrival.
+  def __init__(self, name, concurrency, per_user, per_guild):
+    self.name = name
+    self.concurrency = concurrency
+    self.per_user = per_user
+    self.per_guild = per_guild
+    self.running = []
+    self.queued = []
+    self._seq = itertools.count()
+    self.admitted_total = 0
+    self.deduplicated = 0
+    self.refused = 0
+    return
+
+  def __repr__(self):
+    return f"<AdmissionController({self.name}, {len(self.running)}/{self.concurrency} running, {len(self.queued)} queued)>"
+
+  def _load(self, tickets, attr, value):
+    return sum(getattr(ticket, attr).count(value) for ticket in tickets)
+
+  def _refuse(self, reason):
+    self.refused += 1
+    raise AdmissionRefused(reason)
+
+  def reserve(self, key, user, guild):
+    tickets = self.running + self.queued
+    leader = next((ticket for ticket in tickets if ticket.key == key), None)
+    if leader is not None and user in leader.users:
+      self._refuse("I'm already working on that exact command for you.")
+    if self._load(tickets, "users", user) >= self.per_user:
+      self._refuse(f"You can only have {self.per_user} of these commands going at once. Please wait for it to finish.")
+    if guild is not None and self._load(tickets, "guilds", guild) >= self.per_guild:
+      self._refuse(f"This server already has {self.per_guild} of these commands going. Please try again shortly.")
+    if leader is not None:
+      leader.users.append(user)
+      leader.guilds.append(guild)
+      self.deduplicated += 1
+      return Ticket(self, key, user, guild, leader=leader)
+    ticket = Ticket(self, key, user, guild)
+    self.queued.append(ticket)
+    self._dispatch()
+    return ticket
+
+  def release(self, ticket):
+    if ticket.leader is not None:
+      if ticket.users[0] in ticket.leader.users:
+        ticket.leader.users.remove(ticket.users[0])
+        ticket.leader.guilds.remove(ticket.guilds[0])
+      return
+    # A leader that never got to publish (cancelled, refused further down)
+    # must not leave its followers waiting forever
+    ticket.shared.finish(RuntimeError("Request ended without a result"))
+    for tickets in (self.running, self.queued):
+      if ticket in tickets:
+        tickets.remove(ticket)
+    self._dispatch()
+    return
+
+  def _fair_key(self, ticket):
+    return (self._load(self.running, "users", ticket.users[0]),
+            self._load(self.running, "guilds", ticket.guilds[0]) if ticket.guilds[0] is not None else 0,
+            ticket.seq)
+
+  def _dispatch(self):
+    while self.queued and len(self.running) < self.concurrency:
+      ticket = min(self.queued, key=self._fair_key)
+      self.queued.remove(ticket)
+      self.running.append(ticket)
+      self.admitted_total += 1
+      ticket.admitted.set()
+    return
+
+  def position(self, ticket):
+    if ticket not in self.queued:
+      return 0
+    return sorted(self.queued, key=self._fair_key).index(ticket)
+
+  def stats(self):
+    return {"running": len(self.running), "queued": len(self.queued), "admitted": self.admitted_total,
+            "deduplicated": self.deduplicated, "refused": self.refused}
+
+async def _single(factory):
+  yield await factory()
+
+def shared_stream(ticket, factory):
+  # factory() -> async iterable; run once per group of identical commands
+  if ticket is None:
+    return factory()
+  return ticket.stream(factory)
+
+async def shared_call(ticket, factory):
+  # factory() -> awaitable; its result is computed once and shared
+  results = [result async for result in shared_stream(ticket, lambda: _single(factory))]
+  return results[0]
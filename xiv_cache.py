@@ -0,0 +1,315 @@
+import asyncio
+from collections import OrderedDict
+from functools import wraps
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+from global_paths import *
+
+# In-memory caches with per-entry TTLs and an entry/byte cap (LRU eviction).
+# Every cache registers itself in CACHES so the bot can report stats.
+
+load_dotenv()
+STATIC_TTL          = float(os.getenv("XIV_CACHE_STATIC_TTL", 6*60*60))
+MARKET_TTL          = float(os.getenv("XIV_CACHE_MARKET_TTL", 60))
+RESPONSE_MAX_ENTRIES = int(os.getenv("XIV_CACHE_MAX_ENTRIES", 2048))
+RESPONSE_MAX_BYTES   = int(os.getenv("XIV_CACHE_MAX_BYTES", 64*1024*1024))
+DISK_CACHE_ENABLED  = os.getenv("XIV_DISK_CACHE", "0").lower() in ("1", "true", "yes")
+DISK_CACHE_TTL      = float(os.getenv("XIV_DISK_CACHE_TTL", 7*24*60*60))
+
+CACHES = {}
+
+class TTLCache(object):
+  def __init__(self, name, max_entries=1024, max_bytes=None):
+    self.name = name
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self._data = OrderedDict() # key -> (expires_at, size, value)
+    self._lock = threading.Lock()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+    CACHES[name] = self
+    return
+
+  def __repr__(self):
+    return f"<TTLCache({self.name}, {len(self._data)} entries)>"
+
+  def __len__(self):
+    return len(self._data)
+
+  def get(self, key, default=None):
+    with self._lock:
+      entry = self._data.get(key)
+      if entry is None:
+        self.misses += 1
+        return default
+      expires_at, size, value = entry
+      if expires_at < time.monotonic():
+        self._remove(key)
+        self.expirations += 1
+        self.misses += 1
+        return default
+      self._data.move_to_end(key)
+      self.hits += 1
+      return value
+
+  def set(self, key, value, ttl, size=0):
+    with self._lock:
+      if key in self._data:
+        self._remove(key)
+      self._data[key] = (time.monotonic()+ttl, size, value)
+      self.bytes += size
+      while len(self._data) > self.max_entries or \
+            (self.max_bytes is not None and self.bytes > self.max_bytes and len(self._data) > 1):
+        self._remove(next(iter(self._data)))
+        self.evictions += 1
+    return
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+      self.bytes = 0
+    return
+
+  def _remove(self, key):
+    _, size, _ = self._data.pop(key)
+    self.bytes -= size
+    return
+
+  def stats(self):
+    return {"entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations}
+
+def ttl_cache(ttl, max_entries=256):
+  # Drop-in replacement for @lru_cache with expiry and a size cap. Works on
+  # both plain and coroutine functions; exceptions are never cached.
+  def decorator(func):
+    cache = TTLCache(f"{func.__module__}.{func.__qualname__}", max_entries=max_entries)
+    _missing = object()
+    if asyncio.iscoroutinefunction(func):
+      @wraps(func)
+      async def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        value = cache.get(key, _missing)
+        if value is _missing:
+          value = await func(*args, **kwargs)
+          cache.set(key, value, ttl)
+        return value
+    else:
+      @wraps(func)
+      def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        value = cache.get(key, _missing)
+        if value is _missing:
+          value = func(*args, **kwargs)
+          cache.set(key, value, ttl)
+        return value
+    wrapper.cache = cache
+    return wrapper
+  return decorator
+
+def is_market_url(url):
+  if url.startswith(UNIVERSALIS_URL):
+    return not url.startswith((f"{UNIVERSALIS_URL}/worlds", f"{UNIVERSALIS_URL}/data-centers"))
+  return False
+
+def ttl_for_url(url):
+  # Static game data changes with patches, market listings change constantly.
+  return MARKET_TTL if is_market_url(url) else STATIC_TTL
+
+def normalize_url(url):
+  # Cache key for a URL: lower-cased scheme/host, sorted query parameters and
+  # no API key, so the same request always maps to the same entry.
+  parts = urlsplit(url)
+  query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "private_key")
+  return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), urlencode(query), ""))
+
+RESPONSES = TTLCache("responses", max_entries=RESPONSE_MAX_ENTRIES, max_bytes=RESPONSE_MAX_BYTES)
+
+
+class SingleFlight(object):
+  # Concurrent callers asking for the same key share one in-flight call.
+  def __init__(self, name):
+    self.name = name
+    self._lock = threading.Lock()
+    self._calls = {} # key -> [event, result, exception]
+    self.calls = 0
+    self.coalesced = 0
+    FLIGHTS[name] = self
+    return
+
+  def __repr__(self):
+    return f"<SingleFlight({self.name}, {len(self._calls)} in flight)>"
+
+  def do(self, key, func, *args):
+    with self._lock:
+      call = self._calls.get(key)
+      leader = call is None
+      if leader:
+        call = self._calls[key] = [threading.Event(), None, None]
+        self.calls += 1
+      else:
+        self.coalesced += 1
+    if not leader:
+      call[0].wait()
+    else:
+      try:
+        call[1] = func(*args)
+      except Exception as err:
+        call[2] = err
+      finally:
+        with self._lock:
+          del self._calls[key]
+        call[0].set()
+    if call[2] is not None:
+      raise call[2]
+    return call[1]
+
+  def stats(self):
+    return {"in_flight": len(self._calls), "calls": self.calls, "coalesced": self.coalesced}
+
+class AsyncSingleFlight(object):
+  def __init__(self, name):
+    self.name = name
+    self._calls = {} # key -> task
+    self.calls = 0
+    self.coalesced = 0
+    FLIGHTS[name] = self
+    return
+
+  def __repr__(self):
+    return f"<AsyncSingleFlight({self.name}, {len(self._calls)} in flight)>"
+
+  async def do(self, key, func, *args):
+    task = self._calls.get(key)
+    if task is None:
+      task = asyncio.ensure_future(func(*args))
+      self._calls[key] = task
+      task.add_done_callback(lambda t: self._calls.pop(key) if self._calls.get(key) is t else None)
+      self.calls += 1
+    else:
+      self.coalesced += 1
+    # Shielded so one caller giving up doesn't cancel the fetch for the others
+    return await asyncio.shield(task)
+
+  def stats(self):
+    return {"in_flight": len(self._calls), "calls": self.calls, "coalesced": self.coalesced}
+
+FLIGHTS = {}
+FETCHES = SingleFlight("fetches")
+ASYNC_FETCHES = AsyncSingleFlight("async_fetches")
+
+
+class DiskEntry(object):
+  def __init__(self, body, fetched_at, etag, last_modified):
+    self.body = body
+    self.fetched_at = fetched_at
+    self.etag = etag
+    self.last_modified = last_modified
+    return
+
+  def __repr__(self):
+    return f"<DiskEntry({len(self.body)} chars, {self.age:.0f}s old)>"
+
+  @property
+  def age(self):
+    return time.time() - self.fetched_at
+
+  @property
+  def fresh(self):
+    return self.age < DISK_CACHE_TTL
+
+  def conditional_headers(self):
+    headers = {}
+    if self.etag:
+      headers["If-None-Match"] = self.etag
+    if self.last_modified:
+      headers["If-Modified-Since"] = self.last_modified
+    return headers
+
+class DiskCache(object):
+  # Persistent cache for static (non-market) responses so a restart doesn't
+  # re-fetch game data. Entries past DISK_CACHE_TTL are revalidated with
+  # ETag/Last-Modified instead of being thrown away.
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                       "url TEXT PRIMARY KEY, body TEXT NOT NULL, fetched_at REAL NOT NULL, "
+                       "etag TEXT, last_modified TEXT)")
+    self._conn.commit()
+    self.hits = 0
+    self.misses = 0
+    self.revalidations = 0
+    return
+
+  def __repr__(self):
+    return f"<DiskCache({self.path})>"
+
+  def get(self, url):
+    with self._lock:
+      row = self._conn.execute("SELECT body, fetched_at, etag, last_modified FROM responses WHERE url = ?",
+                               (normalize_url(url),)).fetchone()
+    if row is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return DiskEntry(*row)
+
+  def set(self, url, body, etag=None, last_modified=None):
+    with self._lock:
+      self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                         (normalize_url(url), body, time.time(), etag, last_modified))
+      self._conn.commit()
+    return
+
+  def touch(self, url):
+    with self._lock:
+      self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), normalize_url(url)))
+      self._conn.commit()
+    self.revalidations += 1
+    return
+
+  def stats(self):
+    with self._lock:
+      entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()
+    return {"entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations}
+
+DISK = DiskCache(HTTP_CACHE_PATH) if DISK_CACHE_ENABLED else None
+
+def disk_entry(url):
+  if DISK is None or is_market_url(url):
+    return None
+  return DISK.get(url)
+
+def disk_store(url, response):
+  if DISK is None or is_market_url(url):
+    return
+  DISK.set(url, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+  return
+
+def stats():
+  output = {name: cache.stats() for name, cache in CACHES.items()}
+  if DISK is not None:
+    output["disk"] = DISK.stats()
+  return output
+
+def flight_stats():
+  return {name: flight.stats() for name, flight in FLIGHTS.items()}
@@ -0,0 +1,195 @@
+from array import array
+import json
+import mmap
+import os
+import os.path as op
+import struct
+import sys
+
+# Compact column-oriented storage for the OfflineData tables. Files are
+# mmap'd on open and values are decoded only when a cell is read, so the bot
+# doesn't have to parse (and keep) every JSON dict just to use a few columns.
+#
+# Layout: MAGIC, a little-endian uint32 header length, a JSON header listing
+# each column's kind and byte ranges, then the 8-byte aligned column data.
+#   int/float: one int64/float64 per row
+#   str/json:  uint64 offsets (rows+1 of them) followed by the UTF-8 bytes;
+#              json cells are decoded with json.loads when read
+
+MAGIC = b"XIVCOL1\n"
+SUFFIX = ".bin"
+_ALIGN = 8
+_TYPECODES = {"int": "q", "float": "d"}
+
+def columnar_path(file_name):
+  return op.splitext(file_name)[0] + SUFFIX
+
+def _kind_of(values):
+  if all(type(v) is int for v in values):
+    return "int"
+  if all(type(v) in (int, float) for v in values):
+    return "float"
+  if all(type(v) is str for v in values):
+    return "str"
+  return "json"
+
+def _records_from_json(obj):
+  # A list of flat dicts, or a dict of dicts keyed by id (item_ids_to_names)
+  if isinstance(obj, dict):
+    return [dict({"key": k}, **v) for k, v in obj.items()], "key"
+  return obj, None
+
+def write_table(records, file_name, key=None):
+  names = list(dict.fromkeys(k for record in records for k in record))
+  header = {"rows": len(records), "key": key, "columns": []}
+  sections = []
+  offset = 0
+  def add_section(data):
+    nonlocal offset
+    start = offset
+    padding = -len(data) % _ALIGN
+    sections.append(data + b"\0"*padding)
+    offset += len(data) + padding
+    return [start, len(data)]
+  for name in names:
+    # Missing keys only survive the round trip as json nulls
+    values = [record.get(name) for record in records]
+    kind = _kind_of(values) if all(name in record for record in records) else "json"
+    spec = {"name": name, "kind": kind}
+    if kind in _TYPECODES:
+      spec["values"] = add_section(array(_TYPECODES[kind], values).tobytes())
+    else:
+      encoded = [(v if kind == "str" else json.dumps(v)).encode("utf-8") for v in values]
+      offsets = array("Q", [0])
+      for cell in encoded:
+        offsets.append(offsets[-1] + len(cell))
+      spec["offsets"] = add_section(offsets.tobytes())
+      spec["data"] = add_section(b"".join(encoded))
+    header["columns"].append(spec)
+  header_bytes = json.dumps(header).encode("utf-8")
+  preamble = MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes
+  preamble += b"\0"*(-len(preamble) % _ALIGN)
+  tmp_name = file_name + ".tmp"
+  with open(tmp_name, "wb") as f:
+    f.write(preamble)
+    for section in sections:
+      f.write(section)
+  os.replace(tmp_name, file_name)
+  return
+
+def convert(json_file_name, output_file_name=None):
+  output_file_name = output_file_name or columnar_path(json_file_name)
+  with open(json_file_name, "r", encoding="utf-8") as f:
+    records, key = _records_from_json(json.load(f))
+  write_table(records, output_file_name, key)
+  return output_file_name
+
+
+class Column(object):
+  def __init__(self, buffer, spec, rows):
+    self.name = spec["name"]
+    self.kind = spec["kind"]
+    self._rows = rows
+    if self.kind in _TYPECODES:
+      start, length = spec["values"]
+      self._values = buffer[start:start+length].cast(_TYPECODES[self.kind])
+    else:
+      start, length = spec["offsets"]
+      self._offsets = buffer[start:start+length].cast("Q")
+      start, length = spec["data"]
+      self._data = buffer[start:start+length]
+    return
+
+  def __repr__(self):
+    return f"<Column({self.name}, {self.kind}, {self._rows} rows)>"
+
+  def __len__(self):
+    return self._rows
+
+  def raw(self, ix):
+    # Undecoded UTF-8 bytes of a str/json cell
+    return bytes(self._data[self._offsets[ix]:self._offsets[ix+1]])
+
+  def __getitem__(self, ix):
+    if isinstance(ix, slice):
+      return [self[i] for i in range(*ix.indices(self._rows))]
+    if ix < 0:
+      ix += self._rows
+    if not 0 <= ix < self._rows:
+      raise IndexError(f"{self.name}: row {ix} out of range")
+    if self.kind in _TYPECODES:
+      return self._values[ix]
+    value = self.raw(ix).decode("utf-8")
+    return json.loads(value) if self.kind == "json" else value
+
+  def __iter__(self):
+    for ix in range(self._rows):
+      yield self[ix]
+
+  def tolist(self):
+    if self.kind in _TYPECODES:
+      return self._values.tolist()
+    return list(self)
+
+class ColumnarTable(object):
+  # Read-only, lazily decoded table. Iterating or indexing gives row dicts so
+  # it can stand in for the list of dicts load_json_from_local returns.
+  def __init__(self, file_name):
+    self.file_name = file_name
+    with open(file_name, "rb") as f:
+      self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if self._mmap[:len(MAGIC)] != MAGIC:
+      raise ValueError(f"{file_name} is not a columnar table")
+    header_length, = struct.unpack_from("<I", self._mmap, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    header = json.loads(self._mmap[header_start:header_start+header_length].decode("utf-8"))
+    data_start = header_start + header_length
+    data_start += -data_start % _ALIGN
+    buffer = memoryview(self._mmap)[data_start:]
+    self.rows = header["rows"]
+    self.key = header["key"]
+    self._specs = {spec["name"]: spec for spec in header["columns"]}
+    self._buffer = buffer
+    self._columns = {}
+    return
+
+  def __repr__(self):
+    return f"<ColumnarTable({self.file_name}, {self.rows} rows, {len(self._specs)} columns)>"
+
+  def __len__(self):
+    return self.rows
+
+  @property
+  def column_names(self):
+    return list(self._specs)
+
+  def column(self, name):
+    if name not in self._columns:
+      self._columns[name] = Column(self._buffer, self._specs[name], self.rows)
+    return self._columns[name]
+
+  def row(self, ix):
+    return {name: self.column(name)[ix] for name in self._specs}
+
+  def __getitem__(self, ix):
+    if isinstance(ix, slice):
+      return [self.row(i) for i in range(*ix.indices(self.rows))]
+    return self.row(ix)
+
+  def __iter__(self):
+    for ix in range(self.rows):
+      yield self.row(ix)
+
+def is_current(file_name, path=None):
+  # True if the columnar copy of a JSON file exists and is at least as new
+  path = path or columnar_path(file_name)
+  if not op.exists(path):
+    return False
+  return not op.exists(file_name) or op.getmtime(path) >= op.getmtime(file_name)
+
+def open_table(file_name):
+  return ColumnarTable(columnar_path(file_name)) if is_current(file_name) else None
+
+if __name__ == "__main__":
+  for json_file_name in sys.argv[1:]:
+    print(f"Converted {json_file_name} -> {convert(json_file_name)}")
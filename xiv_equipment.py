@@ -0,0 +1,56 @@
+from bisect import bisect_right
+import os.path as op
+
+from global_paths import *
+import xiv_tools as xivt
+
+# Local catalogue of tradable equipment (built by process_offline_data.py)
+# answering "best item for this slot at or below this ilvl for this job"
+# without an XIVAPI search.
+
+EQUIP_SLOTS = ["MainHand", "OffHand", "Head", "Body", "Gloves", "Legs",
+               "Feet", "Ears", "Neck", "Wrists", "FingerR"]
+EQUIP_JOBS = ["GLA", "PLD", "MRD", "WAR", "DRK", "GNB", "PGL", "MNK", "LNC",
+              "DRG", "ROG", "NIN", "SAM", "RPR", "CNJ", "WHM", "SCH", "AST",
+              "SGE", "ARC", "BRD", "MCH", "DNC", "THM", "BLM", "ACN", "SMN",
+              "RDM", "BLU", "CRP", "BSM", "ARM", "GSM", "LTW", "WVR", "ALC",
+              "CUL", "MIN", "BTN", "FSH"]
+
+class EquipmentCatalogue(object):
+  def __init__(self, items):
+    # (slot, job) -> parallel lists sorted by (ilvl, id)
+    index = {}
+    for item in items:
+      if item.get("untradable"):
+        continue
+      for slot in item["slots"]:
+        for job in item["jobs"]:
+          index.setdefault((slot, job), []).append((item["ilvl"], item["id"], item["name"]))
+    self._ilvls = {}
+    self._names = {}
+    for key, entries in index.items():
+      entries.sort()
+      self._ilvls[key] = [e[0] for e in entries]
+      self._names[key] = [e[2] for e in entries]
+    self.num_items = len(items)
+    return
+
+  def __repr__(self):
+    return f"<EquipmentCatalogue({self.num_items} items)>"
+
+  def search(self, slot, ilvl, job, limit=1):
+    # Same shape as an XIVAPI /search response sorted by LevelItem desc
+    key = (slot, job.upper())
+    if key not in self._ilvls:
+      return {"Results": []}
+    end = bisect_right(self._ilvls[key], int(ilvl))
+    names = self._names[key][max(0, end-limit):end][::-1]
+    return {"Results": [{"Name": name} for name in names]}
+
+__CATALOGUE = None
+def catalogue():
+  # None until process_offline_data.py has built the catalogue file
+  global __CATALOGUE
+  if __CATALOGUE is None and op.exists(PROCESSED_EQUIPMENT_PATH):
+    __CATALOGUE = EquipmentCatalogue(xivt.load_table(PROCESSED_EQUIPMENT_PATH))
+  return __CATALOGUE
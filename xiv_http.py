@@ -0,0 +1,260 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+import logging
+import os
+import random
+import threading
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import xiv_cache as xivc
+import xiv_metrics as xivm
+import xiv_scheduler as xivs
+import xiv_tape as xivtp
+
+# Shared HTTP client for the sync (requests) and async (aiohttp) code paths.
+# Both keep connections alive per host, time out stuck sockets and retry
+# transient failures with jittered exponential backoff.
+
+load_dotenv()
+CONNECT_TIMEOUT      = float(os.getenv("XIV_HTTP_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT         = float(os.getenv("XIV_HTTP_READ_TIMEOUT", 20))
+CONNECTIONS_PER_HOST = int(os.getenv("XIV_HTTP_CONNECTIONS_PER_HOST", 8))
+MAX_RETRIES          = int(os.getenv("XIV_HTTP_MAX_RETRIES", 3))
+BACKOFF_BASE         = float(os.getenv("XIV_HTTP_BACKOFF_BASE", 0.5))
+BACKOFF_CAP          = float(os.getenv("XIV_HTTP_BACKOFF_CAP", 10))
+RETRY_AFTER_MAX      = float(os.getenv("XIV_HTTP_RETRY_AFTER_MAX", 300)) # sanity limit on what servers ask for
+DEADLINE             = float(os.getenv("XIV_HTTP_DEADLINE", 30)) # interactive requests, retries included
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class HttpResponse(object):
+  def __init__(self, status, text, headers):
+    self.status = status
+    self.text = text
+    self.headers = headers
+    return
+
+  def __repr__(self):
+    return f"<HttpResponse({self.status}, {len(self.text)} chars)>"
+
+class HttpStats(object):
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.requests = 0
+    self.new_connections = 0
+    self.reused_connections = 0
+    self.retries = 0
+    self.failures = 0
+    return
+
+  def __repr__(self):
+    return f"<HttpStats({self.as_dict()})>"
+
+  def add(self, **counts):
+    with self._lock:
+      for k, v in counts.items():
+        setattr(self, k, getattr(self, k) + v)
+    return
+
+  def as_dict(self):
+    return {"requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "retries": self.retries,
+            "failures": self.failures}
+
+STATS = HttpStats()
+
+def retry_delay(attempt, headers=None):
+  # Honour Retry-After (seconds or an HTTP date) when the server sends one,
+  # otherwise use "full jitter" exponential backoff. BACKOFF_CAP only limits
+  # our own backoff; retrying before the server's Retry-After just gets
+  # throttled again.
+  retry_after = (headers or {}).get("Retry-After")
+  if retry_after:
+    try:
+      return min(RETRY_AFTER_MAX, max(0, float(retry_after)))
+    except ValueError:
+      try:
+        return min(RETRY_AFTER_MAX, max(0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+      except (TypeError, ValueError):
+        pass
+  return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE*2**attempt))
+
+def next_retry(url, started, attempt, headers=None):
+  # Seconds to wait before retrying, or None to give up now. Interactive
+  # requests (a user is waiting on a Discord command) fail instead of
+  # sleeping past DEADLINE; background work honours long Retry-Afters.
+  delay = retry_delay(attempt, headers)
+  if xivs.current_priority() == xivs.INTERACTIVE and time.monotonic()-started+delay > DEADLINE:
+    logging.warning(f"GET {xivc.normalize_url(url)}: giving up rather than waiting {delay:.1f}s past the {DEADLINE:g}s deadline")
+    return None
+  return delay
+
+
+# --- sync ------------------------------------------------------------------
+_CONNECTION_CREATED = threading.local()
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+  def _new_conn(self):
+    _CONNECTION_CREATED.value = True
+    return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+  def _new_conn(self):
+    _CONNECTION_CREATED.value = True
+    return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+  def init_poolmanager(self, *args, **kwargs):
+    super().init_poolmanager(*args, **kwargs)
+    self.poolmanager.pool_classes_by_scheme = {"http": _CountingHTTPConnectionPool,
+                                               "https": _CountingHTTPSConnectionPool}
+    return
+
+__SESSION = None
+__SESSION_LOCK = threading.Lock()
+def session():
+  global __SESSION
+  with __SESSION_LOCK:
+    if __SESSION is None:
+      __SESSION = requests.Session()
+      adapter = _CountingAdapter(pool_connections=4, pool_maxsize=CONNECTIONS_PER_HOST, pool_block=True)
+      __SESSION.mount("http://", adapter)
+      __SESSION.mount("https://", adapter)
+  return __SESSION
+
+def _replayed(url, entry):
+  if entry is None:
+    logging.warning(f"GET {xivc.normalize_url(url)} is not on the tape {xivtp.TAPE_PATH}")
+    STATS.add(failures=1)
+    return HttpResponse(0, "", {})
+  return HttpResponse(entry.status, entry.text, entry.headers)
+
+def replay(url):
+  with xivm.span("rate_limit_wait"):
+    xivs.acquire(url)
+  with xivm.span("upstream_http") as request_span:
+    entry, delay = xivtp.replay(url)
+    time.sleep(delay)
+    response = _replayed(url, entry)
+    request_span.fields.update(status=response.status, bytes=len(response.text))
+  xivm.observe_http(url, response.status, len(response.text), request_span.duration)
+  return response
+
+def get(url, headers=None):
+  if xivtp.REPLAYING:
+    return replay(url)
+  started = time.monotonic()
+  for attempt in range(MAX_RETRIES+1):
+    with xivm.span("rate_limit_wait"):
+      xivs.acquire(url)
+    _CONNECTION_CREATED.value = False
+    with xivm.span("upstream_http") as request_span:
+      try:
+        response = session().get(url, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+      except requests.RequestException as err: # like aiohttp.ClientError on the async side
+        response = None
+        logging.warning(f"GET {xivc.normalize_url(url)} failed: {err}")
+      finally:
+        if _CONNECTION_CREATED.value:
+          STATS.add(requests=1, new_connections=1)
+        else:
+          STATS.add(requests=1, reused_connections=1)
+      request_span.fields.update(status=0 if response is None else response.status_code,
+                                 bytes=0 if response is None else len(response.content))
+    xivm.observe_http(url, request_span.fields["status"], request_span.fields["bytes"], request_span.duration)
+    if response is not None and response.status_code not in RETRY_STATUSES:
+      response = HttpResponse(response.status_code, response.text, response.headers)
+      xivtp.record(url, response, request_span.duration)
+      return response
+    if attempt == MAX_RETRIES:
+      break
+    delay = next_retry(url, started, attempt, response.headers if response is not None else None)
+    if delay is None:
+      break
+    STATS.add(retries=1)
+    time.sleep(delay)
+  STATS.add(failures=1)
+  if response is None:
+    return HttpResponse(0, "", {})
+  return HttpResponse(response.status_code, response.text, response.headers)
+
+
+# --- async -----------------------------------------------------------------
+async def _on_connection_create_end(session, context, params):
+  STATS.add(new_connections=1)
+
+async def _on_connection_reuseconn(session, context, params):
+  STATS.add(reused_connections=1)
+
+async def _on_request_start(session, context, params):
+  STATS.add(requests=1)
+
+__ASYNC_SESSION = None
+def async_session():
+  global __ASYNC_SESSION
+  if __ASYNC_SESSION is None or __ASYNC_SESSION.closed:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_request_start.append(_on_request_start)
+    __ASYNC_SESSION = aiohttp.ClientSession(
+      connector=aiohttp.TCPConnector(limit_per_host=CONNECTIONS_PER_HOST),
+      timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+      trace_configs=[trace_config])
+  return __ASYNC_SESSION
+
+async def async_replay(url):
+  with xivm.span("rate_limit_wait"):
+    await xivs.async_acquire(url)
+  with xivm.span("upstream_http") as request_span:
+    entry, delay = xivtp.replay(url)
+    await asyncio.sleep(delay)
+    response = _replayed(url, entry)
+    request_span.fields.update(status=response.status, bytes=len(response.text))
+  xivm.observe_http(url, response.status, len(response.text), request_span.duration)
+  return response
+
+async def async_get(url, headers=None):
+  if xivtp.REPLAYING:
+    return await async_replay(url)
+  status, text, response_headers = 0, "", {}
+  started = time.monotonic()
+  for attempt in range(MAX_RETRIES+1):
+    with xivm.span("rate_limit_wait"):
+      await xivs.async_acquire(url)
+    with xivm.span("upstream_http") as request_span:
+      try:
+        async with async_session().get(url, headers=headers) as response:
+          status, text, response_headers = response.status, await response.text(), response.headers
+          body = await response.read() # already buffered by text()
+      except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        body, status, text, response_headers = b"", 0, "", {}
+        logging.warning(f"GET {xivc.normalize_url(url)} failed: {err!r}")
+      request_span.fields.update(status=status, bytes=len(body))
+    xivm.observe_http(url, status, len(body), request_span.duration)
+    if status and status not in RETRY_STATUSES:
+      response = HttpResponse(status, text, response_headers)
+      xivtp.record(url, response, request_span.duration)
+      return response
+    if attempt == MAX_RETRIES:
+      break
+    delay = next_retry(url, started, attempt, response_headers)
+    if delay is None:
+      break
+    STATS.add(retries=1)
+    await asyncio.sleep(delay)
+  STATS.add(failures=1)
+  return HttpResponse(status, text, response_headers)
+
+async def close():
+  global __ASYNC_SESSION
+  if __ASYNC_SESSION is not None and not __ASYNC_SESSION.closed:
+    await __ASYNC_SESSION.close()
+  __ASYNC_SESSION = None
@@ -0,0 +1,92 @@
+from bisect import bisect_left
+import json
+import os
+import os.path as op
+
+from dotenv import load_dotenv
+
+import xiv_columnar as xivcol
+
+# Item id <-> name table backed by two mmap'd columnar files written next to
+# item_ids_to_names.txt:
+#   <name>.bin         one row per item id (ascending), one str column per language
+#   <name>_lookup.bin  lower-cased names (every language) sorted, with their ids
+# Names are decoded only when asked for, and only the languages picked at
+# load time are opened at all.
+
+load_dotenv()
+LANGS = [lang.strip() for lang in os.getenv("XIV_ITEM_NAME_LANGS", "en").split(",") if lang.strip()]
+
+def store_paths(json_file_name):
+  base = op.splitext(json_file_name)[0]
+  return base + xivcol.SUFFIX, base + "_lookup" + xivcol.SUFFIX
+
+def build(json_file_name):
+  store_path, lookup_path = store_paths(json_file_name)
+  with open(json_file_name, "r", encoding="utf-8") as f:
+    data = json.load(f)
+  langs = list(dict.fromkeys(lang for names in data.values() for lang in names))
+  rows = [dict({"id": int(item_id)}, **{lang: names.get(lang) or "" for lang in langs})
+          for item_id, names in data.items()]
+  rows.sort(key=lambda row: row["id"])
+  # English names win over other languages, earlier ids win over later ones
+  index = {}
+  for item_id, names in data.items():
+    if names.get("en"):
+      index.setdefault(names["en"].strip().lower(), int(item_id))
+  for item_id, names in data.items():
+    for name in names.values():
+      if name:
+        index.setdefault(name.strip().lower(), int(item_id))
+  xivcol.write_table(rows, store_path)
+  xivcol.write_table([{"name": name, "id": index[name]} for name in sorted(index)], lookup_path)
+  return store_path, lookup_path
+
+def is_current(json_file_name):
+  return all(xivcol.is_current(json_file_name, path) for path in store_paths(json_file_name))
+
+class ItemNameStore(object):
+  def __init__(self, json_file_name, langs=LANGS):
+    store_path, lookup_path = store_paths(json_file_name)
+    table = xivcol.ColumnarTable(store_path)
+    self._ids = table.column("id")
+    self._names = {lang: table.column(lang) for lang in langs if lang in table.column_names}
+    lookup = xivcol.ColumnarTable(lookup_path)
+    self._lookup_names = lookup.column("name")
+    self._lookup_ids = lookup.column("id")
+    return
+
+  def __repr__(self):
+    return f"<ItemNameStore({len(self)} items, {', '.join(self._names)})>"
+
+  def __len__(self):
+    return len(self._ids)
+
+  def name(self, item_id, lang="en"):
+    if lang not in self._names:
+      raise KeyError(f"Item names for language {lang!r} were not loaded")
+    item_id = int(item_id)
+    ix = bisect_left(self._ids, item_id)
+    if ix == len(self._ids) or self._ids[ix] != item_id:
+      raise KeyError(item_id)
+    name = self._names[lang][ix]
+    if not name:
+      raise KeyError(item_id)
+    return name
+
+  def names(self, lang="en"):
+    return self._names[lang]
+
+  def item_id(self, name):
+    # Binary search over the raw UTF-8 bytes (same order as the sorted strs)
+    target = name.strip().lower().encode("utf-8")
+    lo, hi = 0, len(self._lookup_names)
+    while lo < hi:
+      mid = (lo+hi)//2
+      if self._lookup_names.raw(mid) < target:
+        lo = mid+1
+      else:
+        hi = mid
+    if lo < len(self._lookup_names) and self._lookup_names.raw(lo) == target:
+      return str(self._lookup_ids[lo])
+    return 0
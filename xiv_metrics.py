@@ -0,0 +1,222 @@
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+# Timing spans and Prometheus-style metrics. Every span is observed into a
+# latency histogram labelled with the bot command it ran under, and is also
+# appended to that command's trace so the bot can log a per-command
+# breakdown. render() produces the Prometheus text format, served on
+# XIV_METRICS_PORT and/or logged every XIV_METRICS_LOG_INTERVAL seconds.
+
+load_dotenv()
+METRICS_PORT = int(os.getenv("XIV_METRICS_PORT", 0))
+METRICS_LOG_INTERVAL = float(os.getenv("XIV_METRICS_LOG_INTERVAL", 0))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REGISTRY = {}
+# Own logger so the bot's root level (25) doesn't swallow the metrics output
+LOGGER = logging.getLogger("xiv_metrics")
+LOGGER.setLevel(logging.INFO)
+
+def _label_str(labelnames, labels):
+  if not labelnames:
+    return ""
+  pairs = ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in zip(labelnames, labels))
+  return "{" + pairs + "}"
+
+class Counter(object):
+  def __init__(self, name, help_text, labelnames=()):
+    self.name = name
+    self.help_text = help_text
+    self.labelnames = labelnames
+    self._values = defaultdict(float)
+    self._lock = threading.Lock()
+    REGISTRY[name] = self
+    return
+
+  def __repr__(self):
+    return f"<Counter({self.name})>"
+
+  def inc(self, amount=1, **labels):
+    key = tuple(labels.get(k, "") for k in self.labelnames)
+    with self._lock:
+      self._values[key] += amount
+    return
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+    with self._lock:
+      for key, value in sorted(self._values.items()):
+        lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value:g}")
+    return "\n".join(lines)
+
+class Histogram(object):
+  def __init__(self, name, help_text, labelnames=(), buckets=BUCKETS):
+    self.name = name
+    self.help_text = help_text
+    self.labelnames = labelnames
+    self.buckets = buckets
+    self._values = {} # labels -> [count per bucket..., sum, count]
+    self._lock = threading.Lock()
+    REGISTRY[name] = self
+    return
+
+  def __repr__(self):
+    return f"<Histogram({self.name})>"
+
+  def observe(self, value, **labels):
+    key = tuple(labels.get(k, "") for k in self.labelnames)
+    with self._lock:
+      entry = self._values.setdefault(key, [0]*(len(self.buckets)+2))
+      for ix, bound in enumerate(self.buckets):
+        if value <= bound:
+          entry[ix] += 1
+      entry[-2] += value
+      entry[-1] += 1
+    return
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+    with self._lock:
+      for key, entry in sorted(self._values.items()):
+        for bound, count in zip(self.buckets, entry):
+          labels = _label_str(self.labelnames + ("le",), key + (f"{bound:g}",))
+          lines.append(f"{self.name}_bucket{labels} {count}")
+        lines.append(f"{self.name}_bucket{_label_str(self.labelnames + ('le',), key + ('+Inf',))} {entry[-1]}")
+        lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {entry[-2]:.6f}")
+        lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {entry[-1]}")
+    return "\n".join(lines)
+
+SPAN_SECONDS = Histogram("xiv_span_seconds", "Time spent in each traced stage.", ("span", "command"))
+COMMAND_SECONDS = Histogram("xiv_command_seconds", "End-to-end bot command latency.", ("command",))
+COMMANDS = Counter("xiv_commands_total", "Bot commands handled.", ("command", "outcome"))
+UPSTREAM_SECONDS = Histogram("xiv_upstream_request_seconds", "Upstream HTTP request latency per attempt.", ("host", "status"))
+UPSTREAM_BYTES = Counter("xiv_upstream_response_bytes_total", "Upstream HTTP response body size.", ("host",))
+
+
+class Span(object):
+  def __init__(self, name, fields):
+    self.name = name
+    self.fields = fields # extra detail for the trace log, e.g. status/bytes
+    self.start = time.perf_counter()
+    self.duration = None
+    return
+
+  def __repr__(self):
+    return f"<Span({self.name}, {self.duration})>"
+
+class Trace(object):
+  def __init__(self, command):
+    self.command = command
+    self.started = time.perf_counter()
+    self.spans = [] # appended to from worker threads and tasks alike
+    self.elapsed = None
+    return
+
+  def __repr__(self):
+    return f"<Trace({self.command}, {len(self.spans)} spans)>"
+
+  def summary(self):
+    # Cumulative time per stage; concurrent spans overlap, so these can add
+    # up to more than the wall time.
+    totals = {}
+    for s in list(self.spans):
+      total = totals.setdefault(s.name, [0, 0, 0])
+      total[0] += s.duration
+      total[1] += 1
+      total[2] += s.fields.get("bytes", 0)
+    parts = []
+    for name, (seconds, count, size) in sorted(totals.items(), key=lambda x: -x[1][0]):
+      parts.append(f"{name} {seconds:.2f}s x{count}" + (f" ({size:,} bytes)" if size else ""))
+    return ", ".join(parts)
+
+_COMMAND = contextvars.ContextVar("xiv_command", default="none")
+_TRACE = contextvars.ContextVar("xiv_trace", default=None)
+
+def start_trace(command):
+  trace = Trace(command)
+  _COMMAND.set(command)
+  _TRACE.set(trace)
+  return trace
+
+def finish_trace(trace, outcome="ok"):
+  # Only the first call counts, so error handlers can call it unconditionally
+  if trace.elapsed is not None:
+    return None
+  trace.elapsed = time.perf_counter() - trace.started
+  COMMAND_SECONDS.observe(trace.elapsed, command=trace.command)
+  COMMANDS.inc(command=trace.command, outcome=outcome)
+  return trace.elapsed
+
+@contextmanager
+def span(name, **fields):
+  current = Span(name, fields)
+  try:
+    yield current
+  finally:
+    current.duration = time.perf_counter() - current.start
+    SPAN_SECONDS.observe(current.duration, span=name, command=_COMMAND.get())
+    trace = _TRACE.get()
+    if trace is not None:
+      trace.spans.append(current)
+
+def timed(name):
+  # Decorator form of span() for plain and coroutine functions
+  def decorator(func):
+    if asyncio.iscoroutinefunction(func):
+      @wraps(func)
+      async def wrapper(*args, **kwargs):
+        with span(name):
+          return await func(*args, **kwargs)
+    else:
+      @wraps(func)
+      def wrapper(*args, **kwargs):
+        with span(name):
+          return func(*args, **kwargs)
+    return wrapper
+  return decorator
+
+def observe_http(url, status, size, seconds):
+  host = urlsplit(url).netloc
+  UPSTREAM_SECONDS.observe(seconds, host=host, status=str(status))
+  UPSTREAM_BYTES.inc(size, host=host)
+  return
+
+def render():
+  return "\n".join(metric.render() for metric in REGISTRY.values()) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    if self.path.rstrip("/") not in ("", "/metrics"):
+      self.send_error(404)
+      return
+    body = render().encode("utf-8")
+    self.send_response(200)
+    self.send_header("Content-Type", "text/plain; version=0.0.4")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+    return
+
+  def log_message(self, *args):
+    return
+
+def serve(port=METRICS_PORT, host="127.0.0.1"):
+  server = ThreadingHTTPServer((host, port), _MetricsHandler)
+  threading.Thread(target=server.serve_forever, name="xiv-metrics", daemon=True).start()
+  LOGGER.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+  return server
+
+def dump():
+  LOGGER.info("Metrics:\n" + render())
+  return
@@ -0,0 +1,155 @@
+from collections import Counter, OrderedDict
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+import async_xiv_web_tools as axivwt
+import xiv_cache as xivc
+import xiv_scheduler as xivs
+
+# Keeps the $ventures/$scrips/$collectibles rankings warm for the worlds
+# people actually ask about, so those commands can answer from memory.
+# Targets come from XIV_WARM_TARGETS ("ventures:Excalibur,scrips:Excalibur:white")
+# plus the most-requested combinations seen by the bot.
+
+load_dotenv()
+REFRESH_INTERVAL = float(os.getenv("XIV_RANKING_REFRESH_INTERVAL", 120))
+MAX_AGE          = float(os.getenv("XIV_RANKING_MAX_AGE", 300))
+TOP_REQUESTED    = int(os.getenv("XIV_RANKING_TOP_REQUESTED", 10))
+MAX_TRACKED      = int(os.getenv("XIV_RANKING_MAX_TRACKED", 256))
+COUNT_DECAY      = float(os.getenv("XIV_RANKING_COUNT_DECAY", 0.9)) # per refresh cycle
+
+COLLECTIBLE_CURRENCIES = {"white": "White Crafters' Scrips", "purple": "Purple Crafters' Scrips"}
+SCRIP_CURRENCIES = {"white": "White Crafters' Scrip", "purple": "Purple Crafters' Scrip"}
+
+async def _ventures(server):
+  return await axivwt.best_combat_ventures(server, n_results=10, v_cutoff=40, verbose=False)
+
+async def _scrips(server, currency):
+  return await axivwt.best_scrip_reward(server, SCRIP_CURRENCIES[currency], n_results=10, verbose=False)
+
+async def _collectibles(server, currency):
+  return await axivwt.best_collectible_to_craft(COLLECTIBLE_CURRENCIES[currency], server, n_results=10, verbose=False)
+
+RANKINGS = {"ventures": _ventures, "scrips": _scrips, "collectibles": _collectibles}
+CURRENCIES = {"ventures": None, "scrips": SCRIP_CURRENCIES, "collectibles": COLLECTIBLE_CURRENCIES}
+
+def parse_targets(spec):
+  # "kind:server[:currency],..." -> tuples; malformed entries are logged and
+  # dropped so one typo can't break the refresh loop
+  targets = []
+  for entry in [t.strip() for t in spec.split(",") if t.strip()]:
+    target = tuple(entry.split(":"))
+    kind, args = target[0], target[1:]
+    currencies = CURRENCIES.get(kind, {})
+    if kind not in RANKINGS or len(args) != (1 if currencies is None else 2) or not all(args):
+      logging.warning(f"Ignoring warm target {entry!r}: expected ventures:<server> or scrips|collectibles:<server>:<currency>")
+    elif currencies is not None and args[1].lower() not in currencies:
+      logging.warning(f"Ignoring warm target {entry!r}: currency must be one of {', '.join(currencies)}")
+    else:
+      targets.append(target)
+  return targets
+
+CONFIGURED_TARGETS = parse_targets(os.getenv("XIV_WARM_TARGETS", ""))
+
+class RankingTable(object):
+  def __init__(self, key, collection, table_str):
+    self.key = key
+    self.collection = collection
+    self.table_str = table_str
+    self.computed_at = time.time()
+    return
+
+  def __repr__(self):
+    return f"<RankingTable({':'.join(self.key)}, {self.age:.0f}s old)>"
+
+  @property
+  def age(self):
+    return time.time() - self.computed_at
+
+TABLES = OrderedDict()     # key -> RankingTable, least recently used first
+REQUEST_COUNTS = Counter() # key -> decayed number of successful requests
+ARGS = {}                  # key -> arguments as the user spelled them
+REFRESHES = xivc.AsyncSingleFlight("rankings")
+
+def ranking_key(kind, server, currency=None):
+  args = (server,) if currency is None else (server, currency.lower())
+  key = (kind,) + tuple(arg.lower() for arg in args)
+  ARGS.setdefault(key, args)
+  return key
+
+def record_request(kind, server, currency=None):
+  # Called once a command has succeeded, so typos never become warm targets
+  if kind in RANKINGS:
+    REQUEST_COUNTS[ranking_key(kind, server, currency)] += 1
+    _prune()
+  return
+
+def _prune():
+  # Bounded bookkeeping: least requested counts and least recently used
+  # tables go first, and ARGS only keeps keys something still refers to.
+  while len(REQUEST_COUNTS) > MAX_TRACKED:
+    del REQUEST_COUNTS[min(REQUEST_COUNTS, key=REQUEST_COUNTS.get)]
+  while len(TABLES) > MAX_TRACKED:
+    TABLES.popitem(last=False)
+  configured = {(t[0],) + tuple(arg.lower() for arg in t[1:]) for t in CONFIGURED_TARGETS}
+  for key in [key for key in ARGS if key not in REQUEST_COUNTS and key not in TABLES and key not in configured]:
+    del ARGS[key]
+  return
+
+def _age_counts():
+  # Decay so yesterday's favourites make way for what's asked about now
+  for key in list(REQUEST_COUNTS):
+    REQUEST_COUNTS[key] *= COUNT_DECAY
+    if REQUEST_COUNTS[key] < 0.5:
+      del REQUEST_COUNTS[key]
+  _prune()
+  return
+
+def warm_targets():
+  targets = [ranking_key(*t) for t in CONFIGURED_TARGETS]
+  for key, _ in REQUEST_COUNTS.most_common(TOP_REQUESTED):
+    if key not in targets:
+      targets.append(key)
+  return targets
+
+async def _compute(key, args):
+  collection, table_str = await RANKINGS[key[0]](*args)
+  TABLES[key] = RankingTable(key, collection, table_str)
+  TABLES.move_to_end(key)
+  _prune()
+  return TABLES[key]
+
+async def refresh(key, args=None):
+  # Concurrent refreshes of the same key share one computation, but only
+  # within a priority class: a cold interactive get never waits on a refresh
+  # the warm loop started at background priority.
+  return await REFRESHES.do((key, xivs.current_priority()), _compute, key, args or ARGS[key])
+
+async def refresh_all():
+  with xivs.priority(xivs.BACKGROUND):
+    # Arguments captured up front; pruning can drop them while we refresh
+    for key, args in [(key, ARGS[key]) for key in warm_targets()]:
+      try:
+        await refresh(key, args)
+      except Exception as err:
+        logging.warning(f"Could not refresh ranking {':'.join(key)}: {err!r}")
+  _age_counts()
+  return
+
+async def get(kind, server, currency=None):
+  # Serves the warm table when it's fresh enough, otherwise computes it now
+  # (which also warms it for the next caller).
+  key = ranking_key(kind, server, currency)
+  table = TABLES.get(key)
+  if table is not None and table.age <= MAX_AGE:
+    TABLES.move_to_end(key)
+    return table
+  return await refresh(key)
+
+def format_age(seconds):
+  if seconds < 60:
+    return f"{seconds:.0f}s"
+  return f"{seconds/60:.0f}m"
@@ -0,0 +1,240 @@
+import asyncio
+from contextlib import contextmanager
+import contextvars
+import itertools
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from global_paths import *
+
+# One scheduler per process for everything that talks to XIVAPI/Universalis:
+# a shared worker pool whose queue is ordered by priority, and a token bucket
+# per upstream host. Interactive bot commands always go before background
+# refresh work, both for worker slots and for rate-limit tokens.
+
+load_dotenv()
+INTERACTIVE = 0
+BACKGROUND = 1
+WORKERS = int(os.getenv("XIV_SCHEDULER_WORKERS", 16))
+# Requests per second and burst size. Universalis allows 25 req/s and XIVAPI
+# 20 req/s per key; stay a little under both.
+HOST_RATES = {urlsplit(UNIVERSALIS_URL).netloc: (float(os.getenv("XIV_RATE_UNIVERSALIS", 20)), 20),
+              urlsplit(XIVAPI_URL).netloc: (float(os.getenv("XIV_RATE_XIVAPI", 15)), 15)}
+DEFAULT_RATE = (10, 10)
+
+_PRIORITY = contextvars.ContextVar("xiv_priority", default=INTERACTIVE)
+
+def current_priority():
+  return _PRIORITY.get()
+
+@contextmanager
+def priority(level):
+  token = _PRIORITY.set(level)
+  try:
+    yield
+  finally:
+    _PRIORITY.reset(token)
+
+
+class TokenBucket(object):
+  def __init__(self, rate, burst):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.updated = time.monotonic()
+    self.waiting = [0, 0] # waiters per priority class
+    self.throttled = 0
+    self._lock = threading.Lock()
+    return
+
+  def __repr__(self):
+    return f"<TokenBucket({self.rate}/s, {self.tokens:.1f} tokens)>"
+
+  def try_acquire(self, level):
+    # Returns 0 if a token was taken, otherwise how long to wait before retrying
+    with self._lock:
+      now = time.monotonic()
+      self.tokens = min(self.burst, self.tokens + (now-self.updated)*self.rate)
+      self.updated = now
+      higher_waiting = any(self.waiting[:level])
+      if self.tokens >= 1 and not higher_waiting:
+        self.tokens -= 1
+        return 0
+      deficit = 1-self.tokens if self.tokens < 1 else 1
+      return deficit/self.rate
+
+  def _set_waiting(self, level, delta):
+    with self._lock:
+      self.waiting[level] += delta
+      if delta > 0:
+        self.throttled += 1
+    return
+
+  def acquire(self, level=None):
+    level = current_priority() if level is None else level
+    delay = self.try_acquire(level)
+    if not delay:
+      return
+    self._set_waiting(level, 1)
+    try:
+      while delay:
+        time.sleep(delay)
+        delay = self.try_acquire(level)
+    finally:
+      self._set_waiting(level, -1)
+    return
+
+  async def async_acquire(self, level=None):
+    level = current_priority() if level is None else level
+    delay = self.try_acquire(level)
+    if not delay:
+      return
+    self._set_waiting(level, 1)
+    try:
+      while delay:
+        await asyncio.sleep(delay)
+        delay = self.try_acquire(level)
+    finally:
+      self._set_waiting(level, -1)
+    return
+
+__BUCKETS = {}
+__BUCKETS_LOCK = threading.Lock()
+def bucket_for_url(url):
+  host = urlsplit(url).netloc
+  with __BUCKETS_LOCK:
+    if host not in __BUCKETS:
+      __BUCKETS[host] = TokenBucket(*HOST_RATES.get(host, DEFAULT_RATE))
+    return __BUCKETS[host]
+
+def acquire(url):
+  bucket_for_url(url).acquire()
+  return
+
+async def async_acquire(url):
+  await bucket_for_url(url).async_acquire()
+  return
+
+
+class _Task(object):
+  def __init__(self, func, args):
+    self.func = func
+    self.args = args
+    self.context = contextvars.copy_context() # carries the caller's priority
+    self.done = threading.Event()
+    self.value = None
+    self.error = None
+    return
+
+  def run(self):
+    try:
+      self.value = self.context.run(self.func, *self.args)
+    except BaseException as err:
+      self.error = err
+    finally:
+      self.done.set()
+    return
+
+  def result(self):
+    if self.error is not None:
+      raise self.error
+    return self.value
+
+class Scheduler(object):
+  def __init__(self, workers=WORKERS):
+    self.workers = workers
+    self._queue = queue.PriorityQueue()
+    self._seq = itertools.count()
+    self._threads = []
+    self._lock = threading.Lock()
+    self.tasks_run = 0
+    return
+
+  def __repr__(self):
+    return f"<Scheduler({self.workers} workers, {self._queue.qsize()} queued)>"
+
+  def _start(self):
+    with self._lock:
+      while len(self._threads) < self.workers:
+        thread = threading.Thread(target=self._work, name=f"xiv-scheduler-{len(self._threads)}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+    return
+
+  def _work(self):
+    while True:
+      _, _, task = self._queue.get()
+      task.run()
+      self._ran()
+
+  def _ran(self):
+    with self._lock:
+      self.tasks_run += 1
+    return
+
+  def submit(self, func, *args):
+    if not self._threads:
+      self._start()
+    task = _Task(func, args)
+    self._queue.put((current_priority(), next(self._seq), task))
+    return task
+
+  def _steal(self, level):
+    # The most urgent queued task, if it's at least as urgent as level
+    try:
+      entry = self._queue.get_nowait()
+    except queue.Empty:
+      return None
+    if entry[0] > level:
+      self._queue.put(entry) # same (priority, seq), so it keeps its place
+      return None
+    return entry[2]
+
+  def wait(self, task):
+    # A waiting thread runs queued tasks itself, so nested map() calls from
+    # inside a worker can't starve the pool. It never picks up work less
+    # urgent than its own: an interactive caller doesn't run background jobs.
+    level = current_priority()
+    while not task.done.is_set():
+      other = self._steal(level)
+      if other is None:
+        task.done.wait(0.05)
+        continue
+      other.run()
+      self._ran()
+    return task.result()
+
+  def map(self, func, iterable, max_concurrency=None):
+    # Like ThreadPool.map: results in input order. At most max_concurrency
+    # of these tasks are queued or running at once.
+    items = list(iterable)
+    window = len(items) if not max_concurrency else max(1, max_concurrency)
+    tasks = [self.submit(func, item) for item in items[:window]]
+    results = []
+    for ix in range(len(items)):
+      results.append(self.wait(tasks[ix]))
+      if ix + window < len(items):
+        tasks.append(self.submit(func, items[ix+window]))
+    return results
+
+  def stats(self):
+    return {"workers": len(self._threads), "queued": self._queue.qsize(), "tasks_run": self.tasks_run}
+
+SCHEDULER = Scheduler()
+
+def map(func, iterable, max_concurrency=None):
+  return SCHEDULER.map(func, iterable, max_concurrency)
+
+def stats():
+  output = {"pool": SCHEDULER.stats()}
+  with __BUCKETS_LOCK:
+    for host, bucket in __BUCKETS.items():
+      output[host] = {"throttled": bucket.throttled,
+                      "waiting": sum(bucket.waiting),
+                      "tokens": round(bucket.tokens, 1)}
+  return output
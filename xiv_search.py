@@ -0,0 +1,122 @@
+from bisect import bisect_left
+from collections import Counter
+
+# In-memory item name search: prefix matches on whole names and on word
+# starts, plus trigram candidates re-ranked by edit distance for typos.
+
+def _trigrams(s):
+  s = f"  {s} "
+  return {s[i:i+3] for i in range(len(s)-2)}
+
+def edit_distance(a, b, cutoff=None):
+  if len(a) < len(b):
+    a, b = b, a
+  if cutoff is not None and len(a)-len(b) > cutoff:
+    return cutoff+1
+  if cutoff is None:
+    cutoff = len(a)
+  # Only cells within `cutoff` of the diagonal can stay under the cutoff;
+  # everything outside the band counts as cutoff+1
+  over = cutoff+1
+  previous = [j if j <= cutoff else over for j in range(len(b)+1)]
+  for i, ca in enumerate(a, start=1):
+    lo, hi = max(1, i-cutoff), min(len(b), i+cutoff)
+    current = [over]*(len(b)+1)
+    current[0] = i if i <= cutoff else over
+    for j in range(lo, hi+1):
+      current[j] = min(previous[j]+1, current[j-1]+1, previous[j-1]+(ca != b[j-1]), over)
+    if min(current[lo-1:hi+1]) > cutoff:
+      return over
+    previous = current
+  return previous[-1]
+
+class ItemSearchIndex(object):
+  def __init__(self, names):
+    self.names = list(dict.fromkeys(n for n in names if n)) # de-duplicated, original case
+    self.lower = [n.lower() for n in self.names]
+    # Sorted (word suffix, name index) pairs; the suffix starting at word 0 is
+    # the whole name, so one bisect answers both "starts with" questions.
+    prefixes = []
+    for ix, name in enumerate(self.lower):
+      start = 0
+      for word in name.split(" "):
+        prefixes.append((name[start:], ix))
+        start += len(word)+1
+    prefixes.sort()
+    self._prefix_keys = [p[0] for p in prefixes]
+    self._prefix_ixs = [p[1] for p in prefixes]
+    self._trigram_index = {}
+    self._trigram_counts = []
+    for ix, name in enumerate(self.lower):
+      trigrams = _trigrams(name)
+      self._trigram_counts.append(len(trigrams))
+      for trigram in trigrams:
+        self._trigram_index.setdefault(trigram, []).append(ix)
+    return
+
+  def __repr__(self):
+    return f"<ItemSearchIndex({len(self.names)} names)>"
+
+  def __len__(self):
+    return len(self.names)
+
+  def prefix_matches(self, query, limit=50):
+    query = query.strip().lower()
+    if not query:
+      return []
+    output = []
+    ix = bisect_left(self._prefix_keys, query)
+    while ix < len(self._prefix_keys) and self._prefix_keys[ix].startswith(query) and len(output) < limit:
+      if self._prefix_ixs[ix] not in output:
+        output.append(self._prefix_ixs[ix])
+      ix += 1
+    return output
+
+  def _fuzzy_scored(self, query, limit, min_score):
+    # [(Dice coefficient, name index, shared trigrams)], best first
+    query_trigrams = _trigrams(query)
+    counts = Counter()
+    for trigram in query_trigrams:
+      counts.update(self._trigram_index.get(trigram, ()))
+    # Shortlist on raw overlap, then rank by Dice coefficient over trigram
+    # sets so long names don't dominate
+    scored = [(2*n/(len(query_trigrams)+self._trigram_counts[ix]), ix, n) for ix, n in counts.most_common(4*limit)]
+    scored.sort(reverse=True)
+    return [entry for entry in scored[:limit] if entry[0] >= min_score]
+
+  def fuzzy_matches(self, query, limit=20, min_score=0.3):
+    return [ix for _, ix, _ in self._fuzzy_scored(query.strip().lower(), limit, min_score)]
+
+  def search(self, query, n_results=5):
+    query = query.strip().lower()
+    if not query:
+      return []
+    ranked = {}
+    for ix in self.prefix_matches(query):
+      name = self.lower[ix]
+      # Exact match first, then whole-name prefixes, then word prefixes
+      tier = 0 if name == query else 1 if name.startswith(query) else 2
+      ranked[ix] = (tier, len(name))
+    if len(ranked) < n_results:
+      # Edit distance is the expensive part, so it only runs on the few best
+      # trigram candidates that could be within the cutoff (one edit changes
+      # at most 3 trigrams), and stops once there are enough one-typo matches
+      cutoff = max(2, len(query)//3)
+      query_trigrams = len(_trigrams(query))
+      close = 0
+      for _, ix, shared in self._fuzzy_scored(query, 2*n_results, 0.3):
+        if ix in ranked:
+          continue
+        if max(query_trigrams, self._trigram_counts[ix]) - shared > 3*cutoff:
+          ranked[ix] = (4, -shared)
+          continue
+        distance = edit_distance(query, self.lower[ix], cutoff)
+        if distance <= cutoff:
+          ranked[ix] = (3, distance)
+          close += distance <= 1
+        else:
+          ranked[ix] = (4, -shared)
+        if close >= n_results:
+          break
+    best = sorted(ranked, key=lambda ix: (ranked[ix], self.lower[ix]))
+    return [self.names[ix] for ix in best[:n_results]]
@@ -0,0 +1,144 @@
+import os
+
+from dotenv import load_dotenv
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+import xiv_metrics as xivm
+
+# Batched listing statistics. Every item's listings go into one flat buffer
+# (prices, quantities, and offsets marking where each item starts), and the
+# IQR-filtered weighted average, median and minimum come out for all items at
+# once. The filter matches xiv_tools.filter_outliers exactly: quartiles use
+# statistics.quantiles' default "exclusive" method and a lone listing is kept.
+# NumPy is used when it's installed; the pure-Python path gives identical
+# results.
+
+load_dotenv()
+USE_NUMPY = np is not None and os.getenv("XIV_STATS_NUMPY", "1").lower() not in ("0", "false", "no")
+
+class ListingBuffer(object):
+  def __init__(self):
+    self.prices = []
+    self.quantities = []
+    self.offsets = [0]
+    return
+
+  def __repr__(self):
+    return f"<ListingBuffer({len(self)} items, {len(self.prices)} listings)>"
+
+  def __len__(self):
+    return len(self.offsets)-1
+
+  def add(self, listings):
+    for listing in listings:
+      self.prices.append(listing["pricePerUnit"])
+      self.quantities.append(listing["quantity"])
+    self.offsets.append(len(self.prices))
+    return
+
+class PriceStats(object):
+  def __init__(self, averages, medians, minimums):
+    self.averages = averages # IQR-filtered averages weighted by quantity
+    self.medians = medians   # unfiltered
+    self.minimums = minimums
+    return
+
+  def __repr__(self):
+    return f"<PriceStats({len(self.averages)} items)>"
+
+def _quartile(ordered, i):
+  # statistics.quantiles(data, n=4)[i-1] for already sorted data
+  ld = len(ordered)
+  m = ld+1
+  j = i*m//4
+  j = 1 if j < 1 else ld-1 if j > ld-1 else j
+  delta = i*m - j*4
+  return (ordered[j-1]*(4-delta) + ordered[j]*delta)/4
+
+def _median(ordered):
+  mid = len(ordered)//2
+  if len(ordered) % 2:
+    return ordered[mid]
+  return (ordered[mid-1]+ordered[mid])/2
+
+def _price_stats_python(buffer, f, filter_above, filter_below):
+  averages, medians, minimums = [], [], []
+  for start, stop in zip(buffer.offsets, buffer.offsets[1:]):
+    prices = buffer.prices[start:stop]
+    quantities = buffer.quantities[start:stop]
+    if not prices:
+      averages.append(0)
+      medians.append(0)
+      minimums.append(0)
+      continue
+    ordered = sorted(prices)
+    if len(ordered) > 1:
+      q25, q75 = _quartile(ordered, 1), _quartile(ordered, 3)
+      qir = q75-q25
+      high_cutoff = q75+(f*qir) if filter_above else ordered[-1]
+      low_cutoff = q25-(f*qir) if filter_below else ordered[0]
+    else:
+      high_cutoff = low_cutoff = ordered[0]
+    gil, quantity = 0, 0
+    for price, amount in zip(prices, quantities):
+      if low_cutoff <= price <= high_cutoff:
+        gil += price*amount
+        quantity += amount
+    averages.append(round(gil/quantity) if quantity else 0)
+    medians.append(_median(ordered))
+    minimums.append(ordered[0])
+  return PriceStats(averages, medians, minimums)
+
+def _segment_sums(values, offsets):
+  # Exact integer sums per item (np.add.reduceat mishandles empty items)
+  totals = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+  return totals[offsets[1:]] - totals[offsets[:-1]]
+
+def _price_stats_numpy(buffer, f, filter_above, filter_below):
+  prices = np.asarray(buffer.prices, dtype=np.int64)
+  quantities = np.asarray(buffer.quantities, dtype=np.int64)
+  offsets = np.asarray(buffer.offsets, dtype=np.int64)
+  counts = np.diff(offsets)
+  starts = offsets[:-1]
+  items = np.repeat(np.arange(len(counts)), counts)
+  ordered = prices[np.lexsort((prices, items))]
+  last = len(ordered)-1
+  def quartile(i):
+    m = counts+1
+    j = np.clip(i*m//4, 1, np.maximum(counts-1, 1))
+    delta = i*m - j*4
+    # Clamped so lone/empty items (whose quartiles go unused) index safely
+    lo = ordered[np.minimum(starts+j-1, last)]
+    hi = ordered[np.minimum(starts+j, last)]
+    return (lo*(4-delta) + hi*delta)/4
+  q25, q75 = quartile(1), quartile(3)
+  qir = q75-q25
+  keep = np.ones(len(prices), dtype=bool)
+  if filter_above:
+    keep &= prices <= (q75+(f*qir))[items]
+  if filter_below:
+    keep &= prices >= (q25-(f*qir))[items]
+  keep |= (counts == 1)[items] # a lone listing is never an outlier
+  gil = _segment_sums(np.where(keep, prices*quantities, 0), offsets).tolist()
+  quantity = _segment_sums(np.where(keep, quantities, 0), offsets).tolist()
+  averages = [round(g/q) if q else 0 for g, q in zip(gil, quantity)]
+  ordered = ordered.tolist()
+  medians, minimums = [], []
+  for start, count in zip(starts.tolist(), counts.tolist()):
+    if not count:
+      medians.append(0)
+      minimums.append(0)
+      continue
+    mid = start+count//2
+    medians.append(ordered[mid] if count % 2 else (ordered[mid-1]+ordered[mid])/2)
+    minimums.append(ordered[start])
+  return PriceStats(averages, medians, minimums)
+
+def price_stats(buffer, f=1.5, filter_above=True, filter_below=True):
+  with xivm.span("statistics"):
+    if USE_NUMPY and buffer.prices:
+      return _price_stats_numpy(buffer, f, filter_above, filter_below)
+    return _price_stats_python(buffer, f, filter_above, filter_below)
@@ -0,0 +1,199 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+from global_paths import *
+import xiv_cache as xivc
+
+# Record/replay of upstream traffic, used by xiv_http underneath
+# data_from_url. XIV_HTTP_MODE picks the mode:
+#   live    talk to XIVAPI/Universalis (the default)
+#   record  same, but every response also goes on the tape: one zlib
+#           compressed copy per normalised URL (the latest one), plus a log
+#           of every request with its start time and latency. Writes go
+#           through a background thread in batches, never on the caller
+#   replay  never touch the network; answer from the tape after sleeping
+#           for the recorded latency (scaled by XIV_REPLAY_TIMING, 0 = none)
+# Replay mode is faithful to latency only: requests go out whenever the code
+# running against it makes them. To also reproduce when they arrived and how
+# many overlapped, `python benchmark.py --tape <tape> --arrivals` re-issues the
+# request log at its recorded offsets.
+# `python xiv_tape.py [tape]` summarises a tape's size and traffic profile.
+
+load_dotenv()
+MODE = os.getenv("XIV_HTTP_MODE", "live").lower()
+TAPE_PATH = os.getenv("XIV_HTTP_TAPE", HTTP_TAPE_PATH)
+REPLAY_TIMING = float(os.getenv("XIV_REPLAY_TIMING", 1))
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+WRITE_BATCH = int(os.getenv("XIV_TAPE_WRITE_BATCH", 200)) # records per commit, at most
+if MODE not in ("live", "record", "replay"):
+  logging.warning(f"XIV_HTTP_MODE must be live, record or replay, not {MODE!r}; using live")
+  MODE = "live"
+
+def peak_concurrency(intervals):
+  # Most (start, duration) intervals overlapping at any one time
+  events = sorted([(start, 1) for start, _ in intervals] + [(start+duration, -1) for start, duration in intervals],
+                  key=lambda event: (event[0], event[1]))
+  peak = current = 0
+  for _, change in events:
+    current += change
+    peak = max(peak, current)
+  return peak
+
+class TapeEntry(object):
+  def __init__(self, status, text, headers, elapsed):
+    self.status = status
+    self.text = text
+    self.headers = headers
+    self.elapsed = elapsed
+    return
+
+  def __repr__(self):
+    return f"<TapeEntry({self.status}, {len(self.text)} chars, {self.elapsed:.3f}s)>"
+
+class Tape(object):
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                       "url TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, "
+                       "body BLOB NOT NULL, size INTEGER NOT NULL, elapsed REAL NOT NULL, "
+                       "recorded_at REAL NOT NULL, hits INTEGER NOT NULL)")
+    self._conn.execute("CREATE TABLE IF NOT EXISTS requests ("
+                       "started_at REAL NOT NULL, url TEXT NOT NULL, status INTEGER NOT NULL, elapsed REAL NOT NULL)")
+    self._conn.commit()
+    self._pending = queue.Queue()
+    self._writer = None
+    self.recorded = 0
+    self.replayed = 0
+    self.misses = 0
+    return
+
+  def __repr__(self):
+    return f"<Tape({self.path})>"
+
+  def record(self, url, status, text, headers, elapsed):
+    # Only queues the record: compressing and committing happen on the
+    # writer thread, so recording adds no disk latency to the request
+    kept = {k: headers[k] for k in KEPT_HEADERS if headers.get(k) is not None}
+    self._pending.put((xivc.normalize_url(url), status, text, kept, elapsed, time.time()))
+    if self._writer is None:
+      with self._lock:
+        if self._writer is None:
+          self._writer = threading.Thread(target=self._write_forever, name="xiv-tape-writer", daemon=True)
+          self._writer.start()
+    return
+
+  def _write_forever(self):
+    while True:
+      batch = [self._pending.get()]
+      while len(batch) < WRITE_BATCH:
+        try:
+          batch.append(self._pending.get_nowait())
+        except queue.Empty:
+          break
+      try:
+        self._write(batch)
+      except Exception as err:
+        logging.warning(f"Could not write {len(batch)} record(s) to the tape {self.path}: {err!r}")
+      finally:
+        for _ in batch:
+          self._pending.task_done()
+
+  def _write(self, batch):
+    responses, requests = [], []
+    for key, status, text, kept, elapsed, now in batch:
+      body = text.encode("utf-8")
+      responses.append((key, status, json.dumps(kept), zlib.compress(body), len(body), elapsed, now))
+      requests.append((now-elapsed, key, status, elapsed))
+    with self._lock:
+      self._conn.executemany("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, 1) "
+                             "ON CONFLICT(url) DO UPDATE SET status = excluded.status, headers = excluded.headers, "
+                             "body = excluded.body, size = excluded.size, elapsed = excluded.elapsed, "
+                             "recorded_at = excluded.recorded_at, hits = hits + 1", responses)
+      self._conn.executemany("INSERT INTO requests VALUES (?, ?, ?, ?)", requests)
+      self._conn.commit()
+    self.recorded += len(batch)
+    return
+
+  def flush(self):
+    # Waits until everything queued so far is on disk
+    if self._writer is not None:
+      self._pending.join()
+    return
+
+  def get(self, url):
+    with self._lock:
+      row = self._conn.execute("SELECT status, headers, body, elapsed FROM responses WHERE url = ?",
+                               (xivc.normalize_url(url),)).fetchone()
+    if row is None:
+      self.misses += 1
+      return None
+    self.replayed += 1
+    status, headers, body, elapsed = row
+    return TapeEntry(status, zlib.decompress(body).decode("utf-8"), json.loads(headers), elapsed)
+
+  def stats(self):
+    with self._lock:
+      entries, size, stored = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), "
+                                                 "COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()
+    return {"entries": entries, "bytes": size, "compressed_bytes": stored, "recorded": self.recorded,
+            "pending": self._pending.qsize(), "replayed": self.replayed, "misses": self.misses}
+
+  def arrivals(self):
+    # The request log as (seconds after the first request, url), oldest first
+    with self._lock:
+      rows = self._conn.execute("SELECT started_at, url FROM requests ORDER BY started_at").fetchall()
+    return [(started_at-rows[0][0], url) for started_at, url in rows]
+
+  def profile(self):
+    # Request log summary: how long it covers, the busiest minute and latencies
+    with self._lock:
+      rows = self._conn.execute("SELECT started_at, elapsed FROM requests ORDER BY started_at").fetchall()
+    if not rows:
+      return {"requests": 0}
+    per_minute = {}
+    for started_at, _ in rows:
+      per_minute[int(started_at//60)] = per_minute.get(int(started_at//60), 0) + 1
+    latencies = sorted(elapsed for _, elapsed in rows)
+    return {"requests": len(rows),
+            "span_seconds": rows[-1][0] - rows[0][0],
+            "peak_per_minute": max(per_minute.values()),
+            "peak_in_flight": peak_concurrency(rows),
+            "latency_p50": latencies[len(latencies)//2],
+            "latency_p95": latencies[min(len(latencies)-1, int(len(latencies)*0.95))]}
+
+TAPE = Tape(TAPE_PATH) if MODE != "live" else None
+RECORDING = MODE == "record"
+REPLAYING = MODE == "replay"
+if RECORDING:
+  atexit.register(TAPE.flush)
+
+def record(url, response, elapsed):
+  # 304s have no body worth keeping; everything else final goes on the tape
+  if RECORDING and response.status != 304:
+    TAPE.record(url, response.status, response.text, response.headers, elapsed)
+  return
+
+def replay(url):
+  # (entry or None, seconds to wait before answering)
+  entry = TAPE.get(url)
+  if entry is None:
+    return None, 0
+  return entry, entry.elapsed*REPLAY_TIMING
+
+if __name__ == "__main__":
+  tape = Tape(sys.argv[1] if len(sys.argv) > 1 else TAPE_PATH)
+  summary = {k: v for k, v in tape.stats().items() if k in ("entries", "bytes", "compressed_bytes")}
+  for k, v in dict(summary, **tape.profile()).items():
+    print(f"{k}: {v:,.3f}" if isinstance(v, float) else f"{k}: {v:,}")
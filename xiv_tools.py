@@ -1,10 +1,13 @@
 from copy import deepcopy
-from functools import lru_cache
 from itertools import chain
 import json
 import statistics
 
 from global_paths import *
+import xiv_columnar as xivcol
+import xiv_item_names as xivin
+import xiv_metrics as xivm
+from xiv_search import ItemSearchIndex
 
 def read_all(file_name):
   with open(file_name, "r", encoding="utf-8") as f:
@@ -19,10 +22,17 @@ def load_json_from_local(file_name):
   with open(file_name, "r", encoding="utf-8") as f:
     return json.loads(f.read())
 
+def load_table(file_name):
+  # Prefers the mmap'd columnar copy written by process_offline_data.py
+  table = xivcol.open_table(file_name)
+  return table if table is not None else load_json_from_local(file_name)
+
 def split_every(arr, n):
   return [arr[i:i+n] for i in range(0, len(arr), n)]
 
 def dict_slicer(d, keys):
+  if isinstance(d, xivcol.ColumnarTable):
+    return [d.column(key).tolist() for key in keys]
   return [[v[key] for v in d] for key in keys]
 
 def multi_index_slice(arr, ixs):
@@ -50,24 +60,36 @@ def filter_outliers(arr, f=1.5, filter_above=True, filter_below=True):
   return good_ixs
   
 
-__ITEM_ID_DATA = {}
-@lru_cache
-def name_from_item_id(item_id):
-  global __ITEM_ID_DATA
-  if not __ITEM_ID_DATA:
-    __ITEM_ID_DATA = load_json_from_local(ITEM_NAMES_AND_IDS)
-  return __ITEM_ID_DATA[str(item_id)]["en"]
+__ITEM_NAMES = None
+def item_name_store():
+  # (Re)builds the mmap'd store the first time item_ids_to_names.txt is newer
+  global __ITEM_NAMES
+  if __ITEM_NAMES is None:
+    if not xivin.is_current(ITEM_NAMES_AND_IDS):
+      xivin.build(ITEM_NAMES_AND_IDS)
+    __ITEM_NAMES = xivin.ItemNameStore(ITEM_NAMES_AND_IDS)
+  return __ITEM_NAMES
+
+def name_from_item_id(item_id, lang="en"):
+  return item_name_store().name(item_id, lang)
 
-@lru_cache
 def item_id_from_name(name):
-  global __ITEM_ID_DATA
-  if not __ITEM_ID_DATA:
-    __ITEM_ID_DATA = load_json_from_local(ITEM_NAMES_AND_IDS)
-  name = name.strip().lower()
-  for item_id, item_names in __ITEM_ID_DATA.items():
-    if item_names["en"].lower() == name:
-      return item_id
-  return 0
+  return item_name_store().item_id(name)
+
+def item_ids_from_names(names):
+  with xivm.span("name_resolution"):
+    store = item_name_store()
+    return [store.item_id(name) for name in names]
+
+__ITEM_SEARCH_INDEX = None
+def item_search_index():
+  global __ITEM_SEARCH_INDEX
+  if __ITEM_SEARCH_INDEX is None:
+    __ITEM_SEARCH_INDEX = ItemSearchIndex(item_name_store().names("en"))
+  return __ITEM_SEARCH_INDEX
+
+def search_item_names(query, n_results=5):
+  return item_search_index().search(query, n_results)
 
 def weave_lists(*args):
   return list(chain.from_iterable(zip(*args)))
@@ -1,8 +1,7 @@
 from functools import lru_cache, partial
 import json
-from multiprocessing.pool import ThreadPool
+import logging
 import os
-import requests
 import time
 
 from dotenv import load_dotenv
@@ -10,12 +9,19 @@ import termtables as tt
 
 
 from global_paths import *
-from Dataclasses import Recipe, CraftingClass, Item
+from Dataclasses import Recipe, CraftingClass, Item, MarketSnapshot
+import xiv_cache as xivc
+import xiv_equipment as xive
+import xiv_http as xivh
+import xiv_metrics as xivm
+import xiv_scheduler as xivs
+import xiv_stats as xivst
 import xiv_tools as xivt
 
 load_dotenv()
 xivapi_key = os.getenv("xivapi_key")
 TAX_RATE = 0.03
+CHUNK_CONCURRENCY = int(os.getenv("XIV_CHUNK_CONCURRENCY", 4)) # parallel Universalis chunk requests
 
 
 def xivapi_endpoint_url(endpoint, **kwargs):
@@ -49,21 +55,22 @@ def universalis_history_url(server, item_ids, **kwargs):
     url += f"{k}={v}&"
   return url
 
-@lru_cache
+WORLDS_URL = f"{UNIVERSALIS_URL}/worlds"
+DCS_URL = f"{UNIVERSALIS_URL}/data-centers"
+
+@xivc.ttl_cache(xivc.STATIC_TTL, max_entries=1)
 def worlds():
-  url = f"{UNIVERSALIS_URL}/worlds"
-  data = data_from_url(url)
+  data = data_from_url(WORLDS_URL)
   if data:
     return data
-  raise ValueError(f"Invalid response from {url}")
+  raise ValueError(f"Invalid response from {WORLDS_URL}")
 
-@lru_cache
+@xivc.ttl_cache(xivc.STATIC_TTL, max_entries=1)
 def dcs():
-  url = f"{UNIVERSALIS_URL}/data-centers"
-  data = data_from_url(url)
+  data = data_from_url(DCS_URL)
   if data:
     return data
-  raise ValueError(f"Invalid response from {url}")
+  raise ValueError(f"Invalid response from {DCS_URL}")
 
 @lru_cache
 def regions():
@@ -74,10 +81,13 @@ def regions():
   return regions
 
 def get_scope(server):
-  for world in worlds():
+  return _scope_from_lists(server, worlds(), dcs())
+
+def _scope_from_lists(server, world_list, dc_list):
+  for world in world_list:
     if world["name"].lower() == server.lower():
       return "server"
-  for dc in dcs():
+  for dc in dc_list:
     if dc["name"].lower() == server.lower():
       return "dc"
   for region in regions():
@@ -85,7 +95,7 @@ def get_scope(server):
       return "region"
   raise ValueError(f"{server} was not found in any database")
 
-@lru_cache
+@xivc.ttl_cache(xivc.STATIC_TTL, max_entries=1024)
 def item_info_from_name(name):
   url = xivapi_search_url(name)
   data = data_from_url(url)
@@ -94,10 +104,10 @@ def item_info_from_name(name):
       if result["Name"].lower() == name.lower():
         return Item(result)
     else:
-      raise ValueError(f"'{name}' wasn't found in response for url: {url}")
-  raise ValueError(f"Invalid response from url: {url}")
+      raise ValueError(f"'{name}' wasn't found in response for url: {xivc.normalize_url(url)}")
+  raise ValueError(f"Invalid response from url: {xivc.normalize_url(url)}")
 
-@lru_cache
+@xivc.ttl_cache(xivc.STATIC_TTL, max_entries=1024)
 def item_info_from_id(item_id):
   item_id = str(item_id).strip()
   url = xivapi_endpoint_url(f"/item/{item_id}", columns="Name")
@@ -105,35 +115,89 @@ def item_info_from_id(item_id):
   return item_info_from_name(data["Name"])
 
 def text_from_url(url):
-  response = requests.get(url)
-  if response.status_code == 200:
+  entry = xivc.disk_entry(url)
+  if entry is not None and entry.fresh:
+    return entry.body
+  response = xivh.get(url, headers=entry.conditional_headers() if entry else None)
+  return _text_from_response(url, response, entry)
+
+def _text_from_response(url, response, entry):
+  if response.status == 304 and entry is not None:
+    xivc.DISK.touch(url)
+    return entry.body
+  if response.status == 200:
+    xivc.disk_store(url, response)
     return response.text
+  logging.warning(f"GET {xivc.normalize_url(url)} returned status {response.status}")
+  if entry is not None: # Stale static data beats no data
+    return entry.body
   return ""
 
 def data_from_text(text):
   return json.loads(text)
 
-def data_from_url(url):
+def _fetch_and_cache(url):
   text = text_from_url(url)
+  if text:
+    xivc.RESPONSES.set(url, text, xivc.ttl_for_url(url), len(text))
+  return text
+
+def data_from_url(url):
+  text = xivc.RESPONSES.get(url)
+  if text is None:
+    text = xivc.FETCHES.do(url, _fetch_and_cache, url)
   if text:
     return data_from_text(text)
   return {}
   
+def data_from_urls(urls, concurrency=CHUNK_CONCURRENCY):
+  # Fetches every URL (at most `concurrency` at a time), results in order
+  datas = xivs.map(data_from_url, urls, max_concurrency=concurrency)
+  for url, data in zip(urls, datas):
+    if not data:
+      raise ValueError(f"Invalid response from url: {xivc.normalize_url(url)}")
+  return datas
+
+def item_names_from_ids(item_ids):
+  # Local item table first, then one multi-ID XIVAPI request for the misses
+  names = {}
+  for item_id in item_ids:
+    try:
+      names[item_id] = xivt.name_from_item_id(item_id)
+    except (KeyError, OSError):
+      pass
+  missing = [str(item_id) for item_id in item_ids if item_id not in names]
+  if missing:
+    url = xivapi_endpoint_url("/item", ids=",".join(missing), columns="ID,Name")
+    data = data_from_url(url)
+    if not data:
+      raise ValueError(f"Invalid response from url: {xivc.normalize_url(url)}")
+    found = {str(result["ID"]): result["Name"] for result in data["Results"]}
+    for item_id in item_ids:
+      if item_id not in names and str(item_id) in found:
+        names[item_id] = found[str(item_id)]
+  for item_id in item_ids:
+    if item_id not in names:
+      raise ValueError(f"No item name found for item ID {item_id}")
+  return [names[item_id] for item_id in item_ids]
+
 def get_item_recipe_from_web(name):
-  url = xivapi_search_url(name, indexes="Recipe")  
-  data = data_from_url(url)
-  if not data:
-    raise ValueError(f"Invalid or no data returned from URL: {url}")
-  results = data["Results"]
-  recipe_columns =   [f"AmountIngredient{n}" for n in range(10)] \
+  # The recipe columns ride along on the search request, so a recipe costs one
+  # search plus at most one batched item-name lookup.
+  recipe_columns =   ["Name"] \
+                   + [f"AmountIngredient{n}" for n in range(10)] \
                    + [f"ItemIngredient{n}TargetID" for n in range(10)] \
                    + ["AmountResult", "ClassJob.NameEnglish", 
                       "ClassJob.Abbreviation", "ClassJob.ID", "ClassJob.Icon",
                       "RecipeLevelTable.ClassJobLevel"]
+  url = xivapi_search_url(name, indexes="Recipe", columns=recipe_columns)
+  data = data_from_url(url)
+  if not data:
+    raise ValueError(f"Invalid or no data returned from URL: {xivc.normalize_url(url)}")
+  results = data["Results"]
   for result in results:
     if result["Name"].lower() == name.lower():
-      recipe_url = xivapi_endpoint_url(result["Url"], columns=",".join(recipe_columns))
-      recipe_data = data_from_url(recipe_url)
+      recipe_data = result
       break
   else: 
     raise ValueError(f"No recipe found for {name}")
@@ -144,109 +208,140 @@ def get_item_recipe_from_web(name):
                                  recipe_data["ClassJob"]["ID"],
                                  recipe_data["ClassJob"]["Icon"])
   level = recipe_data["RecipeLevelTable"]["ClassJobLevel"]
-  names = []
+  item_ids = []
   amts  = []
   for i in range(len(ingredient_amounts)):
     item_id = recipe_data[f"ItemIngredient{i}TargetID"]
     if item_id == 0:
       continue
-    item = item_info_from_id(item_id)
-    names.append(item.name)
+    item_ids.append(item_id)
     amts.append(ingredient_amounts[i])
+  names = item_names_from_ids(item_ids)
   return Recipe(name, level, crafting_class, names, amts)
 
-def average_price(name_or_names, server, hq="null", listings=10):
-  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
-  item_ids = [xivt.item_id_from_name(name) for name in names]
-  names = xivt.split_every(names, 99) # Universalis caps at 100 results
-  item_ids = xivt.split_every(item_ids, 99)
+def _table_string(table, headers, alignment):
+  with xivm.span("table_formatting"):
+    return tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment=alignment)
+
+def _average_price_urls(names, server, hq, listings, item_ids=None):
+  if item_ids is None:
+    item_ids = xivt.item_ids_from_names(names)
+  item_ids = [str(item_id) for item_id in item_ids]
+  item_ids = xivt.split_every(item_ids, 99) # Universalis caps at 100 results
   urls = []
   for item_id_subset in item_ids:
     urls.append(universalis_current_data_url(server, item_id_subset, listings=listings, hq=hq, entriesWithin=0))
+  return urls, item_ids
+
+def _average_price_from_data(data, item_id_subset, server):
+  # Every item's listings go through one batched statistics pass
   output = [[], []] # list of prices, list of cheapest server names
-  for url, item_id_subset in zip(urls, item_ids):
-    data = data_from_url(url)
-    if not data:
-      raise ValueError(f"Invalid response from url: {url}")
-    single_item = (len(item_id_subset) == 1)
-    for item_id in item_id_subset:
-      if item_id == "44":
-        output[0].append(0)
-        output[1].append("")
-        continue
-      listings = data["listings"] if single_item else data["items"][item_id]["listings"]
-      if not listings:
-        output[0].append(0)
-        output[1].append("")
-        continue
-      gil_list = []
-      quantity_list = []
-      for listing in listings:
-        quantity_list.append(listing["quantity"])
-        gil_list.append(listing["pricePerUnit"])
-      good_ixs = xivt.filter_outliers(gil_list, f=1.2, filter_below=False)
-      gil, quantity = 0, 0
-      for ix in good_ixs:
-        quantity += quantity_list[ix]
-        gil      += quantity_list[ix]*gil_list[ix]
-      cheapest_server = listings[0].get("worldName", server)
-      output[0].append(round(gil/quantity))
-      output[1].append(cheapest_server)
+  single_item = (len(item_id_subset) == 1)
+  buffer = xivst.ListingBuffer()
+  for item_id in item_id_subset:
+    listings = [] if item_id == "44" else data["listings"] if single_item else data["items"][item_id]["listings"]
+    buffer.add(listings)
+    output[1].append(listings[0].get("worldName", server) if listings else "")
+  output[0] = xivst.price_stats(buffer, f=1.2, filter_below=False).averages
+  return output
+
+def average_price(name_or_names, server, hq="null", listings=10, item_ids=None):
+  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
+  urls, item_ids = _average_price_urls(names, server, hq, listings, item_ids)
+  output = [[], []] # list of prices, list of cheapest server names
+  for data, item_id_subset in zip(data_from_urls(urls), item_ids):
+    prices, servers = _average_price_from_data(data, item_id_subset, server)
+    output[0] += prices
+    output[1] += servers
   return output
 
-def lowest_price(name_or_names, server, hq="null"):
-  return average_price(name_or_names, server, hq, listings=1)
+def lowest_price(name_or_names, server, hq="null", item_ids=None):
+  return average_price(name_or_names, server, hq, listings=1, item_ids=item_ids)
+
+def _velocity_urls(names, server):
+  item_ids = xivt.item_ids_from_names(names)
+  item_ids = xivt.split_every(item_ids, 99) # Universalis restricted to 100
+  urls = [universalis_history_url(server, item_id_subset) for item_id_subset in item_ids]
+  return urls, item_ids
+
+def _velocity_from_data(data, item_id_subset):
+  velocities = []
+  single_item = (len(item_id_subset) == 1)
+  for item_id in item_id_subset:
+    item_data = data if single_item else data["items"][item_id]
+    velocities.append(round(float(item_data["regularSaleVelocity"])))
+  return velocities
 
 def velocity(name_or_names, server):
   names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
-  item_ids = [xivt.item_id_from_name(name) for name in names]
-  item_ids = xivt.split_every(item_ids, 99) # Universalis restricted to 100
+  urls, item_ids = _velocity_urls(names, server)
   velocities = []
-  for item_id_subset in item_ids:
-    url = universalis_history_url(server, item_id_subset)
-    data = data_from_url(url)
-    if not data:
-      raise ValueError(f"Invalid response from url: {url}")
-    single_item = (len(item_id_subset) == 1)
-    for item_id in item_id_subset:
-      item_data = data if single_item else data["items"][item_id]
-      velocities.append(round(float(item_data["regularSaleVelocity"])))
+  for data, item_id_subset in zip(data_from_urls(urls), item_ids):
+    velocities += _velocity_from_data(data, item_id_subset)
   return velocities
 
+def _market_snapshots_from_data(data, names, item_id_subset, server):
+  # Universalis current-data responses carry sale velocity next to the
+  # listings, so one request answers both "how much" and "how fast".
+  prices, servers = _average_price_from_data(data, item_id_subset, server)
+  velocities = _velocity_from_data(data, item_id_subset)
+  single_item = (len(item_id_subset) == 1)
+  snapshots = []
+  for ix, item_id in enumerate(item_id_subset):
+    item_data = data if single_item else data["items"][item_id]
+    listing_count = item_data.get("listingsCount", len(item_data["listings"]))
+    snapshots.append(MarketSnapshot(names[ix], item_id, prices[ix], servers[ix], listing_count, velocities[ix]))
+  return snapshots
+
+def market_snapshot(name_or_names, server, hq="null", listings=1, item_ids=None):
+  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
+  urls, item_ids = _average_price_urls(names, server, hq, listings, item_ids)
+  names = xivt.split_every(names, 99)
+  output = []
+  for data, names_subset, item_id_subset in zip(data_from_urls(urls), names, item_ids):
+    output += _market_snapshots_from_data(data, names_subset, item_id_subset, server)
+  return output
+
 __COLLECTIBLE_RECIPE_DATA = {}
+__RECIPES_BY_NAME = {}       # lower-cased recipe name -> recipe
+__RECIPES_BY_INGREDIENT = {} # lower-cased ingredient name -> recipes using it
+def _collectible_recipe_data():
+  global __COLLECTIBLE_RECIPE_DATA, __RECIPES_BY_NAME, __RECIPES_BY_INGREDIENT
+  if not __COLLECTIBLE_RECIPE_DATA:
+    data = xivt.load_table(PROCESSED_RECIPE_PATH)
+    by_name = {}
+    by_ingredient = {}
+    for recipe in data:
+      by_name.setdefault(recipe["name"].lower(), recipe)
+      for ingredient in set(recipe["ingredient_names"]):
+        by_ingredient.setdefault(ingredient.lower(), []).append(recipe)
+    __RECIPES_BY_NAME = by_name
+    __RECIPES_BY_INGREDIENT = by_ingredient
+    __COLLECTIBLE_RECIPE_DATA = data
+  return __COLLECTIBLE_RECIPE_DATA
+
 def get_item_recipe_from_local(name_or_names):
   names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
-  global __COLLECTIBLE_RECIPE_DATA
-  if not __COLLECTIBLE_RECIPE_DATA:
-    __COLLECTIBLE_RECIPE_DATA = xivt.load_json_from_local(PROCESSED_RECIPE_PATH)
+  _collectible_recipe_data()
   output = []
   for name in names:
-    for recipe in __COLLECTIBLE_RECIPE_DATA:
-      if recipe["name"].lower() == name.lower():
-        output.append(recipe)
-        break
-    else:
+    recipe = __RECIPES_BY_NAME.get(name.strip().lower())
+    if recipe is None:
       raise ValueError(f"Did not find a recipe for {name}")
+    output.append(recipe)
   return output
 
-def price_to_craft_collectible(name_or_names, server, listings=10):
-  global __COLLECTIBLE_RECIPE_DATA
-  if not __COLLECTIBLE_RECIPE_DATA:
-    __COLLECTIBLE_RECIPE_DATA = xivt.load_json_from_local(PROCESSED_RECIPE_PATH)
-  names = [name_or_names] if isinstance(name_or_names, str) else name_or_names
-  recipes = []
-  for name in names: # O(n*m)... :(
-    for recipe in __COLLECTIBLE_RECIPE_DATA:
-      if recipe["name"].lower() == name.lower():
-        recipes.append(recipe)
-        break
-    else:
-      raise ValueError(f"Did not find a recipe for {name}")
-  ingredient_set = set()
-  for recipe in recipes:
-    ingredient_set.update(recipe["ingredient_names"])
-  ingredient_names = list(ingredient_set)
-  ingredient_prices, _ = average_price(ingredient_names, server, listings=listings)
+def recipes_using_ingredient(name):
+  _collectible_recipe_data()
+  return list(__RECIPES_BY_INGREDIENT.get(name.strip().lower(), []))
+
+def _collectible_ingredient_names(name_or_names):
+  # First-seen order (not a set) so the request URLs are the same every run
+  recipes = get_item_recipe_from_local(name_or_names)
+  ingredient_names = dict.fromkeys(name for recipe in recipes for name in recipe["ingredient_names"])
+  return recipes, list(ingredient_names)
+
+def _recipe_costs(recipes, ingredient_names, ingredient_prices):
   price_lookup = {n: p for n, p in zip(ingredient_names, ingredient_prices)}
   recipe_costs = []
   for recipe in recipes:
@@ -256,12 +351,16 @@ def price_to_craft_collectible(name_or_names, server, listings=10):
     recipe_costs.append(cost)
   return recipe_costs
 
+def price_to_craft_collectible(name_or_names, server, listings=10):
+  recipes, ingredient_names = _collectible_ingredient_names(name_or_names)
+  ingredient_prices, _ = average_price(ingredient_names, server, listings=listings)
+  return _recipe_costs(recipes, ingredient_names, ingredient_prices)
+
 __PROCESSED_COLLECTIBLE_NAMES = {}
-def best_collectible_to_craft(currency, server, n_results="all", verbose=True):
+def _collectible_tiers(currency):
   global __PROCESSED_COLLECTIBLE_NAMES
   if not __PROCESSED_COLLECTIBLE_NAMES:
-    __PROCESSED_COLLECTIBLE_NAMES = xivt.load_json_from_local(PROCESSED_COLLECTIBLE_PATH)
-  batch_start = time.time()
+    __PROCESSED_COLLECTIBLE_NAMES = xivt.load_table(PROCESSED_COLLECTIBLE_PATH)
   tiers = [t for t in __PROCESSED_COLLECTIBLE_NAMES if t["currency"].lower() == currency.lower()]
   # turn into lists of names, jobs, levels, costs, gpc
   names = []
@@ -272,8 +371,10 @@ def best_collectible_to_craft(currency, server, n_results="all", verbose=True):
     names += tier["items"]
     levels += [tier["level"]]*tier_size
     rewards += [tier["reward"]]*tier_size
+  return names, levels, rewards
+
+def _collectible_table(currency, server, names, levels, rewards, gil_to_craft, batch_start, n_results, verbose):
   num_items = len(names)
-  gil_to_craft = price_to_craft_collectible(names, server)
   gpc = [round(g/r) for g, r in zip(gil_to_craft, rewards)]
   collection = [list(_) for _ in zip(names, levels, rewards, gil_to_craft, gpc)]
   collection.sort(key = lambda x: x[-1])
@@ -284,28 +385,32 @@ def best_collectible_to_craft(currency, server, n_results="all", verbose=True):
   headers = [f"Server: {server}", "Lvl", f"{currency_abr}", "Gil/Ea", f"Gil/{currency_abr}"]
   times = ["", "", "", f"Time: {dt:.2f}s", f"s/item: {dt/num_items:.2f}"]
   table = xivt.format_column(collection, [3, 4], ["{:,}", "{:,}"]) + [times]
-  table_str = tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment="llrrr")
+  table_str = _table_string(table, headers, "llrrr")
   if verbose:
     print(table_str)
   return collection, table_str
 
+def best_collectible_to_craft(currency, server, n_results="all", verbose=True):
+  batch_start = time.time()
+  names, levels, rewards = _collectible_tiers(currency)
+  gil_to_craft = price_to_craft_collectible(names, server)
+  return _collectible_table(currency, server, names, levels, rewards, gil_to_craft, batch_start, n_results, verbose)
+
+def _filter_by_velocity(snapshots, v_cutoff, columns):
+  good_ixs = [ix for ix in range(len(snapshots)) if snapshots[ix].velocity >= v_cutoff]
+  snapshots = xivt.multi_index_slice(snapshots, good_ixs)
+  velocities = [s.velocity for s in snapshots]
+  prices = [s.price for s in snapshots]
+  return [xivt.multi_index_slice(column, good_ixs) for column in columns] + [velocities, prices]
+
 __COMBAT_VENTURE_DATA = {}
-def best_combat_ventures(server, n_results="all", v_cutoff=25, verbose=True):
+def _combat_ventures():
   global __COMBAT_VENTURE_DATA
   if not __COMBAT_VENTURE_DATA:
-    __COMBAT_VENTURE_DATA = xivt.load_json_from_local(PROCESSED_VENTURE_PATH)
-  batch_start = time.time()
-  names, durations, amounts, levels \
-    = xivt.dict_slicer(__COMBAT_VENTURE_DATA, ["name", "duration", "amount", "level"])
-  num_items = len(names)
-  velocities = velocity(names, server)
-  good_ixs   = [ix for ix in range(num_items) if velocities[ix] >= v_cutoff]
-  names      = xivt.multi_index_slice(names, good_ixs)
-  durations  = xivt.multi_index_slice(durations, good_ixs)
-  amounts    = xivt.multi_index_slice(amounts, good_ixs)
-  levels     = xivt.multi_index_slice(levels, good_ixs)
-  velocities = xivt.multi_index_slice(velocities, good_ixs)
-  prices, _  = lowest_price(names, server, hq=0)
+    __COMBAT_VENTURE_DATA = xivt.load_table(PROCESSED_VENTURE_PATH)
+  return xivt.dict_slicer(__COMBAT_VENTURE_DATA, ["name", "duration", "amount", "level"])
+
+def _ventures_table(server, names, durations, amounts, levels, velocities, prices, num_items, batch_start, n_results, verbose):
   prices = [p*(1-TAX_RATE) for p in prices] 
   gph = [round(60*p*int(a)/int(d)) for p, a, d in zip(prices, amounts, durations)]
   collection = [list(_) for _ in zip(names, levels, gph, velocities)]
@@ -316,29 +421,29 @@ def best_combat_ventures(server, n_results="all", v_cutoff=25, verbose=True):
   headers = [f"Server: {server}", "Lvl", "~Gil/Hr (Inc. Tax)", "~Sales/Day"]
   times = ["", "", f"Time: {dt:.2f}s", f"s/item: {dt/num_items:.2f}"]
   table = xivt.format_column(collection, [2, 3], ["{:,}", "{:,}"]) + [times]
-  table_str = tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment="lrrr")
+  table_str = _table_string(table, headers, "lrrr")
   if verbose:
     print(table_str)
   return collection, table_str
 
+def best_combat_ventures(server, n_results="all", v_cutoff=25, verbose=True):
+  batch_start = time.time()
+  names, durations, amounts, levels = _combat_ventures()
+  num_items = len(names)
+  snapshots = market_snapshot(names, server, hq=0)
+  names, durations, amounts, levels, velocities, prices \
+    = _filter_by_velocity(snapshots, v_cutoff, [names, durations, amounts, levels])
+  return _ventures_table(server, names, durations, amounts, levels, velocities, prices, num_items, batch_start, n_results, verbose)
+
 __SCRIP_REWARDS = {}
-def best_scrip_reward(server, currency, n_results="all", v_cutoff=10, verbose=True):
+def _scrip_rewards(currency):
   global __SCRIP_REWARDS
   if not __SCRIP_REWARDS:
-    __SCRIP_REWARDS = xivt.load_json_from_local(PROCESSED_CRAFTER_SCRIP_PATH)
-  batch_start = time.time()
+    __SCRIP_REWARDS = xivt.load_table(PROCESSED_CRAFTER_SCRIP_PATH)
   rewards = [r for r in __SCRIP_REWARDS if r["currency"].lower() == currency.lower()]
-  names, quantities, costs, currencies = \
-    xivt.dict_slicer(rewards, ["name", "quantity", "cost", "currency"])
-  num_items = len(names)
-  velocities = velocity(names, server)
-  good_ixs = [ix for ix in range(num_items) if velocities[ix] >= v_cutoff]
-  names = xivt.multi_index_slice(names, good_ixs)
-  quantities = xivt.multi_index_slice(quantities, good_ixs)
-  costs = xivt.multi_index_slice(costs, good_ixs)
-  currencies = xivt.multi_index_slice(currencies, good_ixs)
-  velocities = xivt.multi_index_slice(velocities, good_ixs)
-  prices, _ = lowest_price(names, server)
+  return xivt.dict_slicer(rewards, ["name", "quantity", "cost", "currency"])
+
+def _scrip_table(server, currency, names, quantities, costs, velocities, prices, num_items, batch_start, n_results, verbose):
   prices = [p*(1-TAX_RATE) for p in prices]
   gpc = [round(p*int(q)/float(c)) for q, c, p in zip(quantities, costs, prices)]
   collection = [list(_) for _ in zip(names, costs, prices, gpc, velocities)]
@@ -350,17 +455,49 @@ def best_scrip_reward(server, currency, n_results="all", v_cutoff=10, verbose=Tr
   headers=[f"Server: {server}", currency_abr, "Gil/Ea (Inc. Tax)", f"Gil/{currency_abr}", "~Sales/Day"]
   times = ["", "", "", f"Time: {dt:.2f}s", f"s/item: {dt/num_items:.2f}"]
   table = xivt.format_column(collection, [2, 4], ["{:,}", "{:,}"]) + [times]
-  table_str = tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment="llrrr")
+  table_str = _table_string(table, headers, "llrrr")
   if verbose:
     print(table_str)
   return collection, table_str
 
-def best_equip_for_slot(slot, ilvl, job, ornate=False):
+def best_scrip_reward(server, currency, n_results="all", v_cutoff=10, verbose=True):
+  batch_start = time.time()
+  names, quantities, costs, currencies = _scrip_rewards(currency)
+  num_items = len(names)
+  snapshots = market_snapshot(names, server)
+  names, quantities, costs, currencies, velocities, prices \
+    = _filter_by_velocity(snapshots, v_cutoff, [names, quantities, costs, currencies])
+  return _scrip_table(server, currency, names, quantities, costs, velocities, prices, num_items, batch_start, n_results, verbose)
+
+def _equip_limit(slot):
+  # Body needs a second result so there's a chance to find the ornate variant
+  return 2 if slot == "Body" else 1
+
+def _equip_search_url(slot, ilvl, job):
   job = job.upper()
   filters = [f"LevelItem<={ilvl}", f"ClassJobCategory.{job}=1", "IsUntradable=0", f"EquipSlotCategory.{slot}=1"]
-  limit = 2 if slot == "Body" else 1
-  url = xivapi_endpoint_url("/search", filters=",".join(filters), sort_field="LevelItem", sort_order="desc", limit=limit)
-  data = data_from_url(url)
+  return xivapi_endpoint_url("/search", filters=",".join(filters), sort_field="LevelItem", sort_order="desc", limit=_equip_limit(slot))
+
+def _equip_catalogue_url(min_ilvl, max_ilvl, page=1):
+  filters = [f"LevelItem>={min_ilvl}", f"LevelItem<{max_ilvl}", "IsUntradable=0", "EquipSlotCategoryTargetID>0"]
+  columns = ["ID", "Name", "LevelItem", "IsUntradable"] + \
+            [f"EquipSlotCategory.{slot}" for slot in xive.EQUIP_SLOTS] + \
+            [f"ClassJobCategory.{job}" for job in xive.EQUIP_JOBS]
+  return xivapi_endpoint_url("/search", filters=",".join(filters), columns=",".join(columns), limit=3000, page=page)
+
+def _equip_catalogue_from_data(data):
+  items = []
+  for result in data["Results"]:
+    slot_category = result.get("EquipSlotCategory") or {}
+    job_category = result.get("ClassJobCategory") or {}
+    slots = [slot for slot in xive.EQUIP_SLOTS if slot_category.get(slot) == 1]
+    jobs = [job for job in xive.EQUIP_JOBS if job_category.get(job) == 1]
+    if slots and jobs:
+      items.append({"id": result["ID"], "name": result["Name"], "ilvl": result["LevelItem"],
+                    "untradable": bool(result.get("IsUntradable")), "slots": slots, "jobs": jobs})
+  return items
+
+def _equip_from_data(data, slot, ornate):
   results = data["Results"]
   if not results:
     return ""
@@ -374,21 +511,20 @@ def best_equip_for_slot(slot, ilvl, job, ornate=False):
   else:
     return results[0]["Name"]
 
-def best_server_gearset_items(ilvl, job, server, hq="true", verbose=True):
-  batch_start = time.time()
-  slot_names = ["MainHand", "OffHand", "Head", "Body", "Gloves", "Legs",
-                "Feet", "Ears", "Neck", "Wrists", "FingerR"]
-  p = ThreadPool(6)
-  worker = partial(best_equip_for_slot, ilvl=ilvl, job=job)
-  equip_names = p.map(worker, slot_names)
-  p.close()
-  p.join()
-  slot_names[-1] = "Ring"
-  ornate_body = best_equip_for_slot("Body", ilvl, job, ornate=True)
+def best_equip_for_slot(slot, ilvl, job, ornate=False):
+  catalogue = xive.catalogue()
+  if catalogue is not None:
+    data = catalogue.search(slot, ilvl, job, limit=_equip_limit(slot))
+  else:
+    data = data_from_url(_equip_search_url(slot, ilvl, job))
+  return _equip_from_data(data, slot, ornate)
+
+GEARSET_SLOT_NAMES = list(xive.EQUIP_SLOTS)
+
+def _gearset_table(ilvl, job, server, slot_names, equip_names, ornate_body, best_prices, best_servers, batch_start, verbose):
+  slot_names = slot_names[:-1] + ["Ring"]
   if ornate_body:
     slot_names.append("OrnateBody")
-    equip_names.append(ornate_body)
-  best_prices, best_servers = lowest_price(equip_names, server, hq=hq)
   collection = [list(_) for _ in zip(slot_names, equip_names, best_prices, best_servers)]
   num_items = len(equip_names)
   dt = time.time()-batch_start
@@ -398,49 +534,44 @@ def best_server_gearset_items(ilvl, job, server, hq="true", verbose=True):
   price_row = ["", "Total Price (Excl. Ornate)", price, ""]
   time_row = ["", "", f"Time: {dt:.2f}s", f"s/item: {0 if not num_items else dt/num_items:.2f}"]
   table = xivt.format_column(collection+[price_row], [2], ["{:,}"]) + [time_row]
-  table_str = tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment="llrl")
+  table_str = _table_string(table, headers, "llrl")
   if verbose:
     print(table_str)
   return collection, table_str
 
+def best_server_gearset_items(ilvl, job, server, hq="true", verbose=True):
+  batch_start = time.time()
+  slot_names = list(GEARSET_SLOT_NAMES)
+  worker = partial(best_equip_for_slot, ilvl=ilvl, job=job)
+  equip_names = xivs.map(worker, slot_names)
+  ornate_body = best_equip_for_slot("Body", ilvl, job, ornate=True)
+  if ornate_body:
+    equip_names.append(ornate_body)
+  best_prices, best_servers = lowest_price(equip_names, server, hq=hq)
+  return _gearset_table(ilvl, job, server, slot_names, equip_names, ornate_body, best_prices, best_servers, batch_start, verbose)
+
 def __best_equip_for_slot_helper(job, ilvl, slot): # Re-ordering args for pool
   return best_equip_for_slot(slot, ilvl, job) 
 
-def best_server_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, hq="true", sort_by_server=False, verbose=True):
-  crafters = ["CRP", "BSM", "ARM", "GSM", "LTW", "WVR", "ALC", "CUL"]
-  gatherers = ["MIN", "BTN", "FSH"]
-  if crafter_or_gatherer.lower().strip() == "crafter":
-    job_list = crafters
-    generic_gear, _ = best_server_gearset_items(ilvl, crafters[0], server, hq, verbose=False)
-  elif crafter_or_gatherer.lower().strip() == "gatherer":
-    job_list = gatherers
-    generic_gear, _ = best_server_gearset_items(ilvl, gatherers[0], server, hq, verbose=False)
-  elif crafter_or_gatherer.lower().strip() == "all":
-    job_list = crafters + gatherers
-    c_gear, _ = best_server_gearset_items(ilvl, crafters[0], server, hq, verbose=False)
-    g_gear, _ = best_server_gearset_items(ilvl, gatherers[0], server, hq, verbose=False)
-    generic_gear = c_gear + g_gear
-  else:
-    return {}
-  batch_start = time.time()
-  # generic_gear, _ = best_server_gearset_items(ilvl, job_list[0], server, hq, verbose=False)
-  mainhands = [generic_gear.pop(0)[1]]
-  offhands =  [generic_gear.pop(0)[1]]
-  hand_slotnames = [f"{job_list[0]} MainHand", f"{job_list[0]} OffHand"]
-  main_pool = ThreadPool(len(job_list)-1)
-  main_worker = partial(__best_equip_for_slot_helper, ilvl=ilvl, slot="MainHand")
-  mainhands += main_pool.map(main_worker, job_list[1:])
-  main_pool.close()
-  main_pool.join()
-  off_pool = ThreadPool(len(job_list)-1)
-  off_worker = partial(__best_equip_for_slot_helper, ilvl=ilvl, slot="OffHand")
-  offhands += off_pool.map(off_worker, job_list[1:])
-  off_pool.close()
-  off_pool.join()
-  for job in job_list[1:]:
+CRAFTERS = ["CRP", "BSM", "ARM", "GSM", "LTW", "WVR", "ALC", "CUL"]
+GATHERERS = ["MIN", "BTN", "FSH"]
+
+def _crafter_gatherer_jobs(crafter_or_gatherer):
+  # Returns the job list and the jobs whose generic (non-tool) gear is needed
+  crafter_or_gatherer = crafter_or_gatherer.lower().strip()
+  if crafter_or_gatherer == "crafter":
+    return CRAFTERS, [CRAFTERS[0]]
+  elif crafter_or_gatherer == "gatherer":
+    return GATHERERS, [GATHERERS[0]]
+  elif crafter_or_gatherer == "all":
+    return CRAFTERS + GATHERERS, [CRAFTERS[0], GATHERERS[0]]
+  return [], []
+
+def _crafter_gatherer_table(ilvl, server, crafter_or_gatherer, job_list, mainhands, offhands, generic_gear, allhands_prices, allhands_servers, sort_by_server, batch_start, verbose):
+  hand_slotnames = []
+  for job in job_list:
     hand_slotnames += [f"{job} MainHand", f"{job} OffHand"]
   allhands_names = xivt.weave_lists(mainhands, offhands)
-  allhands_prices, allhands_servers = lowest_price(allhands_names, server, hq)
   hands_collection = [list(_) for _ in zip(hand_slotnames, allhands_names, allhands_prices, allhands_servers)]
   collection = hands_collection + generic_gear
   if sort_by_server:
@@ -452,15 +583,36 @@ def best_server_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, hq=
   price_row = ["", "Total Price", price, ""]
   time_row = ["", "", f"Time: {dt:.2f}s", f"s/item: {0 if not num_items else dt/num_items:.2f}"]
   table = xivt.format_column(collection+[price_row], [2], ["{:,}"]) + [time_row]
-  table_str = tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment="llrl")
+  table_str = _table_string(table, headers, "llrl")
   if verbose:
     print(table_str)
   return collection, table_str
 
-def _bri_ilvl_search(min_ilvl):
+def best_server_full_crafter_gatherer_set(ilvl, server, crafter_or_gatherer, hq="true", sort_by_server=False, verbose=True):
+  job_list, generic_jobs = _crafter_gatherer_jobs(crafter_or_gatherer)
+  if not job_list:
+    return {}
+  generic_gear = []
+  for job in generic_jobs:
+    gear, _ = best_server_gearset_items(ilvl, job, server, hq, verbose=False)
+    generic_gear += gear
+  batch_start = time.time()
+  mainhands = [generic_gear.pop(0)[1]]
+  offhands =  [generic_gear.pop(0)[1]]
+  main_worker = partial(__best_equip_for_slot_helper, ilvl=ilvl, slot="MainHand")
+  mainhands += xivs.map(main_worker, job_list[1:])
+  off_worker = partial(__best_equip_for_slot_helper, ilvl=ilvl, slot="OffHand")
+  offhands += xivs.map(off_worker, job_list[1:])
+  allhands_names = xivt.weave_lists(mainhands, offhands)
+  allhands_prices, allhands_servers = lowest_price(allhands_names, server, hq)
+  return _crafter_gatherer_table(ilvl, server, crafter_or_gatherer, job_list, mainhands, offhands, generic_gear, allhands_prices, allhands_servers, sort_by_server, batch_start, verbose)
+
+def _bri_ilvl_search_url(min_ilvl):
   filters = [f"LevelItem>={min_ilvl}", "IsUntradable=0", "EquipSlotCategory!"]
-  url = xivapi_endpoint_url("/search", filters=",".join(filters), sort_field="LevelItem", sort_order="desc", limit=500)
-  data = data_from_url(url)
+  return xivapi_endpoint_url("/search", filters=",".join(filters), sort_field="LevelItem", sort_order="desc", limit=500)
+
+def _bri_ilvl_search(min_ilvl):
+  data = data_from_url(_bri_ilvl_search_url(min_ilvl))
   results = data["Results"]
   return xivt.dict_slicer(results, ["Name", "ID"])
 
@@ -477,29 +629,38 @@ def _bri_materia_search():
   for materia in m:
     for tier in tiers_of_interest:
       names.append(materia.format(tier))
-  item_ids = [xivt.item_id_from_name(name) for name in names]
+  item_ids = xivt.item_ids_from_names(names)
   return [names, item_ids]
 
 def _bri_differences(home, foreign):
   return [round(h*(1-TAX_RATE)-f) for h,f in zip(home, foreign)]
 
-def _bri_helper(names, item_ids, home_world, dc_or_region, n_results="all"):
-  home_price, _ = lowest_price(names, home_world)
-  foreign_price, best_server = lowest_price(names, dc_or_region)
+def _bri_collection(names, home_price, foreign_price, best_server, n_results):
   delta = _bri_differences(home_price, foreign_price)
   collection = [list(_) for _ in zip(names, home_price, foreign_price, delta, best_server)]
   collection = list(filter(lambda x: x[3]>0, collection))
-  collection.sort(key=lambda x: -x[3])
+  return _bri_top(collection, n_results)
+
+def _bri_top(collection, n_results):
+  collection = sorted(collection, key=lambda x: -x[3])
   if isinstance(n_results, int):
     collection = collection[:n_results]
   return collection
 
+def __bri_lowest_price_helper(names, item_ids, server): # Re-ordering args for pool
+  return lowest_price(names, server, item_ids=item_ids)
+
+def _bri_helper(names, item_ids, home_world, dc_or_region, n_results="all"):
+  worker = partial(__bri_lowest_price_helper, names, item_ids)
+  (home_price, _), (foreign_price, best_server) = xivs.map(worker, [home_world, dc_or_region])
+  return _bri_collection(names, home_price, foreign_price, best_server, n_results)
+
 def _bri_finisher(collection, dt, home_world, verbose=True):
   num_items = len(collection)
   headers = [f"Home World: {home_world}", "Home Price", "Foreign Price", "Profit (Inc. Tax)", "Lowest Server"]
   time_row = ["", "", "", f"Time: {dt:.2f}s", f"s/item: {0 if not num_items else dt/num_items:.2f}"]
   table = xivt.format_column(collection, [1, 2, 3], ["{:,}", "{:,}", "{:,}"]) + [time_row]
-  table_str = tt.to_string(table, header=headers, style=tt.styles.rounded_double, alignment="lrrrl")
+  table_str = _table_string(table, headers, "lrrrl")
   if verbose:
     print(table_str)
   return collection, table_str
@@ -520,9 +681,13 @@ def _bri_materia(home_world, dc_or_region, n_results="all", verbose=True):
   return _bri_finisher(collection_materia, dt, home_world, verbose)
 
 def best_reselling_items(home_world, dc_or_region, min_ilvl=560, n_results="all", verbose=True):
-  _bri_ilvl(home_world, dc_or_region, min_ilvl, n_results, verbose)
-  _bri_materia(home_world, dc_or_region, n_results, verbose)
-  return
+  ilvl_task = xivs.SCHEDULER.submit(_bri_ilvl, home_world, dc_or_region, min_ilvl, n_results, False)
+  materia_task = xivs.SCHEDULER.submit(_bri_materia, home_world, dc_or_region, n_results, False)
+  results = [xivs.SCHEDULER.wait(ilvl_task), xivs.SCHEDULER.wait(materia_task)]
+  if verbose:
+    for _, table_str in results:
+      print(table_str)
+  return results
 
 if __name__ == "__main__":
   pass